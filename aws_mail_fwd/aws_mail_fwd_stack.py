@@ -1,5 +1,6 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import json
 from constructs import Construct
 from aws_cdk import (
     Stack,
@@ -19,12 +20,38 @@ from aws_cdk import (
     aws_ses as ses,
     aws_ses_actions as ses_actions,
     aws_logs,
+    aws_sqs as sqs,
+    aws_events as events,
+    aws_events_targets as events_targets,
 )
 from cdk_nag import NagSuppressions
 
 ACCOUNT_TABLE_GSI_NAME = "AccountName-Enum-Index"
+ACCOUNT_TABLE_KEYS_GSI_NAME = "AccountName-Enum-KeysIndex"
 SES = "ses.amazonaws.com"
 LAMBDA = "lambda.amazonaws.com"
+VERDICT_ACTION_SETTINGS = [
+    "SPAM_VERDICT_ACTION",
+    "VIRUS_VERDICT_ACTION",
+    "SPF_VERDICT_ACTION",
+    "DKIM_VERDICT_ACTION",
+    "DMARC_VERDICT_ACTION",
+]
+QUARANTINE_PREFIX = "quarantine/"
+OWNER_SNAPSHOT_KEY = "snapshot/owners.json.gz"
+PROFILE_PREFIX = "profiles/"
+SNAPSTART_ALIAS = "live"
+LOG_SETTINGS = [
+    "LOG_LEVEL",
+    "LOG_FORMAT",
+    "LOG_SAMPLE_RATES",
+    "LOG_BUDGET",
+]
+RATE_LIMIT_SETTINGS = [
+    "RATE_LIMIT_PER_SENDER",
+    "RATE_LIMIT_PER_ALIAS",
+    "RATE_LIMIT_WINDOW_SECONDS",
+]
 
 
 class AwsMailFwdStack(Stack):
@@ -84,6 +111,12 @@ class AwsMailFwdStack(Stack):
         mail_bucket.grant_read_write(iam.ServicePrincipal(SES))
 
         # create dynamo table
+        # The stream is only needed by the optional functions that follow account changes
+        owner_snapshot = self.node.try_get_context("OWNER_SNAPSHOT")
+        owner_cache_ttl = self.node.try_get_context("OWNER_CACHE_TTL_SECONDS")
+        # Stored vend responses and suppressions expire through the table's TTL
+        idempotency = self.node.try_get_context("IDEMPOTENCY")
+        suppress_bounces = self.node.try_get_context("SUPPRESS_BOUNCES")
         account_table = dynamodb.Table(
             self,
             "AccountTable",
@@ -97,21 +130,103 @@ class AwsMailFwdStack(Stack):
             point_in_time_recovery_specification=dynamodb.PointInTimeRecoverySpecification(
                 point_in_time_recovery_enabled=True,
                 recovery_period_in_days=35
-            )
+            ),
+            stream=dynamodb.StreamViewType.KEYS_ONLY if owner_snapshot or owner_cache_ttl else None,
+            time_to_live_attribute="ExpiresAt" if idempotency or suppress_bounces else None,
         )
         if self.node.try_get_context("REMOVE_TABLE_ON_DESTROY"):
             account_table.apply_removal_policy(RemovalPolicy.DESTROY)
 
-        # Add a global secondary index
-        account_table.add_global_secondary_index(
-            partition_key=dynamodb.Attribute(
-                name="AccountName", type=dynamodb.AttributeType.STRING
-            ),
-            sort_key=dynamodb.Attribute(
-                name="Enum", type=dynamodb.AttributeType.STRING
-            ),
-            index_name=ACCOUNT_TABLE_GSI_NAME,
-            projection_type=dynamodb.ProjectionType.ALL,
+        # Add a global secondary index.  Vends only read the counters from it,
+        # so the KEYS_ONLY index saves writing whole items into the index.  A
+        # projection cannot be changed in place and CloudFormation cannot add
+        # and delete an index in one update, so existing tables move to it in
+        # two deployments: MIGRATE adds it, KEYS_ONLY switches to it and
+        # deletes the old one
+        account_index_layout = self.node.try_get_context("ACCOUNT_INDEX_LAYOUT")
+        account_index_names = []
+        if account_index_layout != "KEYS_ONLY":
+            account_table.add_global_secondary_index(
+                partition_key=dynamodb.Attribute(
+                    name="AccountName", type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name="Enum", type=dynamodb.AttributeType.STRING
+                ),
+                index_name=ACCOUNT_TABLE_GSI_NAME,
+                projection_type=dynamodb.ProjectionType.ALL,
+            )
+            account_index_names.append(ACCOUNT_TABLE_GSI_NAME)
+        if account_index_layout in ["MIGRATE", "KEYS_ONLY"]:
+            account_table.add_global_secondary_index(
+                partition_key=dynamodb.Attribute(
+                    name="AccountName", type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name="Enum", type=dynamodb.AttributeType.STRING
+                ),
+                index_name=ACCOUNT_TABLE_KEYS_GSI_NAME,
+                projection_type=dynamodb.ProjectionType.KEYS_ONLY,
+            )
+            account_index_names.append(ACCOUNT_TABLE_KEYS_GSI_NAME)
+
+        # Create a table for short lived forwarder state shared between containers
+        state_table = None
+        deduplicate = self.node.try_get_context("DEDUPLICATE")
+        rate_limit_shared = self.node.try_get_context("RATE_LIMIT_SHARED")
+        if rate_limit_shared or deduplicate:
+            state_table = dynamodb.Table(
+                self,
+                "ForwarderStateTable",
+                partition_key=dynamodb.Attribute(
+                    name="Key", type=dynamodb.AttributeType.STRING
+                ),
+                encryption=dynamodb.TableEncryption.CUSTOMER_MANAGED,
+                encryption_key=ddb_key, # type: ignore
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="ExpiresAt",
+                point_in_time_recovery_specification=dynamodb.PointInTimeRecoverySpecification(
+                    point_in_time_recovery_enabled=True
+                ),
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+
+        # Create a table recording the outcome of every forwarded message
+        delivery_log_table = None
+        if self.node.try_get_context("DELIVERY_LOG"):
+            delivery_log_table = dynamodb.Table(
+                self,
+                "DeliveryLogTable",
+                partition_key=dynamodb.Attribute(
+                    name="MessageId", type=dynamodb.AttributeType.STRING
+                ),
+                encryption=dynamodb.TableEncryption.CUSTOMER_MANAGED,
+                encryption_key=ddb_key, # type: ignore
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="ExpiresAt",
+                point_in_time_recovery_specification=dynamodb.PointInTimeRecoverySpecification(
+                    point_in_time_recovery_enabled=True
+                ),
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            # Look up the messages of an alias or an owner, newest first
+            for index_field in ["Alias", "Owner"]:
+                delivery_log_table.add_global_secondary_index(
+                    index_name=f"{index_field}Index",
+                    partition_key=dynamodb.Attribute(
+                        name=index_field, type=dynamodb.AttributeType.STRING
+                    ),
+                    sort_key=dynamodb.Attribute(
+                        name="Timestamp", type=dynamodb.AttributeType.STRING
+                    ),
+                )
+
+        # SnapStart restores published versions from a snapshot of the initialized
+        # function, so invocations must go through an alias
+        snap_start = (
+            aws_lambda.SnapStartConf.ON_PUBLISHED_VERSIONS
+            if self.node.try_get_context("ENABLE_SNAPSTART")
+            else None
         )
 
         # Create Vend Email Lambda IAM Role
@@ -126,6 +241,16 @@ class AwsMailFwdStack(Stack):
         logs_key.grant_encrypt_decrypt(vend_email_role)
         logs_key.grant_encrypt_decrypt(iam.ServicePrincipal("logs.amazonaws.com"))
 
+        # Create layer with the modules shared by the functions
+        common_layer = aws_lambda.LayerVersion(
+            self,
+            "CommonLayer",
+            code=aws_lambda.Code.from_asset("src/common"),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_13],
+            compatible_architectures=[aws_lambda.Architecture.ARM_64],
+            description="Logging, profiling and SnapStart modules shared by the AwsMailFwd functions",
+        )
+
         # Create lambda function for vending emails
         vend_email_function = aws_lambda.Function(
             self,
@@ -146,12 +271,18 @@ class AwsMailFwdStack(Stack):
             ),
             description="Function to vend AWS account names and email addresses",
             architecture=aws_lambda.Architecture.ARM_64,
+            layers=[common_layer],
             role=vend_email_role, # type: ignore
+            snap_start=snap_start,
         )
         # Manually remove unnecessary "DependsOn" links to remove circular reference issue
         # vend_email_function.node.default_child.node.dependencies.clear()
         cfn_vend_email_fn = vend_email_function.node.default_child
         cfn_vend_email_fn.add_override("DependsOn", None) # type: ignore
+        # Callers invoke the published version through the alias to benefit from SnapStart
+        vend_email_function_target = (
+            vend_email_function.add_alias(SNAPSTART_ALIAS) if snap_start else vend_email_function
+        )
 
         # Create Vend Email Lambda Log Groups
         vend_email_log_group = aws_logs.LogGroup(
@@ -172,6 +303,20 @@ class AwsMailFwdStack(Stack):
             description="AwsMailFwd SES Mail Forwarding Lambda Function role",
         )
 
+        # Optionally keep the events of invocations that failed all their retries
+        # so the messages can be replayed with tools/replay.py
+        fwd_dead_letter_queue = None
+        if self.node.try_get_context("FORWARDER_DLQ"):
+            fwd_dead_letter_queue = sqs.Queue(
+                self,
+                "ForwarderDeadLetterQueue",
+                encryption=sqs.QueueEncryption.KMS,
+                encryption_master_key=mail_key, # type: ignore
+                enforce_ssl=True,
+                retention_period=Duration.days(14),
+            )
+            fwd_dead_letter_queue.grant_send_messages(ses_fwd_function_role)
+
         # Create lambda function for forwarding emails
         ses_fwd_function = aws_lambda.Function(
             self,
@@ -192,7 +337,12 @@ class AwsMailFwdStack(Stack):
             ),
             description="Function to forward email to the proper AWS account owner",
             architecture=aws_lambda.Architecture.ARM_64,
+            layers=[common_layer],
+            # The forwarder fits its work in this budget, see deadline.py
+            timeout=Duration.seconds(30),
             role=ses_fwd_function_role, # type: ignore
+            snap_start=snap_start,
+            dead_letter_queue=fwd_dead_letter_queue, # type: ignore
         )
         # Manually remove unnecessary "DependsOn" links to remove circular reference issue
         cfn_fwd_email_fn = ses_fwd_function.node.default_child
@@ -213,7 +363,10 @@ class AwsMailFwdStack(Stack):
         sns_topic = sns.Topic(
             self, "SNSEmailReceivedTopic", topic_name="EmailReceivedTopic", master_key=sns_key # type: ignore
         )
-        ses_fwd_function.add_event_source(
+        ses_fwd_function_target = (
+            ses_fwd_function.add_alias(SNAPSTART_ALIAS) if snap_start else ses_fwd_function
+        )
+        ses_fwd_function_target.add_event_source(
             lambda_events.SnsEventSource(sns_topic) # type: ignore
         )
         sns_topic.grant_publish(iam.ServicePrincipal(SES))
@@ -255,6 +408,82 @@ class AwsMailFwdStack(Stack):
         disable_catch_all = self.node.try_get_context("DISABLE_CATCH_ALL")
         if disable_catch_all:
             ses_fwd_function.add_environment("DISABLE_CATCH_ALL", str(disable_catch_all))
+        # Log sampling and budget of both functions
+        for log_setting in LOG_SETTINGS:
+            log_value = self.node.try_get_context(log_setting)
+            if log_value:
+                ses_fwd_function.add_environment(log_setting, str(log_value))
+                vend_email_function.add_environment(log_setting, str(log_value))
+        # Forward the records of an invocation one by one or concurrently,
+        # download messages while their owner is looked up and keep time free
+        # at the end of the invocation
+        for forwarder_setting in [
+            "FORWARDER_MODE", "ASYNC_MAX_CONCURRENCY", "PREFETCH_MESSAGE", "DEADLINE_SAFETY_MARGIN_MS"
+        ]:
+            forwarder_value = self.node.try_get_context(forwarder_setting)
+            if forwarder_value:
+                ses_fwd_function.add_environment(forwarder_setting, str(forwarder_value))
+        # Pattern based routing rules evaluated before the account table lookup
+        routing_rules = self.node.try_get_context("ROUTING_RULES")
+        if routing_rules:
+            ses_fwd_function.add_environment(
+                "ROUTING_RULES",
+                routing_rules if isinstance(routing_rules, str) else json.dumps(routing_rules),
+            )
+        if self.node.try_get_context("ROUTING_RULES_IN_TABLE"):
+            ses_fwd_function.add_environment("ROUTING_RULES_IN_TABLE", "true")
+        subaddress_delimiter = self.node.try_get_context("SUBADDRESS_DELIMITER")
+        if subaddress_delimiter:
+            ses_fwd_function.add_environment("SUBADDRESS_DELIMITER", subaddress_delimiter)
+        # Rate limits for catch-all messages
+        for rate_limit_setting in RATE_LIMIT_SETTINGS:
+            rate_limit = self.node.try_get_context(rate_limit_setting)
+            if rate_limit:
+                ses_fwd_function.add_environment(rate_limit_setting, str(rate_limit))
+        if state_table:
+            ses_fwd_function.add_environment("STATE_TABLE_NAME", state_table.table_name)
+            state_table.grant_read_write_data(ses_fwd_function_role)
+        if rate_limit_shared:
+            ses_fwd_function.add_environment("RATE_LIMIT_SHARED", "true")
+        # Optionally collapse identical messages sent to many aliases of one
+        # owner.  The forwarder queues each group and forwards it once its
+        # window ended
+        dedup_queue = None
+        if deduplicate:
+            dedup_queue = sqs.Queue(
+                self,
+                "DeduplicationQueue",
+                encryption=sqs.QueueEncryption.KMS,
+                encryption_master_key=mail_key, # type: ignore
+                enforce_ssl=True,
+                retention_period=Duration.days(4),
+                # Six times the forwarder timeout, as Lambda recommends
+                visibility_timeout=Duration.minutes(3),
+            )
+            dedup_queue.grant_send_messages(ses_fwd_function_role)
+            ses_fwd_function.add_environment("DEDUP_QUEUE_URL", dedup_queue.queue_url)
+            dedup_window = self.node.try_get_context("DEDUPLICATE_WINDOW_SECONDS")
+            if dedup_window:
+                ses_fwd_function.add_environment("DEDUP_WINDOW_SECONDS", str(dedup_window))
+            # Flushes go through the SnapStart alias like received mail
+            ses_fwd_function_target.add_event_source(
+                lambda_events.SqsEventSource(
+                    dedup_queue, # type: ignore
+                    batch_size=10,
+                    report_batch_item_failures=True,
+                )
+            )
+        if delivery_log_table:
+            ses_fwd_function.add_environment("DELIVERY_LOG_TABLE_NAME", delivery_log_table.table_name)
+            delivery_log_retention = self.node.try_get_context("DELIVERY_LOG_RETENTION_DAYS")
+            if delivery_log_retention:
+                ses_fwd_function.add_environment("DELIVERY_LOG_RETENTION_DAYS", str(delivery_log_retention))
+            delivery_log_table.grant_write_data(ses_fwd_function_role)
+        # Actions taken on messages failing the SES receipt verdicts
+        for verdict_setting in VERDICT_ACTION_SETTINGS:
+            verdict_action = self.node.try_get_context(verdict_setting)
+            if verdict_action:
+                ses_fwd_function.add_environment(verdict_setting, verdict_action)
         
         vend_email_function.add_environment(
             "SES_DOMAIN_NAME", self.node.try_get_context("SES_DOMAIN_NAME")
@@ -268,6 +497,35 @@ class AwsMailFwdStack(Stack):
         vend_email_function.add_environment(
             "COUNTER_LENGTH", self.node.try_get_context("COUNTER_LENGTH")
         )
+        if account_index_layout == "KEYS_ONLY":
+            vend_email_function.add_environment("ACCOUNT_INDEX_NAME", ACCOUNT_TABLE_KEYS_GSI_NAME)
+        # Answer repeated vend requests with their original response
+        if idempotency:
+            vend_email_function.add_environment(
+                "IDEMPOTENCY_KEY_SOURCE",
+                idempotency if idempotency in ["CLIENT", "REQUEST"] else "CLIENT",
+            )
+            idempotency_ttl = self.node.try_get_context("IDEMPOTENCY_TTL_SECONDS")
+            if idempotency_ttl:
+                vend_email_function.add_environment("IDEMPOTENCY_TTL_SECONDS", str(idempotency_ttl))
+
+        # Optionally profile a sample of the invocations of both functions and
+        # keep the profiles in the mail bucket
+        profile_sample_rate = self.node.try_get_context("PROFILE_SAMPLE_RATE")
+        profile_event_flag = self.node.try_get_context("PROFILE_EVENT_FLAG")
+        if profile_sample_rate or profile_event_flag:
+            for profiled_function, profiled_role in [
+                (vend_email_function, vend_email_role),
+                (ses_fwd_function, ses_fwd_function_role),
+            ]:
+                if profile_sample_rate:
+                    profiled_function.add_environment("PROFILE_SAMPLE_RATE", str(profile_sample_rate))
+                if profile_event_flag:
+                    profiled_function.add_environment("PROFILE_EVENT_FLAG", "true")
+                profiled_function.add_environment(
+                    "PROFILE_OUTPUT", f"s3://{mail_bucket.bucket_name}/{PROFILE_PREFIX}"
+                )
+                mail_bucket.grant_put(profiled_role, PROFILE_PREFIX + "*")
 
         # Grant permission to Lambda to write to account table and bucket
         ses_fwd_function_role.add_to_policy(
@@ -283,9 +541,9 @@ class AwsMailFwdStack(Stack):
                     "dynamodb:DescribeTable"
                 ],
                 effect=iam.Effect.ALLOW,
-                resources=[
-                    account_table.table_arn,
-                    account_table.table_arn + "/index/" + ACCOUNT_TABLE_GSI_NAME   
+                resources=[account_table.table_arn] + [
+                    account_table.table_arn + "/index/" + index_name
+                    for index_name in account_index_names
                 ]
             )
         )
@@ -306,13 +564,14 @@ class AwsMailFwdStack(Stack):
                     "dynamodb:DescribeTable"
                 ],
                 effect=iam.Effect.ALLOW,
-                resources=[
-                    account_table.table_arn,
-                    account_table.table_arn + "/index/" + ACCOUNT_TABLE_GSI_NAME   
+                resources=[account_table.table_arn] + [
+                    account_table.table_arn + "/index/" + index_name
+                    for index_name in account_index_names
                 ]
             )
         )
         mail_bucket.grant_read(ses_fwd_function_role)
+        mail_bucket.grant_put(ses_fwd_function_role, QUARANTINE_PREFIX + "*")
         mail_key.grant_decrypt(ses_fwd_function_role)
         sns_key.grant_encrypt_decrypt(ses_fwd_function_role)
         ddb_key.grant_decrypt(ses_fwd_function_role)
@@ -342,6 +601,478 @@ class AwsMailFwdStack(Stack):
             )
         )
 
+        # Optionally keep a pool of reserved account names for busy prefixes so
+        # vends claim a name with a single update
+        name_pool_prefixes = self.node.try_get_context("NAME_POOL_PREFIXES")
+        name_pool_function = None
+        if name_pool_prefixes:
+            if isinstance(name_pool_prefixes, str):
+                name_pool_prefixes = name_pool_prefixes.split(",")
+            name_pool_function = aws_lambda.Function(
+                self,
+                "NamePoolFunction",
+                runtime=aws_lambda.Runtime.PYTHON_3_13,
+                runtime_management_mode=aws_lambda.RuntimeManagementMode.AUTO,
+                handler="pool.lambda_handler",
+                code=aws_lambda.Code.from_asset(
+                    "src/vendEmail",
+                    bundling=BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_13.bundling_image,
+                        command=[
+                            "bash",
+                            "-c",
+                            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+                        ],
+                    ),
+                ),
+                description="Function to top up the pools of reserved account names",
+                architecture=aws_lambda.Architecture.ARM_64,
+                layers=[common_layer],
+                role=vend_email_role, # type: ignore
+                timeout=Duration.minutes(1),
+                # Top ups of the same pool must not overlap
+                reserved_concurrent_executions=1,
+            )
+            cfn_name_pool_fn = name_pool_function.node.default_child
+            cfn_name_pool_fn.add_override("DependsOn", None) # type: ignore
+
+            # Create Name Pool Lambda Log Group
+            name_pool_log_group = aws_logs.LogGroup(
+                self,
+                "NamePoolLogGroup",
+                log_group_name=f"/aws/lambda/{name_pool_function.function_name}",
+                removal_policy=RemovalPolicy.DESTROY,
+                retention=aws_logs.RetentionDays.ONE_MONTH,
+                encryption_key=logs_key, # type: ignore
+            )
+            name_pool_log_group.grant_write(vend_email_role)
+
+            name_pool_settings = {
+                "NAME_POOL_PREFIXES": ",".join(name_pool_prefixes),
+                "NAME_POOL_SIZE": self.node.try_get_context("NAME_POOL_SIZE"),
+                "NAME_POOL_TTL_SECONDS": self.node.try_get_context("NAME_POOL_TTL_SECONDS"),
+                "SES_DOMAIN_NAME": self.node.try_get_context("SES_DOMAIN_NAME"),
+                "TABLE_NAME": account_table.table_name,
+                "COUNTER_LENGTH": self.node.try_get_context("COUNTER_LENGTH"),
+                "ACCOUNT_INDEX_NAME": ACCOUNT_TABLE_KEYS_GSI_NAME if account_index_layout == "KEYS_ONLY" else None,
+            }
+            for name, value in name_pool_settings.items():
+                if value:
+                    name_pool_function.add_environment(name, str(value))
+                    if name.startswith("NAME_POOL_"):
+                        vend_email_function.add_environment(name, str(value))
+            vend_email_function.add_environment("NAME_POOL_FUNCTION_NAME", name_pool_function.function_name)
+            name_pool_function.grant_invoke(vend_email_role)
+
+            # Top up every pool regularly and release names reserved for too long
+            events.Rule(
+                self,
+                "NamePoolSchedule",
+                schedule=events.Schedule.rate(Duration.minutes(15)),
+                targets=[events_targets.LambdaFunction(name_pool_function)], # type: ignore
+            )
+
+        # Optionally verify owner addresses in batches off the vend path and
+        # record their status on the account items
+        verification_queue = None
+        if self.node.try_get_context("VERIFY_OWNERS_ASYNC"):
+            verification_queue = sqs.Queue(
+                self,
+                "OwnerVerificationQueue",
+                encryption=sqs.QueueEncryption.KMS,
+                encryption_master_key=mail_key, # type: ignore
+                enforce_ssl=True,
+                retention_period=Duration.days(4),
+                visibility_timeout=Duration.minutes(6),
+            )
+            verification_function = aws_lambda.Function(
+                self,
+                "OwnerVerificationFunction",
+                runtime=aws_lambda.Runtime.PYTHON_3_13,
+                runtime_management_mode=aws_lambda.RuntimeManagementMode.AUTO,
+                handler="verification.lambda_handler",
+                code=aws_lambda.Code.from_asset(
+                    "src/vendEmail",
+                    bundling=BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_13.bundling_image,
+                        command=[
+                            "bash",
+                            "-c",
+                            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+                        ],
+                    ),
+                ),
+                description="Function to verify the owner addresses of vended accounts in batches",
+                architecture=aws_lambda.Architecture.ARM_64,
+                layers=[common_layer],
+                role=vend_email_role, # type: ignore
+                timeout=Duration.minutes(1),
+            )
+            cfn_verification_fn = verification_function.node.default_child
+            cfn_verification_fn.add_override("DependsOn", None) # type: ignore
+
+            # Create Owner Verification Lambda Log Group
+            verification_log_group = aws_logs.LogGroup(
+                self,
+                "OwnerVerificationLogGroup",
+                log_group_name=f"/aws/lambda/{verification_function.function_name}",
+                removal_policy=RemovalPolicy.DESTROY,
+                retention=aws_logs.RetentionDays.ONE_MONTH,
+                encryption_key=logs_key, # type: ignore
+            )
+            verification_log_group.grant_write(vend_email_role)
+
+            verification_function.add_environment("TABLE_NAME", account_table.table_name)
+            vend_email_function.add_environment("VERIFICATION_QUEUE_URL", verification_queue.queue_url)
+            verification_queue.grant_send_messages(vend_email_role)
+            # SES reads the status of up to 100 identities in one call
+            verification_function.add_event_source(
+                lambda_events.SqsEventSource(
+                    verification_queue, # type: ignore
+                    batch_size=100,
+                    max_batching_window=Duration.seconds(30),
+                    report_batch_item_failures=True,
+                )
+            )
+
+        # Optionally publish a snapshot of all owner addresses to S3 so the
+        # forwarder can resolve owners from memory
+        owner_snapshot_role = None
+        if owner_snapshot:
+            owner_snapshot_role = iam.Role(
+                self,
+                "OwnerSnapshotFunctionRole",
+                assumed_by=iam.ServicePrincipal(LAMBDA), # type: ignore
+                description="AwsMailFwd Owner Snapshot Lambda Function role",
+            )
+
+            # Create lambda function for publishing the owner snapshot
+            owner_snapshot_function = aws_lambda.Function(
+                self,
+                "OwnerSnapshotFunction",
+                runtime=aws_lambda.Runtime.PYTHON_3_13,
+                runtime_management_mode=aws_lambda.RuntimeManagementMode.AUTO,
+                handler="app.lambda_handler",
+                code=aws_lambda.Code.from_asset(
+                    "src/ownerSnapshot",
+                    bundling=BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_13.bundling_image,
+                        command=[
+                            "bash",
+                            "-c",
+                            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+                        ],
+                    ),
+                ),
+                description="Function to publish a snapshot of the account owners to S3",
+                architecture=aws_lambda.Architecture.ARM_64,
+                role=owner_snapshot_role, # type: ignore
+                timeout=Duration.minutes(1),
+            )
+            cfn_owner_snapshot_fn = owner_snapshot_function.node.default_child
+            cfn_owner_snapshot_fn.add_override("DependsOn", None) # type: ignore
+
+            # Create Owner Snapshot Lambda Log Group
+            owner_snapshot_log_group = aws_logs.LogGroup(
+                self,
+                "OwnerSnapshotLogGroup",
+                log_group_name=f"/aws/lambda/{owner_snapshot_function.function_name}",
+                removal_policy=RemovalPolicy.DESTROY,
+                retention=aws_logs.RetentionDays.ONE_MONTH,
+                encryption_key=logs_key, # type: ignore
+            )
+            owner_snapshot_log_group.grant_write(owner_snapshot_role)
+
+            owner_snapshot_function.add_environment("TABLE_NAME", account_table.table_name)
+            owner_snapshot_function.add_environment("OWNER_SNAPSHOT_BUCKET", mail_bucket.bucket_name)
+            owner_snapshot_function.add_environment("OWNER_SNAPSHOT_KEY", OWNER_SNAPSHOT_KEY)
+            ses_fwd_function.add_environment("OWNER_SNAPSHOT_BUCKET", mail_bucket.bucket_name)
+            ses_fwd_function.add_environment("OWNER_SNAPSHOT_KEY", OWNER_SNAPSHOT_KEY)
+            account_table.grant(owner_snapshot_role, "dynamodb:Scan")
+            ddb_key.grant_decrypt(owner_snapshot_role)
+            mail_bucket.grant_put(owner_snapshot_role, OWNER_SNAPSHOT_KEY)
+            logs_key.grant_encrypt_decrypt(owner_snapshot_role)
+
+            # Publish after every change to the table, changes made within a few
+            # seconds of each other are published together
+            owner_snapshot_function.add_event_source(
+                lambda_events.DynamoEventSource(
+                    account_table, # type: ignore
+                    starting_position=aws_lambda.StartingPosition.LATEST,
+                    batch_size=1000,
+                    max_batching_window=Duration.seconds(10),
+                    retry_attempts=3,
+                )
+            )
+            # Republish daily so the snapshot does not expire with the bucket's lifecycle rule
+            events.Rule(
+                self,
+                "OwnerSnapshotSchedule",
+                schedule=events.Schedule.rate(Duration.days(1)),
+                targets=[events_targets.LambdaFunction(owner_snapshot_function)], # type: ignore
+            )
+
+        # Optionally cache owners in the forwarder for a long time and publish a
+        # mapping version so the forwarder only drops the owners that changed
+        mapping_version_role = None
+        if owner_cache_ttl:
+            mapping_version_role = iam.Role(
+                self,
+                "MappingVersionFunctionRole",
+                assumed_by=iam.ServicePrincipal(LAMBDA), # type: ignore
+                description="AwsMailFwd Mapping Version Lambda Function role",
+            )
+
+            # Create lambda function for publishing the mapping version
+            mapping_version_function = aws_lambda.Function(
+                self,
+                "MappingVersionFunction",
+                runtime=aws_lambda.Runtime.PYTHON_3_13,
+                runtime_management_mode=aws_lambda.RuntimeManagementMode.AUTO,
+                handler="app.lambda_handler",
+                code=aws_lambda.Code.from_asset(
+                    "src/mappingVersion",
+                    bundling=BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_13.bundling_image,
+                        command=[
+                            "bash",
+                            "-c",
+                            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+                        ],
+                    ),
+                ),
+                description="Function to publish the version of the account to owner mappings",
+                architecture=aws_lambda.Architecture.ARM_64,
+                role=mapping_version_role, # type: ignore
+                timeout=Duration.seconds(30),
+            )
+            cfn_mapping_version_fn = mapping_version_function.node.default_child
+            cfn_mapping_version_fn.add_override("DependsOn", None) # type: ignore
+
+            # Create Mapping Version Lambda Log Group
+            mapping_version_log_group = aws_logs.LogGroup(
+                self,
+                "MappingVersionLogGroup",
+                log_group_name=f"/aws/lambda/{mapping_version_function.function_name}",
+                removal_policy=RemovalPolicy.DESTROY,
+                retention=aws_logs.RetentionDays.ONE_MONTH,
+                encryption_key=logs_key, # type: ignore
+            )
+            mapping_version_log_group.grant_write(mapping_version_role)
+
+            mapping_version_function.add_environment("TABLE_NAME", account_table.table_name)
+            ses_fwd_function.add_environment("OWNER_CACHE_TTL_SECONDS", str(owner_cache_ttl))
+            mapping_version_check = self.node.try_get_context("MAPPING_VERSION_CHECK_SECONDS")
+            if mapping_version_check:
+                ses_fwd_function.add_environment("MAPPING_VERSION_CHECK_SECONDS", str(mapping_version_check))
+            account_table.grant(mapping_version_role, "dynamodb:GetItem", "dynamodb:PutItem")
+            ddb_key.grant_encrypt_decrypt(mapping_version_role)
+            logs_key.grant_encrypt_decrypt(mapping_version_role)
+
+            # A single publisher per shard keeps the version writes mostly
+            # uncontended, the conditional write handles the rest
+            mapping_version_function.add_event_source(
+                lambda_events.DynamoEventSource(
+                    account_table, # type: ignore
+                    starting_position=aws_lambda.StartingPosition.LATEST,
+                    batch_size=1000,
+                    max_batching_window=Duration.seconds(1),
+                    retry_attempts=3,
+                )
+            )
+
+        # Optionally suppress forward targets that bounced or complained, so the
+        # forwarder reroutes or drops their messages instead of failing sends
+        ses_feedback_role = None
+        if suppress_bounces:
+            feedback_topic = sns.Topic(
+                self, "SNSSesFeedbackTopic", topic_name="SesFeedbackTopic", master_key=sns_key # type: ignore
+            )
+            feedback_topic.grant_publish(iam.ServicePrincipal(SES))
+            feedback_topic.add_to_resource_policy(
+                iam.PolicyStatement(
+                    actions=["SNS:Publish"],
+                    effect=iam.Effect.DENY,
+                    resources=[feedback_topic.topic_arn],
+                    conditions={"Bool": {"aws:SecureTransport": "false"}},
+                    principals=[iam.ArnPrincipal("*")], # type: ignore
+                )
+            )
+            configuration_set = ses.ConfigurationSet(self, "ForwarderConfigurationSet")
+            configuration_set.add_event_destination(
+                "FeedbackDestination",
+                destination=ses.EventDestination.sns_topic(feedback_topic), # type: ignore
+                events=[ses.EmailSendingEvent.BOUNCE, ses.EmailSendingEvent.COMPLAINT],
+            )
+            ses_fwd_function.add_environment("SES_CONFIGURATION_SET", configuration_set.configuration_set_name)
+            ses_fwd_function.add_environment(
+                "SUPPRESSED_RECIPIENT_ACTION",
+                suppress_bounces if suppress_bounces in ["REROUTE", "DROP"] else "REROUTE",
+            )
+            ses_fwd_function_role.add_to_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=[
+                        Fn.sub(
+                            "arn:${AWS::Partition}:ses:${AWS::Region}:${AWS::AccountId}:configuration-set/${Name}",
+                            {"Name": configuration_set.configuration_set_name},
+                        )
+                    ],
+                    actions=["ses:SendRawEmail"],
+                )
+            )
+
+            ses_feedback_role = iam.Role(
+                self,
+                "SesFeedbackFunctionRole",
+                assumed_by=iam.ServicePrincipal(LAMBDA), # type: ignore
+                description="AwsMailFwd SES Feedback Lambda Function role",
+            )
+
+            # Create lambda function for recording bounces and complaints
+            ses_feedback_function = aws_lambda.Function(
+                self,
+                "SesFeedbackFunction",
+                runtime=aws_lambda.Runtime.PYTHON_3_13,
+                runtime_management_mode=aws_lambda.RuntimeManagementMode.AUTO,
+                handler="app.lambda_handler",
+                code=aws_lambda.Code.from_asset(
+                    "src/sesFeedback",
+                    bundling=BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_13.bundling_image,
+                        command=[
+                            "bash",
+                            "-c",
+                            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+                        ],
+                    ),
+                ),
+                description="Function to suppress forward targets after bounces and complaints",
+                architecture=aws_lambda.Architecture.ARM_64,
+                role=ses_feedback_role, # type: ignore
+                timeout=Duration.seconds(30),
+            )
+            cfn_ses_feedback_fn = ses_feedback_function.node.default_child
+            cfn_ses_feedback_fn.add_override("DependsOn", None) # type: ignore
+
+            # Create SES Feedback Lambda Log Group
+            ses_feedback_log_group = aws_logs.LogGroup(
+                self,
+                "SesFeedbackLogGroup",
+                log_group_name=f"/aws/lambda/{ses_feedback_function.function_name}",
+                removal_policy=RemovalPolicy.DESTROY,
+                retention=aws_logs.RetentionDays.ONE_MONTH,
+                encryption_key=logs_key, # type: ignore
+            )
+            ses_feedback_log_group.grant_write(ses_feedback_role)
+
+            ses_feedback_function.add_environment("TABLE_NAME", account_table.table_name)
+            account_table.grant(ses_feedback_role, "dynamodb:BatchWriteItem")
+            suppression_retention = self.node.try_get_context("SUPPRESSION_RETENTION_DAYS")
+            if suppression_retention:
+                ses_feedback_function.add_environment("SUPPRESSION_RETENTION_DAYS", str(suppression_retention))
+            ddb_key.grant_encrypt_decrypt(ses_feedback_role)
+            sns_key.grant_decrypt(ses_feedback_role)
+            logs_key.grant_encrypt_decrypt(ses_feedback_role)
+            ses_feedback_function.add_event_source(
+                lambda_events.SnsEventSource(feedback_topic) # type: ignore
+            )
+
+        # Optionally summarize catch-all messages in a periodic digest for the admin
+        digest_catch_all = self.node.try_get_context("CATCH_ALL_DIGEST")
+        digest_email_role = None
+        if digest_catch_all:
+            digest_queue = sqs.Queue(
+                self,
+                "CatchAllDigestQueue",
+                encryption=sqs.QueueEncryption.KMS,
+                encryption_master_key=mail_key, # type: ignore
+                enforce_ssl=True,
+                retention_period=Duration.days(4),
+                visibility_timeout=Duration.minutes(10),
+            )
+            digest_queue.grant_send_messages(ses_fwd_function_role)
+            ses_fwd_function.add_environment("DIGEST_QUEUE_URL", digest_queue.queue_url)
+            ses_fwd_function.add_environment(
+                "DIGEST_CATCH_ALL",
+                digest_catch_all if digest_catch_all in ["ALL", "OVER_LIMIT"] else "ALL",
+            )
+
+            # Create Digest Email Lambda IAM Role
+            digest_email_role = iam.Role(
+                self,
+                "DigestEmailFunctionRole",
+                assumed_by=iam.ServicePrincipal(LAMBDA), # type: ignore
+                description="AwsMailFwd Catch-All Digest Lambda Function role",
+            )
+
+            # Create lambda function for sending the digest
+            digest_email_function = aws_lambda.Function(
+                self,
+                "DigestEmailFunction",
+                runtime=aws_lambda.Runtime.PYTHON_3_13,
+                runtime_management_mode=aws_lambda.RuntimeManagementMode.AUTO,
+                handler="app.lambda_handler",
+                code=aws_lambda.Code.from_asset(
+                    "src/digestEmail",
+                    bundling=BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_13.bundling_image,
+                        command=[
+                            "bash",
+                            "-c",
+                            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+                        ],
+                    ),
+                ),
+                description="Function to send a digest of catch-all email to the admin",
+                architecture=aws_lambda.Architecture.ARM_64,
+                role=digest_email_role, # type: ignore
+                timeout=Duration.minutes(5),
+            )
+            cfn_digest_email_fn = digest_email_function.node.default_child
+            cfn_digest_email_fn.add_override("DependsOn", None) # type: ignore
+
+            # Create Digest Email Lambda Log Group
+            digest_email_log_group = aws_logs.LogGroup(
+                self,
+                "DigestEmailLogGroup",
+                log_group_name=f"/aws/lambda/{digest_email_function.function_name}",
+                removal_policy=RemovalPolicy.DESTROY,
+                retention=aws_logs.RetentionDays.ONE_MONTH,
+                encryption_key=logs_key, # type: ignore
+            )
+            digest_email_log_group.grant_write(digest_email_role)
+
+            digest_email_function.add_environment("DIGEST_QUEUE_URL", digest_queue.queue_url)
+            digest_email_function.add_environment(
+                "ADDRESS_FROM", self.node.try_get_context("ADDRESS_FROM")
+            )
+            digest_email_function.add_environment(
+                "ADDRESS_ADMIN", self.node.try_get_context("ADDRESS_ADMIN")
+            )
+            digest_queue.grant_consume_messages(digest_email_role)
+            mail_bucket.grant_read(digest_email_role)
+            logs_key.grant_encrypt_decrypt(digest_email_role)
+            digest_email_role.add_to_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=[
+                        Fn.sub("arn:${AWS::Partition}:ses:${AWS::Region}:${AWS::AccountId}:identity/*")
+                    ],
+                    actions=["ses:SendEmail"],
+                )
+            )
+
+            # Send the digest on a schedule
+            events.Rule(
+                self,
+                "DigestEmailSchedule",
+                schedule=events.Schedule.rate(
+                    Duration.minutes(int(self.node.try_get_context("DIGEST_INTERVAL_MINUTES") or 60))
+                ),
+                targets=[events_targets.LambdaFunction(digest_email_function)], # type: ignore
+            )
+
         # Set up SES RuleSet
         rule_set = ses.ReceiptRuleSet(
             self,
@@ -416,6 +1147,33 @@ class AwsMailFwdStack(Stack):
             value=account_table.table_name,
             description="DynamoDB table where account information will be stored",
         )
+        CfnOutput(
+            self,
+            "ForwarderFunctionArn",
+            value=ses_fwd_function_target.function_arn,
+            description="Function or SnapStart alias invoked for received mail, see tools/replay.py",
+        )
+        if fwd_dead_letter_queue:
+            CfnOutput(
+                self,
+                "ForwarderDeadLetterQueueUrl",
+                value=fwd_dead_letter_queue.queue_url,
+                description="Queue holding the events of failed forwarder invocations, see tools/replay.py",
+            )
+        if delivery_log_table:
+            CfnOutput(
+                self,
+                "DeliveryLogTableName",
+                value=delivery_log_table.table_name,
+                description="DynamoDB table recording the outcome of every message, see tools/query_delivery_log.py",
+            )
+        if snap_start:
+            CfnOutput(
+                self,
+                "VendEmailFunctionAliasArn",
+                value=vend_email_function_target.function_arn,
+                description="Invoke this alias of the vend function to benefit from SnapStart",
+            )
         CfnOutput(
             self,
             "MailBucketArn",
@@ -473,6 +1231,20 @@ class AwsMailFwdStack(Stack):
             ],
             True
         )
+        NagSuppressions.add_resource_suppressions(
+            ses_fwd_function_role,
+            [
+                {
+                    "id": "AwsSolutions-IAM5",
+                    "appliesTo": [
+                        "Action::s3:Abort*",
+                        f"Resource::<{mail_bucket_cfn_res}.Arn>/{QUARANTINE_PREFIX}*",
+                    ],
+                    "reason": "Solution must copy any message that fails the verdict policy to the quarantine prefix"
+                }
+            ],
+            True
+        )
         NagSuppressions.add_resource_suppressions(
             ses_fwd_function_role,
             [
@@ -498,6 +1270,29 @@ class AwsMailFwdStack(Stack):
             ],
             True
         )
+        if fwd_dead_letter_queue:
+            NagSuppressions.add_resource_suppressions(
+                fwd_dead_letter_queue,
+                [
+                    {
+                        "id": "AwsSolutions-SQS3",
+                        "reason": "The queue is the dead-letter queue of the forwarder function"
+                    }
+                ]
+            )
+        if delivery_log_table:
+            delivery_log_table_cfn_res = self.get_logical_id(delivery_log_table.node.default_child) # type: ignore
+            NagSuppressions.add_resource_suppressions(
+                ses_fwd_function_role,
+                [
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "reason": "Permissions generated by the CDK grant for writing the delivery log",
+                        "appliesTo": [f"Resource::<{delivery_log_table_cfn_res}.Arn>/index/*"],
+                    }
+                ],
+                True
+            )
         NagSuppressions.add_resource_suppressions(
             vend_email_role,
             [
@@ -523,6 +1318,156 @@ class AwsMailFwdStack(Stack):
             ],
             True
         )
+        if profile_sample_rate or profile_event_flag:
+            for profiled_role in [vend_email_role, ses_fwd_function_role]:
+                NagSuppressions.add_resource_suppressions(
+                    profiled_role,
+                    [
+                        {
+                            "id": "AwsSolutions-IAM5",
+                            "appliesTo": [
+                                "Action::s3:Abort*",
+                                f"Resource::<{mail_bucket_cfn_res}.Arn>/{PROFILE_PREFIX}*",
+                            ],
+                            "reason": "Profiles of sampled invocations are written under the profiles prefix"
+                        }
+                    ],
+                    True
+                )
+        if name_pool_function:
+            name_pool_function_cfn_res = self.get_logical_id(name_pool_function.node.default_child) # type: ignore
+            NagSuppressions.add_resource_suppressions(
+                vend_email_role,
+                [
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": [f"Resource::<{name_pool_function_cfn_res}.Arn>:*"],
+                        "reason": "Permission generated by the CDK grant for requesting a top up of a name pool"
+                    }
+                ],
+                True
+            )
+        if dedup_queue:
+            NagSuppressions.add_resource_suppressions(
+                dedup_queue,
+                [
+                    {
+                        "id": "AwsSolutions-SQS3",
+                        "reason": "Failed groups are retried until they expire from the queue, every copy stays in the mail bucket"
+                    }
+                ]
+            )
+        if verification_queue:
+            NagSuppressions.add_resource_suppressions(
+                verification_queue,
+                [
+                    {
+                        "id": "AwsSolutions-SQS3",
+                        "reason": "Verifications are informational, failed ones are retried until they expire from the queue"
+                    }
+                ]
+            )
+        if owner_snapshot_role:
+            account_table_cfn_res = self.get_logical_id(account_table.node.default_child) # type: ignore
+            NagSuppressions.add_resource_suppressions(
+                owner_snapshot_role,
+                [
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": [
+                            "Action::s3:Abort*",
+                            "Action::kms:GenerateDataKey*",
+                            "Action::kms:ReEncrypt*",
+                            f"Resource::<{account_table_cfn_res}.Arn>/index/*",
+                        ],
+                        "reason": "Permissions generated by the CDK grants for writing the encrypted snapshot and scanning the table"
+                    },
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": ["Resource::*"],
+                        "reason": "dynamodb:ListStreams does not support resource level permissions"
+                    }
+                ],
+                True
+            )
+        if mapping_version_role:
+            account_table_cfn_res = self.get_logical_id(account_table.node.default_child) # type: ignore
+            NagSuppressions.add_resource_suppressions(
+                mapping_version_role,
+                [
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": [
+                            "Action::kms:GenerateDataKey*",
+                            "Action::kms:ReEncrypt*",
+                            f"Resource::<{account_table_cfn_res}.Arn>/index/*",
+                        ],
+                        "reason": "Permissions generated by the CDK grants for reading and writing the encrypted marker item"
+                    },
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": ["Resource::*"],
+                        "reason": "dynamodb:ListStreams does not support resource level permissions"
+                    }
+                ],
+                True
+            )
+        if ses_feedback_role:
+            account_table_cfn_res = self.get_logical_id(account_table.node.default_child) # type: ignore
+            NagSuppressions.add_resource_suppressions(
+                ses_feedback_role,
+                [
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": [
+                            "Action::kms:GenerateDataKey*",
+                            "Action::kms:ReEncrypt*",
+                            f"Resource::<{account_table_cfn_res}.Arn>/index/*",
+                        ],
+                        "reason": "Permissions generated by the CDK grants for writing the encrypted suppression items"
+                    }
+                ],
+                True
+            )
+        if digest_email_role:
+            NagSuppressions.add_resource_suppressions(
+                digest_email_role,
+                [
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": [
+                            "Action::s3:GetObject*",
+                            "Action::s3:GetBucket*",
+                            "Action::s3:List*",
+                            f"Resource::<{mail_bucket_cfn_res}.Arn>/*",
+                        ],
+                        "reason": "The digest must read the size of any message in the bucket"
+                    },
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": [
+                            "Action::kms:GenerateDataKey*",
+                            "Action::kms:ReEncrypt*"
+                        ],
+                        "reason": "All the KMS actions are needed for the role to write encrypted logs"
+                    },
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "appliesTo": ["Resource::arn:<AWS::Partition>:ses:<AWS::Region>:<AWS::AccountId>:identity/*"],
+                        "reason": "The role must be allowed to send email from the FROM identity to the admin"
+                    }
+                ],
+                True
+            )
+            NagSuppressions.add_resource_suppressions(
+                digest_queue,
+                [
+                    {
+                        "id": "AwsSolutions-SQS3",
+                        "reason": "Entries are only deleted after the digest is sent, unsent entries stay in the queue until the next run"
+                    }
+                ]
+            )
         NagSuppressions.add_resource_suppressions(
             custom_resource_role,
             [
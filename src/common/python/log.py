@@ -0,0 +1,133 @@
+"""Library for structured logging with correlation IDs, per-level sampling and
+a per-invocation budget.
+
+Records are written as one JSON object per line.  Sampling and the budget are
+applied before a record is formatted, so suppressed records never build their
+message.  Pass arguments for %-style formatting, and wrap values that are
+expensive to render in `LazyJson`, to keep that work out of dropped records."""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# JSON, or TEXT for the plain format of the Lambda runtime
+LOG_FORMAT = os.getenv("LOG_FORMAT", "JSON").upper()
+# Fraction of the records of a level that are kept, such as "DEBUG=0.01,INFO=0.25".
+# Levels that are not listed and WARNING and above are always kept
+LOG_SAMPLE_RATES = {
+    level.strip().upper(): float(rate)
+    for level, _, rate in (
+        setting.partition("=") for setting in os.getenv("LOG_SAMPLE_RATES", "").split(",") if setting
+    )
+}
+# Most records below WARNING written per invocation, 0 for no limit
+LOG_BUDGET = int(os.getenv("LOG_BUDGET", "0"))
+
+request_id = contextvars.ContextVar("request_id", default=None)
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+budget_lock = threading.Lock()
+budget_used = 0
+budget_dropped = 0
+
+
+class LazyJson:
+    """Renders `value` as JSON only when the record is formatted"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self) -> str:
+        return json.dumps(self.value, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drops sampled out records and records over the invocation budget"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        global budget_used, budget_dropped
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = LOG_SAMPLE_RATES.get(record.levelname)
+        if rate is not None and random.random() >= rate:
+            return False
+        if LOG_BUDGET:
+            with budget_lock:
+                if budget_used >= LOG_BUDGET:
+                    budget_dropped += 1
+                    return False
+                budget_used += 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if request_id.get():
+            entry["requestId"] = request_id.get()
+        if correlation_id.get():
+            entry["correlationId"] = correlation_id.get()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup():
+    """Configure the root logger.  The Lambda runtime installs its own
+    handler, which is kept and given the filter and the formatter"""
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler(sys.stdout))
+    for handler in root.handlers:
+        if not any(isinstance(f, SamplingFilter) for f in handler.filters):
+            handler.addFilter(SamplingFilter())
+        if LOG_FORMAT == "JSON":
+            handler.setFormatter(JsonFormatter())
+
+
+def start_invocation(context):
+    global budget_used, budget_dropped
+    with budget_lock:
+        budget_used = budget_dropped = 0
+    request_id.set(getattr(context, "aws_request_id", None))
+    correlation_id.set(None)
+
+
+def end_invocation():
+    """Report the records the budget dropped in one record"""
+    global budget_dropped
+    with budget_lock:
+        dropped, budget_dropped = budget_dropped, 0
+    if dropped:
+        logging.getLogger(__name__).warning(
+            "Log budget of %d records exhausted, %d records dropped", LOG_BUDGET, dropped
+        )
+
+
+def invocation(handler):
+    """Decorate a Lambda handler so its records carry the request ID and the
+    budget is counted per invocation"""
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        start_invocation(context)
+        try:
+            return handler(event, context)
+        finally:
+            end_invocation()
+
+    return wrapper
@@ -0,0 +1,135 @@
+"""Library for profiling a sample of the handler's invocations with cProfile and tracemalloc"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import cProfile
+import functools
+import gzip
+import json
+import logging
+import os
+import random
+import time
+import tracemalloc
+import uuid
+import boto3
+import snapstart
+
+# Fraction of the invocations that are profiled, 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# When set, invocations whose event has a true "Profile" key are also profiled
+PROFILE_EVENT_FLAG = os.getenv("PROFILE_EVENT_FLAG")
+EVENT_FLAG = "Profile"
+# Local directory or s3://bucket/prefix the profiles are written to
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", "/tmp/profiles")
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+FUNCTION_NAME = os.getenv("AWS_LAMBDA_FUNCTION_NAME", "local")
+S3_SCHEME = "s3://"
+# Artifact suffixes, also used by tools/aggregate_profiles.py.  Both are gzipped
+# JSON so reading them back never runs code
+CPU_SUFFIX = ".prof.json.gz"
+MEMORY_SUFFIX = ".tracemalloc.json.gz"
+logger = logging.getLogger("PROFILING")
+
+s3 = None
+
+
+@snapstart.register_after_restore
+def reset_clients():
+    """The S3 client is only created once a profile is written, restored
+    environments create their own"""
+    global s3
+    s3 = None
+
+
+def should_profile(event) -> bool:
+    if PROFILE_EVENT_FLAG and isinstance(event, dict) and event.get(EVENT_FLAG):
+        return True
+    return random.random() < PROFILE_SAMPLE_RATE
+
+
+def write_artifact(name: str, data: bytes) -> str:
+    """Write compressed `data` to PROFILE_OUTPUT and returns its location"""
+    data = gzip.compress(data)
+    if PROFILE_OUTPUT.startswith(S3_SCHEME):
+        global s3
+        if s3 is None:
+            s3 = boto3.client("s3")
+        bucket, _, prefix = PROFILE_OUTPUT[len(S3_SCHEME):].partition("/")
+        key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+        s3.put_object(Bucket=bucket, Key=key, Body=data)
+        return f"{S3_SCHEME}{bucket}/{key}"
+    path = os.path.join(PROFILE_OUTPUT, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def cpu_statistics(stats: dict) -> list:
+    """Returns the cProfile statistics as JSON lists of the function, its call
+    counts and times, and the same for each of its callers"""
+    return [
+        [list(func), cc, nc, tt, ct, [[list(caller), *timing] for caller, timing in callers.items()]]
+        for func, (cc, nc, tt, ct, callers) in stats.items()
+    ]
+
+
+def memory_statistics(snapshot: tracemalloc.Snapshot) -> list:
+    """Returns the filename, line number, size and count of the memory still
+    allocated per source line"""
+    return [
+        [stat.traceback[0].filename, stat.traceback[0].lineno, stat.size, stat.count]
+        for stat in snapshot.statistics("lineno")
+    ]
+
+
+def run_profiled(handler, event, context):
+    """Run the handler under cProfile and tracemalloc and write both profiles,
+    even when the handler raises.  Failing to write them is only logged, so
+    the handler's result or exception is kept"""
+    request_id = getattr(context, "aws_request_id", None) or str(uuid.uuid4())
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        return profiler.runcall(handler, event, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            profiler.create_stats()
+            name = f"{FUNCTION_NAME}/{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{request_id}"
+            locations = [
+                write_artifact(name + CPU_SUFFIX, json.dumps(cpu_statistics(profiler.stats)).encode()),
+                write_artifact(name + MEMORY_SUFFIX, json.dumps(memory_statistics(snapshot)).encode()),
+            ]
+            print(json.dumps({
+                "ProfiledRequestId": request_id,
+                "ElapsedMs": int(elapsed * 1000),
+                "PeakTracedBytes": peak,
+                "Profiles": locations,
+            }))
+        except Exception:
+            # The handler already did its work, raising now would retry it
+            logger.warning("Could not write the profiles of request %s", request_id, exc_info=True)
+
+
+def profiled(handler):
+    """Decorate a Lambda handler so a sample of its invocations are profiled.
+    When profiling is off the handler is returned as is and costs nothing"""
+    if not PROFILE_SAMPLE_RATE and not PROFILE_EVENT_FLAG:
+        return handler
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not should_profile(event):
+            return handler(event, context)
+        return run_profiled(handler, event, context)
+
+    return wrapper
@@ -0,0 +1,36 @@
+"""Library for registering Lambda SnapStart runtime hooks"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+try:
+    import snapshot_restore_py
+except ImportError:
+    # The runtime hooks library is only available in the Lambda Python runtime
+    snapshot_restore_py = None
+
+# Hooks are also kept here so the lifecycle can be simulated locally
+before_snapshot_hooks = []
+after_restore_hooks = []
+
+
+def register_before_snapshot(func):
+    """Run `func` before the snapshot of the initialized function is taken"""
+    before_snapshot_hooks.append(func)
+    if snapshot_restore_py:
+        snapshot_restore_py.register_before_snapshot(func)
+    return func
+
+
+def register_after_restore(func):
+    """Run `func` every time an execution environment is restored from the snapshot"""
+    after_restore_hooks.append(func)
+    if snapshot_restore_py:
+        snapshot_restore_py.register_after_restore(func)
+    return func
+
+
+def simulate_snapshot_restore():
+    """Run the registered hooks in the order Lambda would.  Only used locally"""
+    for hook in before_snapshot_hooks:
+        hook()
+    for hook in after_restore_hooks:
+        hook()
@@ -0,0 +1,72 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import sys
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+import ses
+import sqs
+
+ADDRESS_FROM = os.getenv("ADDRESS_FROM")
+ADDRESS_ADMIN = os.getenv("ADDRESS_ADMIN")
+# Larger backlogs are summarized over several runs
+DIGEST_MAX_ENTRIES = int(os.getenv("DIGEST_MAX_ENTRIES", "2000"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+logger = logging.getLogger("DIGEST-EMAIL")
+logging.getLogger().setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+
+
+def format_size(size: int | None) -> str:
+    if size is None:
+        return "unknown"
+    if size < 1024:
+        return f"{size} B"
+    return f"{size / 1024:.1f} KB"
+
+
+def create_digest_body(entries: list[dict], sizes: list[int | None]) -> str:
+    """Returns one paragraph per buffered message"""
+    lines = [
+        f"{len(entries)} messages were received for addresses without an account owner.",
+        "",
+    ]
+    for entry, size in zip(entries, sizes):
+        lines.extend(
+            [
+                f"Received: {entry.get('Timestamp')}",
+                f"From:     {entry.get('Source')}",
+                f"To:       {entry.get('Destination')}",
+                f"Subject:  {entry.get('Subject')}",
+                f"Size:     {format_size(size)}",
+                f"Location: {ses.get_console_path(entry.get('Bucket'), entry.get('ObjectKey'))}",
+                "",
+            ]
+        )
+    return "\n".join(lines)
+
+
+def lambda_handler(event, context):
+    received = sqs.receive_entries(DIGEST_MAX_ENTRIES)
+    if not received:
+        logger.info("No catch-all messages to summarize")
+        return
+    receipt_handles = [handle for handle, _ in received]
+    entries = sorted((entry for _, entry in received), key=lambda e: e.get("Timestamp", ""))
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        sizes = list(
+            executor.map(
+                lambda e: ses.get_message_size(e.get("Bucket"), e.get("ObjectKey")), entries
+            )
+        )
+
+    subject = f"Digest of {len(entries)} catch-all messages"
+    result = ses.send_digest(
+        ADDRESS_FROM, ADDRESS_ADMIN, subject, create_digest_body(entries, sizes)
+    )
+    logger.info(result)
+    # Entries are only removed once they were sent, otherwise they become
+    # visible again and are included in the next digest
+    sqs.delete_entries(receipt_handles)
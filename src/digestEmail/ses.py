@@ -0,0 +1,42 @@
+"""Library for sending the digest using SES"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import boto3
+from botocore.exceptions import ClientError
+
+region = os.getenv("AWS_REGION", "us-east-1")
+
+# Create a new SES client.
+client_ses = boto3.client("ses")
+# Create a new S3 client.
+s3 = boto3.client("s3")
+
+
+def get_message_size(bucket: str, object_key: str) -> int | None:
+    """Returns the size of the stored message without downloading it"""
+    try:
+        return s3.head_object(Bucket=bucket, Key=object_key)["ContentLength"]
+    except ClientError:
+        # The message may already have expired from the bucket
+        return None
+
+
+def get_console_path(bucket: str, object_key: str) -> str:
+    return f"http://s3.console.aws.amazon.com/s3/object/{bucket}/{object_key}?region={region}"
+
+
+def send_digest(address_from: str, address_to: str, subject: str, body: str) -> str:
+    """Use SES to send the digest as a plain text email"""
+    try:
+        response = client_ses.send_email(
+            Source=address_from,
+            Destination={"ToAddresses": [address_to]},
+            Message={
+                "Subject": {"Data": subject},
+                "Body": {"Text": {"Data": body}},
+            },
+        )
+    except ClientError as e:
+        raise RuntimeError(e.response["Error"]["Message"]) from e
+    return "Digest sent! Message ID: " + response["MessageId"]
@@ -0,0 +1,40 @@
+"""Library for reading the buffered catch-all messages from SQS"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import boto3
+
+DIGEST_QUEUE_URL = os.getenv("DIGEST_QUEUE_URL")
+# Maximum number of messages SQS returns or deletes in one call
+SQS_BATCH_SIZE = 10
+
+sqs = boto3.client("sqs")
+
+
+def receive_entries(max_entries: int) -> list[tuple[str, dict]]:
+    """Returns up to `max_entries` (receipt handle, entry) tuples from the queue"""
+    entries = []
+    while len(entries) < max_entries:
+        resp = sqs.receive_message(
+            QueueUrl=DIGEST_QUEUE_URL,
+            MaxNumberOfMessages=min(SQS_BATCH_SIZE, max_entries - len(entries)),
+            WaitTimeSeconds=1,
+        )
+        messages = resp.get("Messages", [])
+        if not messages:
+            break
+        entries.extend((m["ReceiptHandle"], json.loads(m["Body"])) for m in messages)
+    return entries
+
+
+def delete_entries(receipt_handles: list[str]):
+    """Remove the entries that were included in a digest from the queue"""
+    for start in range(0, len(receipt_handles), SQS_BATCH_SIZE):
+        batch = receipt_handles[start : start + SQS_BATCH_SIZE]
+        sqs.delete_message_batch(
+            QueueUrl=DIGEST_QUEUE_URL,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(batch)
+            ],
+        )
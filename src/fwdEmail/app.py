@@ -1,21 +1,60 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import asyncio
+import contextvars
+import functools
 import json
 import os
 import sys
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 import ses
 import ddb
+import policy
+import metrics
+import ratelimit
+import digest
+import dedup
+import deadline
+import routing
+import suppression
+import deliverylog
+import profiling
+import snapstart
+import log
 
 ADDRESS_FROM = os.getenv("ADDRESS_FROM")
 ADDRESS_ADMIN = os.getenv("ADDRESS_ADMIN")
 DISABLE_CATCH_ALL = os.getenv("DISABLE_CATCH_ALL", False)
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Forward the records of an invocation one by one (sync) or concurrently (async)
+ASYNC_MODE = "async"
+FORWARDER_MODE = os.getenv("FORWARDER_MODE", "sync").lower()
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "16"))
+# Start downloading a message while its owner is read from the table, rather
+# than after the message is known to be forwarded
+PREFETCH_MESSAGE = os.getenv("PREFETCH_MESSAGE")
+# Key of the response listing the messages of an invocation that were handed
+# back as they did not fit in it
+DEFERRED_MESSAGE_IDS = "deferredMessageIds"
 logger = logging.getLogger("FWD-EMAIL")
-logging.getLogger().setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+log.setup()
+executor = None
+
+
+@snapstart.register_before_snapshot
+def warm_up():
+    """Run the message handling code once so the modules it imports lazily
+    are part of the SnapStart snapshot"""
+    ses.create_message(
+        "from@example.com",
+        "to@example.com",
+        {"file": b"From: sender@example.com\r\nSubject: warm up\r\n\r\nwarm up\r\n"},
+    )
 
 
 def get_recipient(source_mail_to: str, account_owner: str) -> str | None:
@@ -29,48 +68,435 @@ def get_recipient(source_mail_to: str, account_owner: str) -> str | None:
     return account_owner if account_owner else ADDRESS_ADMIN
 
 
+def resolve_owner(mail_to: str) -> str | None:
+    """Returns the address mail to `mail_to` belongs to from the routing rules
+    or the account table, or None if there is no owner"""
+    lookup_address = routing.normalize_address(mail_to)
+    return routing.match(lookup_address) or ddb.get_account_owner_address(
+        lookup_address
+    )
+
+
+def log_delivery(decoded_message: dict, outcome: str, owner: str | None = None, size: int | None = None):
+    """Record the outcome of the message in the delivery log.  Never raises, so
+    recording a failure does not replace the error being handled"""
+    try:
+        alias = routing.normalize_address(decoded_message.get("receipt").get("recipients")[0])
+        deliverylog.record(decoded_message, alias, outcome, owner, size)
+    except Exception:
+        logger.warning(
+            "Unable to record the %s delivery of message ID %s", outcome, decoded_message.get("mail", {}).get("messageId"),
+            exc_info=True,
+        )
+
+
+def buffer_for_digest(decoded_message: dict):
+    """Queue the message for the admin digest instead of forwarding it"""
+    digest.buffer_message(decoded_message)
+    logger.info("Message ID %s queued for the admin digest", decoded_message.get("mail").get("messageId"))
+    metrics.add_count("MessagesDigested")
+    log_delivery(decoded_message, deliverylog.DIGESTED)
+
+
+def apply_policy(decoded_message: dict) -> bool:
+    """Apply the verdict policy before any other work is done for the message.
+    Returns False when the message was dropped or quarantined"""
+    message_id = decoded_message.get("mail").get("messageId")
+    logger.info("Received message ID %s", message_id)
+    receipt = decoded_message.get("receipt")
+    mail_bucket = receipt.get("action").get("bucketName")
+    object_path = receipt.get("action").get("objectKey")
+
+    action, failed_verdicts = policy.evaluate(receipt)
+    if action != policy.ALLOW:
+        logger.info("Message ID %s failed %s, action is %s", message_id, ", ".join(failed_verdicts), action)
+        for verdict in failed_verdicts:
+            metrics.add_count(f"{verdict[0].upper()}{verdict[1:]}Failed")
+        if action == policy.QUARANTINE:
+            quarantine_path = ses.quarantine_message(mail_bucket, object_path)
+            logger.info("Message ID %s quarantined to %s", message_id, quarantine_path)
+            metrics.add_count("MessagesQuarantined")
+            log_delivery(decoded_message, deliverylog.QUARANTINED)
+        else:
+            metrics.add_count("MessagesDropped")
+            log_delivery(decoded_message, deliverylog.DROPPED)
+        return False
+    return True
+
+
+def route_message(decoded_message: dict) -> str | None:
+    """Returns the address to forward the message described by a decoded SES
+    receipt notification to, or None if the message is not forwarded because
+    it was dropped, rate limited or queued for the digest"""
+    message_id = decoded_message.get("mail").get("messageId")
+    mail_to = decoded_message.get("receipt").get("recipients")[0]
+
+    # Get the account owner
+    account_owner = resolve_owner(mail_to)
+
+    # Determine the recipient
+    send_to = get_recipient(mail_to, account_owner)
+    if not send_to:
+        logger.info("Unable to determine the proper recipient for %s", mail_to)
+        log_delivery(decoded_message, deliverylog.NO_RECIPIENT)
+        return None
+
+    # Do not send to addresses that bounced or complained before
+    if send_to != ADDRESS_ADMIN and suppression.is_suppressed(send_to):
+        metrics.add_count("MessagesSuppressed")
+        if suppression.SUPPRESSED_RECIPIENT_ACTION == suppression.DROP:
+            logger.info("Message ID %s dropped, %s is suppressed", message_id, send_to)
+            log_delivery(decoded_message, deliverylog.SUPPRESSED, send_to)
+            return None
+        logger.info("Message ID %s rerouted to %s, %s is suppressed", message_id, ADDRESS_ADMIN, send_to)
+        send_to = ADDRESS_ADMIN
+
+    # Limit how much catch-all mail a single sender or alias can push to the admin
+    if not account_owner and mail_to != ADDRESS_FROM:
+        if digest.DIGEST_CATCH_ALL == digest.ALL:
+            buffer_for_digest(decoded_message)
+            return None
+        source = decoded_message.get("mail").get("source")
+        exceeded = ratelimit.check(source, mail_to)
+        if exceeded:
+            logger.info(
+                "Message ID %s from %s to %s exceeded the %s rate limit", message_id, source, mail_to, " and ".join(exceeded)
+            )
+            for limit_name in exceeded:
+                metrics.add_count(f"RateLimited{limit_name.title()}")
+            metrics.add_count("MessagesRateLimited")
+            if digest.DIGEST_CATCH_ALL == digest.OVER_LIMIT:
+                buffer_for_digest(decoded_message)
+            else:
+                log_delivery(decoded_message, deliverylog.RATE_LIMITED)
+            return None
+    return send_to
+
+
+class MessageFetch:
+    """Download of a message started before it is known to be forwarded"""
+
+    def __init__(self, decoded_message: dict):
+        self.message_id = decoded_message.get("mail").get("messageId")
+        self.cancelled = threading.Event()
+        self.future = get_executor().submit(
+            contextvars.copy_context().run,
+            ses.get_message_from_s3,
+            *get_message_location(decoded_message),
+            self.cancelled,
+        )
+
+    def cancel(self):
+        """Stop the download when the message is not forwarded.  A download
+        that has not started is skipped, one in flight stops reading"""
+        if self.future.done():
+            return
+        self.cancelled.set()
+        self.future.cancel()
+        logger.debug("Message ID %s download cancelled", self.message_id)
+        metrics.add_count("PrefetchesCancelled")
+
+
+def start_fetch(decoded_message: dict) -> MessageFetch | None:
+    """Start downloading the message when PREFETCH_MESSAGE is set and its owner
+    has to be read from the table, so both wait on the network together.
+    Owners known from memory are resolved before a download would start"""
+    if not PREFETCH_MESSAGE:
+        return None
+    mail_to = decoded_message.get("receipt").get("recipients")[0]
+    lookup_address = routing.normalize_address(mail_to)
+    if (
+        mail_to == ADDRESS_FROM
+        or routing.match(lookup_address)
+        or ddb.get_cached_owner_address(lookup_address) is not ddb.NOT_CACHED
+    ):
+        return None
+    return MessageFetch(decoded_message)
+
+
+def deliver_message(send_to: str, file_dict: dict) -> tuple[str, str]:
+    """Send the message in `file_dict` to `send_to`, or to the admin if `send_to`
+    is not verified, and returns the result and the address it was sent to"""
+    # Create the message.
+    message = ses.create_message(ADDRESS_FROM, send_to, file_dict)
+
+    # Send the email.
+    result = ses.send_email(message)
+    if "Verification_Error" in result:
+        # Instead send the email to the admin account
+        logger.warning(
+            "It appears %s is not a verified email.  Will now attempt to send the message to the admin at %s",
+            send_to,
+            ADDRESS_ADMIN,
+        )
+        msg_2 = ses.create_message(ADDRESS_FROM, ADDRESS_ADMIN, file_dict)
+        return ses.send_email(msg_2), ADDRESS_ADMIN
+    return result, send_to
+
+
+def get_message_location(decoded_message: dict) -> tuple[str, str]:
+    """Returns the bucket and key the message was stored at by SES"""
+    action = decoded_message.get("receipt").get("action")
+    return action.get("bucketName"), action.get("objectKey")
+
+
+def collapse_copy(decoded_message: dict, send_to: str, file_dict: dict) -> bool:
+    """Collect copies of a message already forwarded to `send_to` for another
+    alias.  Returns True when the message is forwarded later with them"""
+    if not dedup.DEDUP_QUEUE_URL:
+        return False
+    alias = routing.normalize_address(decoded_message.get("receipt").get("recipients")[0])
+    if not dedup.collect(send_to, alias, decoded_message, file_dict["file"]):
+        return False
+    logger.info("Message ID %s collected with identical messages to %s", decoded_message.get("mail").get("messageId"), send_to)
+    metrics.add_count("MessagesDeduplicated")
+    log_delivery(decoded_message, deliverylog.DEDUPLICATED, send_to, len(file_dict["file"]))
+    return True
+
+
+def forward_collapsed(key: str, group_id: str):
+    """Forward a group of identical messages once more, listing the aliases
+    its copies were received for"""
+    log.correlation_id.set(group_id)
+    group = dedup.close_group(key, group_id)
+    if not group:
+        logger.info("Group of message ID %s was already forwarded", group_id)
+        return
+    aliases = sorted(group[dedup.ALIASES])
+    until = deadline.stage_deadline(deadline.FETCH)
+    with deadline.timed(deadline.FETCH):
+        file_dict = ses.get_message_from_s3(group[dedup.BUCKET], group[dedup.OBJECT_KEY], None, until)
+    file_dict["file"] = dedup.add_alias_list(file_dict["file"], group[dedup.FIRST_ALIAS], aliases)
+    deadline.stage_deadline(deadline.SEND)
+    if not dedup.claim_send(key, group_id):
+        logger.warning("Group of message ID %s was claimed by an earlier flush and is not sent again", group_id)
+        return
+    with deadline.timed(deadline.SEND):
+        # An error raised by the send keeps the claim, as SES may have accepted it
+        result, _ = deliver_message(group[dedup.OWNER], file_dict)
+    logger.info(result)
+    if not result.startswith("Email sent!"):
+        dedup.release_send(key)
+        raise RuntimeError(f"Group of message ID {group_id} was not sent: {result}")
+    dedup.mark_sent(key)
+    metrics.add_count("CollapsedForwards")
+    metrics.add_count("CollapsedAliases", len(aliases))
+
+
+def forward_collapsed_groups(records: list[dict]) -> dict:
+    """Forward the groups whose window ended.  Failed ones and the ones that
+    do not fit in the invocation are returned so only they are retried"""
+    failures = []
+    for index, record in enumerate(records):
+        if not deadline.can_start():
+            logger.warning("%d groups did not fit in the invocation and are retried", len(records) - index)
+            metrics.add_count("GroupsDeferred", len(records) - index)
+            failures.extend({"itemIdentifier": r["messageId"]} for r in records[index:])
+            break
+        group = json.loads(record["body"])
+        try:
+            forward_collapsed(group[dedup.STATE_KEY], group[dedup.GROUP_ID])
+        except TimeoutError as e:
+            logger.warning("Group of message ID %s is retried: %s", group[dedup.GROUP_ID], e)
+            metrics.add_count("GroupsDeferred")
+            failures.append({"itemIdentifier": record["messageId"]})
+        except Exception:
+            logger.exception("Unable to forward the group of message ID %s", group[dedup.GROUP_ID])
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
+
+
+def log_result(decoded_message: dict, send_to: str, file_dict: dict, result: str, sent_to: str):
+    """Log the result of sending the message and record its delivery"""
+    logger.info(result)
+    outcome = deliverylog.FORWARDED if sent_to == send_to else deliverylog.REROUTED
+    log_delivery(decoded_message, outcome, sent_to, len(file_dict["file"]))
+
+
+def fetch_message(decoded_message: dict, fetch: MessageFetch | None) -> dict:
+    """Download the message, or wait for its prefetch, within the time left
+    for the download"""
+    until = deadline.stage_deadline(deadline.FETCH)
+    with deadline.timed(deadline.FETCH):
+        if fetch:
+            return fetch.future.result(deadline.seconds_left(until))
+        return ses.get_message_from_s3(*get_message_location(decoded_message), None, until)
+
+
+def hand_back(decoded_messages: list[dict], deferred: list[dict]) -> dict | None:
+    """Record the messages that did not fit in the invocation and hand them
+    back.  When none of the messages was handled the error is raised so Lambda
+    retries the event, which is how the single message of an SNS invocation is
+    retried.  Otherwise retrying the event would forward the handled messages
+    again, so only the IDs of the deferred ones are returned for the caller,
+    such as tools/replay.py, to send again"""
+    if not deferred:
+        return None
+    message_ids = [m.get("mail").get("messageId") for m in deferred]
+    for decoded_message in deferred:
+        log_delivery(decoded_message, deliverylog.DEFERRED)
+    metrics.add_count("MessagesDeferred", len(deferred))
+    if len(deferred) == len(decoded_messages):
+        raise deadline.DeadlineExceeded(
+            f"{len(message_ids)} messages did not fit in the invocation and are retried: {', '.join(message_ids)}"
+        )
+    logger.warning(
+        "%d messages did not fit in the invocation and are returned: %s", len(message_ids), ", ".join(message_ids)
+    )
+    return {DEFERRED_MESSAGE_IDS: message_ids}
+
+
+def forward_message(decoded_message: dict):
+    """Forward the message described by a decoded SES receipt notification"""
+    log.correlation_id.set(decoded_message.get("mail").get("messageId"))
+    fetch = None
+    try:
+        if not apply_policy(decoded_message):
+            return
+        fetch = start_fetch(decoded_message)
+        with deadline.timed(deadline.ROUTE):
+            send_to = route_message(decoded_message)
+        if not send_to:
+            return
+
+        # Retrieve the file from the S3 bucket.
+        file_dict = fetch_message(decoded_message, fetch)
+        if collapse_copy(decoded_message, send_to, file_dict):
+            return
+
+        # Send the email and print the result, unless it may not finish in time.
+        deadline.stage_deadline(deadline.SEND)
+        with deadline.timed(deadline.SEND):
+            result = deliver_message(send_to, file_dict)
+        log_result(decoded_message, send_to, file_dict, *result)
+    except TimeoutError:
+        # Recorded as deferred by the caller
+        raise
+    except Exception:
+        log_delivery(decoded_message, deliverylog.FAILED)
+        raise
+    finally:
+        if fetch:
+            fetch.cancel()
+
+
+async def run_blocking(func, *args):
+    """Run the blocking `func` in the forwarder's thread pool, in the context
+    of the calling task so its records keep the message's correlation ID"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), functools.partial(context.run, func, *args)
+    )
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """The pool is kept for the life of the container rather than being
+    shut down with the event loop of each invocation"""
+    global executor
+    if executor is None:
+        # Every message in flight may also have a download running
+        workers = ASYNC_MAX_CONCURRENCY * 2 if PREFETCH_MESSAGE else ASYNC_MAX_CONCURRENCY
+        executor = ThreadPoolExecutor(max_workers=workers)
+    return executor
+
+
+async def forward_message_async(decoded_message: dict, semaphore: asyncio.Semaphore):
+    """Asyncio variant of `forward_message`.  boto3 is blocking, so each stage
+    waits for its calls in the thread pool while other messages progress"""
+    # Each message is a task with its own copy of the context
+    log.correlation_id.set(decoded_message.get("mail").get("messageId"))
+    async with semaphore:
+        if not deadline.can_start():
+            raise deadline.DeadlineExceeded("No time left to start the message")
+        fetch = None
+        try:
+            if not await run_blocking(apply_policy, decoded_message):
+                return
+            fetch = await run_blocking(start_fetch, decoded_message)
+            with deadline.timed(deadline.ROUTE):
+                send_to = await run_blocking(route_message, decoded_message)
+            if not send_to:
+                return
+            until = deadline.stage_deadline(deadline.FETCH)
+            with deadline.timed(deadline.FETCH):
+                if fetch:
+                    file_dict = await asyncio.wait_for(
+                        asyncio.wrap_future(fetch.future), deadline.seconds_left(until)
+                    )
+                else:
+                    file_dict = await run_blocking(
+                        ses.get_message_from_s3, *get_message_location(decoded_message), None, until
+                    )
+            if await run_blocking(collapse_copy, decoded_message, send_to, file_dict):
+                return
+            deadline.stage_deadline(deadline.SEND)
+            with deadline.timed(deadline.SEND):
+                result = await run_blocking(deliver_message, send_to, file_dict)
+            log_result(decoded_message, send_to, file_dict, *result)
+        except TimeoutError:
+            raise
+        except Exception:
+            log_delivery(decoded_message, deliverylog.FAILED)
+            raise
+        finally:
+            if fetch:
+                fetch.cancel()
+
+
+async def forward_messages_async(decoded_messages: list[dict]):
+    """Forward all messages with at most ASYNC_MAX_CONCURRENCY in flight.  Every
+    message is attempted, or deferred when it does not fit in the invocation,
+    before the first error is raised.  Returns the deferred messages, see
+    `hand_back`"""
+    semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+    results = await asyncio.gather(
+        *(forward_message_async(m, semaphore) for m in decoded_messages),
+        return_exceptions=True,
+    )
+    deferred = [m for m, r in zip(decoded_messages, results) if isinstance(r, TimeoutError)]
+    errors = [r for r in results if isinstance(r, BaseException) and not isinstance(r, TimeoutError)]
+    response = hand_back(decoded_messages, deferred)
+    if errors:
+        raise errors[0]
+    return response
+
+
+def forward_messages(decoded_messages: list[dict]) -> dict | None:
+    """Forward the messages one by one.  Once one does not fit in the
+    invocation the rest are deferred with it, see `hand_back`"""
+    deferred = []
+    for decoded_message in decoded_messages:
+        if deferred or not deadline.can_start():
+            deferred.append(decoded_message)
+            continue
+        try:
+            forward_message(decoded_message)
+        except TimeoutError:
+            deferred.append(decoded_message)
+    return hand_back(decoded_messages, deferred)
+
+
+@profiling.profiled
+@log.invocation
 def lambda_handler(event, context):
     # Get the unique ID of the message. This corresponds to the name of the file
     # in S3.
-    logger.debug(json.dumps(event))
-    for record in event.get("Records"):
-        if record.get("EventSource") == "aws:sns":
-            decoded_message = json.loads(record.get("Sns").get("Message"))
-            if decoded_message.get("notificationType") == "Received":
-                # Extract Message Properties
-                logger.info(
-                    f"Received message ID {decoded_message.get('mail').get('messageId')}"
-                )
-                mail_bucket = (
-                    decoded_message.get("receipt").get("action").get("bucketName")
-                )
-                object_path = (
-                    decoded_message.get("receipt").get("action").get("objectKey")
-                )
-                mail_to = decoded_message.get("receipt").get("recipients")[0]
-
-                # Retrieve the file from the S3 bucket.
-                file_dict = ses.get_message_from_s3(mail_bucket, object_path)
-
-                # Get the account owner
-                account_owner = ddb.get_account_owner_address(mail_to)
-
-                # Determine the recipient
-                send_to = get_recipient(mail_to, account_owner)
-                if not send_to:
-                    logger.info(f"Unable to determine the proper recipient for {mail_to}")
-                    return
-
-                # Create the message.
-                message = ses.create_message(ADDRESS_FROM, send_to, file_dict)
-
-                # Send the email and print the result.
-                result = ses.send_email(message)
-                if "Verification_Error" in result:
-                    # Instead send the email to the admin account
-                    logger.warn(
-                        f"It appears {send_to} is not a verified email.  Will now attempt to send the message to the admin at {ADDRESS_ADMIN}"
-                    )
-                    msg_2 = ses.create_message(ADDRESS_FROM, ADDRESS_ADMIN, file_dict)
-                    result = ses.send_email(msg_2)
-                logger.info(result)
+    logger.debug("Event %s", log.LazyJson(event))
+    deadline.start_invocation(context)
+    try:
+        records = event.get("Records")
+        if records and records[0].get("eventSource") == "aws:sqs":
+            # Groups of identical messages queued by dedup
+            return forward_collapsed_groups(records)
+        decoded_messages = []
+        for record in records:
+            if record.get("EventSource") == "aws:sns":
+                decoded_message = json.loads(record.get("Sns").get("Message"))
+                if decoded_message.get("notificationType") == "Received":
+                    decoded_messages.append(decoded_message)
+        if FORWARDER_MODE == ASYNC_MODE:
+            return asyncio.run(forward_messages_async(decoded_messages))
+        return forward_messages(decoded_messages)
+    finally:
+        deliverylog.flush()
+        metrics.flush()
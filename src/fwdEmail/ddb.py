@@ -2,18 +2,175 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import boto3
+import gzip
+import json
+import logging
 import os
+import time
+from botocore.exceptions import ClientError
+import snapstart
 
 CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
 TABLE_NAME = os.getenv("TABLE_NAME")
+# Optional snapshot of all owner addresses published by the ownerSnapshot function
+OWNER_SNAPSHOT_BUCKET = os.getenv("OWNER_SNAPSHOT_BUCKET")
+OWNER_SNAPSHOT_KEY = os.getenv("OWNER_SNAPSHOT_KEY", "snapshot/owners.json.gz")
+OWNER_SNAPSHOT_REFRESH_SECONDS = int(os.getenv("OWNER_SNAPSHOT_REFRESH_SECONDS", "60"))
+# Optional cache of table lookups, invalidated by the mapping version published
+# by the mappingVersion function.  A TTL of 0 disables the cache
+OWNER_CACHE_TTL_SECONDS = int(os.getenv("OWNER_CACHE_TTL_SECONDS", "0"))
+OWNER_CACHE_MAX_ENTRIES = int(os.getenv("OWNER_CACHE_MAX_ENTRIES", "10000"))
+MAPPING_VERSION_CHECK_SECONDS = int(os.getenv("MAPPING_VERSION_CHECK_SECONDS", "10"))
 # Field Names
 ACCOUNT_EMAIL = "AccountEmail"
 OWNER_ADDRESS = "OwnerAddress"
+RULES = "Rules"
+VERSION = "Version"
+CHANGES = "Changes"
+EXPIRES_AT = "ExpiresAt"
+SINCE = "Since"
+# Keys of the items holding settings rather than accounts start with this prefix
+CONTROL_KEY_PREFIX = "#"
+ROUTING_RULES_KEY = CONTROL_KEY_PREFIX + "routing-rules"
+MAPPING_VERSION_KEY = CONTROL_KEY_PREFIX + "mapping-version"
+SUPPRESSION_KEY_PREFIX = CONTROL_KEY_PREFIX + "suppression#"
+# Returned by get_cached_owner_address when the table has to be read, as None
+# is a cached miss
+NOT_CACHED = object()
+logger = logging.getLogger("FWD-EMAIL")
 
-ddb = boto3.resource("dynamodb", region_name=CURRENT_REGION)
-account_table = ddb.Table(TABLE_NAME)
+ddb = None
+account_table = None
+s3 = None
+
+owner_snapshot = None
+owner_snapshot_etag = None
+owner_snapshot_checked_at = float("-inf")
+
+# Account email -> (owner address or None, monotonic expiry)
+owner_cache = {}
+mapping_version = None
+mapping_version_checked_at = float("-inf")
+
+
+@snapstart.register_after_restore
+def create_clients():
+    """Create the clients, again after every SnapStart restore so restored
+    environments do not share connections.  The monotonic clock of a restored
+    environment is unrelated to the one the snapshot was taken with, so the
+    snapshot is checked again on first use"""
+    global ddb, account_table, s3, owner_snapshot_checked_at, mapping_version_checked_at
+    ddb = boto3.resource("dynamodb", region_name=CURRENT_REGION)
+    account_table = ddb.Table(TABLE_NAME)
+    s3 = boto3.client("s3") if OWNER_SNAPSHOT_BUCKET else None
+    owner_snapshot_checked_at = float("-inf")
+    mapping_version_checked_at = float("-inf")
+
+
+create_clients()
+
+
+def get_owner_snapshot() -> dict | None:
+    """Returns the owner snapshot, downloading it again when its ETag changed.
+    Returns None when no snapshot is configured or it could not be loaded"""
+    global owner_snapshot, owner_snapshot_etag, owner_snapshot_checked_at
+    now = time.monotonic()
+    if not s3 or now - owner_snapshot_checked_at < OWNER_SNAPSHOT_REFRESH_SECONDS:
+        return owner_snapshot
+    owner_snapshot_checked_at = now
+    get_kwargs = {"Bucket": OWNER_SNAPSHOT_BUCKET, "Key": OWNER_SNAPSHOT_KEY}
+    if owner_snapshot_etag:
+        get_kwargs["IfNoneMatch"] = owner_snapshot_etag
+    try:
+        resp = s3.get_object(**get_kwargs)
+    except ClientError as ce:
+        if ce.response["Error"]["Code"] not in ["304", "NotModified"]:
+            # Keep using the last snapshot and fall back to the table for misses
+            logger.warning("Unable to load the owner snapshot: %s", ce.response["Error"]["Message"])
+        return owner_snapshot
+    document = json.loads(gzip.decompress(resp["Body"].read()))
+    owner_snapshot = document["Owners"]
+    owner_snapshot_etag = resp["ETag"]
+    logger.info("Loaded a snapshot of %d owners with ETag %s", len(owner_snapshot), owner_snapshot_etag)
+    return owner_snapshot
+
+
+def check_mapping_version():
+    """Drops the cached owners of the accounts changed since the last check.
+    Reads the version marker at most once per MAPPING_VERSION_CHECK_SECONDS
+    and only reads the changed keys when the version moved"""
+    global mapping_version, mapping_version_checked_at, owner_snapshot_checked_at
+    now = time.monotonic()
+    if not OWNER_CACHE_TTL_SECONDS or now - mapping_version_checked_at < MAPPING_VERSION_CHECK_SECONDS:
+        return
+    mapping_version_checked_at = now
+    resp = account_table.get_item(
+        Key={ACCOUNT_EMAIL: MAPPING_VERSION_KEY}, ProjectionExpression=VERSION
+    )
+    version = int(resp.get("Item", {}).get(VERSION, 0))
+    if mapping_version is None:
+        # Nothing was cached before the first check
+        mapping_version = version
+        return
+    if version <= mapping_version:
+        return
+    item = account_table.get_item(Key={ACCOUNT_EMAIL: MAPPING_VERSION_KEY}).get("Item", {})
+    if mapping_version < int(item.get(SINCE, 0)):
+        # Some of the changes were pruned from the marker, so drop everything
+        logger.info("Mapping version moved from %s past pruned changes, clearing the owner cache", mapping_version)
+        owner_cache.clear()
+        owner_snapshot_checked_at = float("-inf")
+    else:
+        changed = [key for key, changed_in in item.get(CHANGES, {}).items() if int(changed_in) > mapping_version]
+        logger.info("Mapping version moved from %s, dropping %d changed owners", mapping_version, len(changed))
+        for key in changed:
+            owner_cache.pop(key, None)
+            if owner_snapshot:
+                owner_snapshot.pop(key, None)
+    mapping_version = max(version, int(item.get(VERSION, 0)))
+
+
+def get_cached_owner_address(incoming_email_address):
+    """Returns the owner from the snapshot or the cache without reading the
+    table or refreshing either, or NOT_CACHED"""
+    if owner_snapshot and incoming_email_address in owner_snapshot:
+        return owner_snapshot[incoming_email_address]
+    cached = owner_cache.get(incoming_email_address)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return NOT_CACHED
 
 
 def get_account_owner_address(incoming_email_address):
-    resp = account_table.get_item(Key={ACCOUNT_EMAIL: incoming_email_address})
-    return resp.get("Item", {}).get(OWNER_ADDRESS)
+    check_mapping_version()
+    get_owner_snapshot()
+    owner = get_cached_owner_address(incoming_email_address)
+    if owner is not NOT_CACHED:
+        return owner
+    now = time.monotonic()
+    resp = account_table.get_item(
+        Key={ACCOUNT_EMAIL: incoming_email_address}, ProjectionExpression=OWNER_ADDRESS
+    )
+    owner = resp.get("Item", {}).get(OWNER_ADDRESS)
+    if OWNER_CACHE_TTL_SECONDS:
+        # Misses are cached too, so catch-all floods do not read the table
+        if len(owner_cache) >= OWNER_CACHE_MAX_ENTRIES:
+            owner_cache.clear()
+        owner_cache[incoming_email_address] = (owner, now + OWNER_CACHE_TTL_SECONDS)
+    return owner
+
+
+def get_routing_rules_item():
+    """Returns the item holding the routing rules and their version"""
+    resp = account_table.get_item(Key={ACCOUNT_EMAIL: ROUTING_RULES_KEY})
+    return resp.get("Item", {})
+
+
+def is_address_suppressed(address: str) -> bool:
+    """True when the address was suppressed after a bounce or complaint.
+    The TTL deletes expired items late, so their expiry is checked too"""
+    resp = account_table.get_item(
+        Key={ACCOUNT_EMAIL: SUPPRESSION_KEY_PREFIX + address}, ProjectionExpression=EXPIRES_AT
+    )
+    item = resp.get("Item")
+    return bool(item) and int(item.get(EXPIRES_AT, 0)) > time.time()
@@ -0,0 +1,96 @@
+"""Library for fitting the work of an invocation into its remaining time
+
+The deadline of the invocation is taken from the Lambda context.  Each stage
+of forwarding a message (routing, download, send) is timed and its latency
+smoothed over the life of the container.  A message is only started when
+the estimate of all its stages fits in the remaining time less a safety
+margin, and each stage gets the time left once the estimates of the stages
+after it are set aside.  Messages that do not fit are handed back for retry."""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import contextlib
+import os
+import threading
+import time
+
+# Time kept free at the end of the invocation to hand the rest back and to
+# write the delivery log and metrics
+DEADLINE_SAFETY_MARGIN_MS = int(os.getenv("DEADLINE_SAFETY_MARGIN_MS", "500"))
+# Weight of the latest measurement in the latency estimates
+SMOOTHING = 0.2
+# Estimate of a stage before it was measured
+INITIAL_ESTIMATE_MS = 200
+# Stages in the order a message goes through them
+ROUTE = "route"
+FETCH = "fetch"
+SEND = "send"
+STAGES = [ROUTE, FETCH, SEND]
+
+invocation_deadline = None
+estimates = {}
+estimates_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The work does not fit in the remaining time of the invocation"""
+
+
+def start_invocation(context):
+    """Take the deadline of the invocation from its context.  Invocations
+    without a context, such as tests and tools, have no deadline"""
+    global invocation_deadline
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    invocation_deadline = time.monotonic() + get_remaining_time() / 1000 if get_remaining_time else None
+
+
+def remaining_ms() -> float | None:
+    """Milliseconds left before the safety margin, None without a deadline"""
+    if invocation_deadline is None:
+        return None
+    return (invocation_deadline - time.monotonic()) * 1000 - DEADLINE_SAFETY_MARGIN_MS
+
+
+def get_estimate(stage: str) -> float:
+    with estimates_lock:
+        return estimates.get(stage, INITIAL_ESTIMATE_MS)
+
+
+def record(stage: str, latency_ms: float):
+    """Add a measured latency of `stage` to its moving average"""
+    with estimates_lock:
+        previous = estimates.get(stage)
+        estimates[stage] = latency_ms if previous is None else previous + SMOOTHING * (latency_ms - previous)
+
+
+@contextlib.contextmanager
+def timed(stage: str):
+    """Time the block and add it to the estimate of `stage`.  Stages cut
+    short by the deadline are not recorded"""
+    start = time.monotonic()
+    yield
+    record(stage, (time.monotonic() - start) * 1000)
+
+
+def can_start() -> bool:
+    """True when a whole message is expected to fit in the remaining time"""
+    remaining = remaining_ms()
+    return remaining is None or remaining >= sum(get_estimate(stage) for stage in STAGES)
+
+
+def stage_deadline(stage: str) -> float | None:
+    """Returns the monotonic time `stage` must be done by, which leaves the
+    estimated time of the later stages.  Raises DeadlineExceeded when the
+    stage is expected not to fit, so it is not started"""
+    remaining = remaining_ms()
+    if remaining is None:
+        return None
+    later = sum(get_estimate(s) for s in STAGES[STAGES.index(stage) + 1:])
+    available = remaining - later
+    if available < get_estimate(stage):
+        raise DeadlineExceeded(f"{available:.0f} ms left for the {stage} stage, it takes about {get_estimate(stage):.0f} ms")
+    return time.monotonic() + available / 1000
+
+
+def seconds_left(until: float | None) -> float | None:
+    """Seconds before the monotonic time `until`, as a timeout to wait for"""
+    return None if until is None else max(0.0, until - time.monotonic())
@@ -0,0 +1,245 @@
+"""Library for collapsing identical messages sent to many aliases of one owner
+
+Messages are fingerprinted by their normalized subject and a hash of the
+decoded content of their parts, with the alias and account IDs masked in the
+text parts.  The first message of a
+fingerprint for an owner is forwarded as usual and opens a group in the state
+table.  Copies arriving within DEDUP_WINDOW_SECONDS only add their alias to
+the group, which is forwarded once more when the window ends, listing every
+alias it was received for."""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import email
+import hashlib
+import json
+import os
+import re
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import boto3
+import ddb
+import snapstart
+
+CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
+DEDUP_QUEUE_URL = os.getenv("DEDUP_QUEUE_URL")
+# SQS delays messages by at most 15 minutes
+DEDUP_WINDOW_SECONDS = min(int(os.getenv("DEDUP_WINDOW_SECONDS", "60")), 900)
+STATE_TABLE_NAME = os.getenv("STATE_TABLE_NAME")
+# Groups are kept a day after their window so late flushes still find them
+RETENTION_SECONDS = 86400
+KEY_PREFIX = "dedup#"
+ACCOUNT_ID = re.compile(rb"(?<!\d)\d{12}(?!\d)")
+SUBJECT_PREFIX = re.compile(r"^((re|fw|fwd)\s*:\s*)+", re.IGNORECASE)
+# Field Names
+STATE_KEY = "Key"
+GROUP_ID = "GroupId"
+OWNER = "Owner"
+FIRST_ALIAS = "FirstAlias"
+ALIASES = "Aliases"
+BUCKET = "Bucket"
+OBJECT_KEY = "ObjectKey"
+CLOSES_AT = "ClosesAt"
+FLUSH_SCHEDULED = "FlushScheduled"
+FLUSHED = "Flushed"
+SENDING = "Sending"
+SENT = "Sent"
+EXPIRES_AT = "ExpiresAt"
+
+state_table = None
+sqs = None
+
+
+@snapstart.register_after_restore
+def create_clients():
+    """Create the clients, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global state_table, sqs
+    if DEDUP_QUEUE_URL:
+        state_table = boto3.resource("dynamodb", region_name=CURRENT_REGION).Table(STATE_TABLE_NAME)
+        sqs = boto3.client("sqs")
+
+
+create_clients()
+
+
+def mask_alias(data: bytes, alias: str) -> bytes:
+    """Replace the alias, its local part and account IDs, which differ
+    between the copies of a notice sent to each account"""
+    local_part = alias.split("@", 1)[0]
+    for value in sorted({alias, local_part}, key=len, reverse=True):
+        data = re.sub(re.escape(value.encode()), b"#", data, flags=re.IGNORECASE)
+    return ACCOUNT_ID.sub(b"#", data)
+
+
+def get_fingerprint(alias: str, subject: str, file: bytes) -> str:
+    """Returns the fingerprint of a message.  Parts are hashed once their
+    transfer encoding is decoded, so the MIME boundaries, which are random per
+    message, and base64 or quoted-printable encoding of the alias do not make
+    copies differ"""
+    normalized_subject = " ".join(SUBJECT_PREFIX.sub("", subject).lower().split())
+    digest = hashlib.sha256(mask_alias(normalized_subject.encode(), alias))
+    for part in email.message_from_bytes(file).walk():
+        if part.is_multipart():
+            continue
+        content = part.get_payload(decode=True) or b""
+        if part.get_content_maintype() == "text":
+            content = mask_alias(content, alias)
+        digest.update(b"\0" + part.get_content_type().encode() + b"\0")
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def get_group_key(owner: str, fingerprint: str) -> str:
+    return f"{KEY_PREFIX}{owner.lower()}#{fingerprint}"
+
+
+def collect(owner: str, alias: str, decoded_message: dict, file: bytes) -> bool:
+    """Add the message to the open group of identical messages for `owner`.
+    Returns True when it was collected and must not be forwarded now, False
+    when it opened a group or could not join one and is forwarded"""
+    mail = decoded_message.get("mail")
+    action = decoded_message.get("receipt").get("action")
+    message_id = mail.get("messageId")
+    key = get_group_key(owner, get_fingerprint(alias, mail.get("commonHeaders", {}).get("subject", ""), file))
+    conditional_check_failed = ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException
+    now = int(time.time())
+    try:
+        resp = state_table.update_item(
+            Key={STATE_KEY: key},
+            UpdateExpression="ADD #a :alias SET #s = :true",
+            ConditionExpression="#c > :now AND attribute_not_exists(#f) AND #g <> :id",
+            ExpressionAttributeNames={
+                "#a": ALIASES, "#s": FLUSH_SCHEDULED, "#c": CLOSES_AT, "#f": FLUSHED, "#g": GROUP_ID,
+            },
+            ExpressionAttributeValues={":alias": {alias}, ":true": True, ":now": now, ":id": message_id},
+            ReturnValues="ALL_OLD",
+        )
+    except conditional_check_failed:
+        pass
+    else:
+        group = resp["Attributes"]
+        if not group.get(FLUSH_SCHEDULED):
+            # The first copy schedules the flush of the group at its end
+            schedule_flush(key, group[GROUP_ID], int(group[CLOSES_AT]) - now)
+        return True
+
+    try:
+        state_table.put_item(
+            Item={
+                STATE_KEY: key,
+                GROUP_ID: message_id,
+                OWNER: owner,
+                FIRST_ALIAS: alias,
+                ALIASES: {alias},
+                BUCKET: action.get("bucketName"),
+                OBJECT_KEY: action.get("objectKey"),
+                CLOSES_AT: now + DEDUP_WINDOW_SECONDS,
+                EXPIRES_AT: now + DEDUP_WINDOW_SECONDS + RETENTION_SECONDS,
+            },
+            # Closed groups with copies keep their item until they were sent
+            ConditionExpression=(
+                "attribute_not_exists(#k) OR attribute_exists(#sent) OR #e < :now"
+                " OR (#c <= :now AND attribute_not_exists(#s))"
+            ),
+            ExpressionAttributeNames={
+                "#k": STATE_KEY, "#sent": SENT, "#e": EXPIRES_AT, "#c": CLOSES_AT, "#s": FLUSH_SCHEDULED,
+            },
+            ExpressionAttributeValues={":now": now},
+        )
+    except conditional_check_failed:
+        # A retry of the message that opened the group, another copy opened
+        # it first or its flush is pending
+        pass
+    return False
+
+
+def schedule_flush(key: str, group_id: str, delay: int):
+    """Queue the flush of a group.  On failure the schedule is cleared so the
+    retry of the message schedules it again"""
+    try:
+        sqs.send_message(
+            QueueUrl=DEDUP_QUEUE_URL,
+            MessageBody=json.dumps({STATE_KEY: key, GROUP_ID: group_id}),
+            DelaySeconds=max(0, min(delay, 900)),
+        )
+    except Exception:
+        state_table.update_item(
+            Key={STATE_KEY: key},
+            UpdateExpression="REMOVE #s",
+            ExpressionAttributeNames={"#s": FLUSH_SCHEDULED},
+        )
+        raise
+
+
+def close_group(key: str, group_id: str) -> dict | None:
+    """Stop copies from joining the group and return it, or None when it was
+    already sent or replaced"""
+    try:
+        resp = state_table.update_item(
+            Key={STATE_KEY: key},
+            UpdateExpression="SET #f = :true",
+            ConditionExpression="#g = :id AND attribute_not_exists(#sent)",
+            ExpressionAttributeNames={"#f": FLUSHED, "#g": GROUP_ID, "#sent": SENT},
+            ExpressionAttributeValues={":true": True, ":id": group_id},
+            ReturnValues="ALL_NEW",
+        )
+    except ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        return None
+    return resp["Attributes"]
+
+
+def claim_send(key: str, group_id: str) -> bool:
+    """Claim the send of the group right before it is sent.  Returns False
+    when it was claimed before, the group may then have been sent by a flush
+    that was interrupted before `mark_sent` and is not sent again"""
+    try:
+        state_table.update_item(
+            Key={STATE_KEY: key},
+            UpdateExpression="SET #sending = :now",
+            ConditionExpression="#g = :id AND attribute_not_exists(#sent) AND attribute_not_exists(#sending)",
+            ExpressionAttributeNames={"#sending": SENDING, "#g": GROUP_ID, "#sent": SENT},
+            ExpressionAttributeValues={":now": int(time.time()), ":id": group_id},
+        )
+    except ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+
+def release_send(key: str):
+    """Drop the claim of a send that SES did not accept so a retry sends it"""
+    state_table.update_item(
+        Key={STATE_KEY: key},
+        UpdateExpression="REMOVE #sending",
+        ExpressionAttributeNames={"#sending": SENDING},
+    )
+
+
+def mark_sent(key: str):
+    state_table.update_item(
+        Key={STATE_KEY: key},
+        UpdateExpression="SET #sent = :true",
+        ExpressionAttributeNames={"#sent": SENT},
+        ExpressionAttributeValues={":true": True},
+    )
+
+
+def add_alias_list(file: bytes, first_alias: str, aliases: list[str]) -> bytes:
+    """Returns the message with a text part listing the aliases it was
+    received for ahead of its original content"""
+    original = email.message_from_bytes(file)
+    summary = MIMEMultipart("mixed")
+    for name, value in original.items():
+        if not name.lower().startswith("content-") and name.lower() != "mime-version":
+            summary[name] = value
+    # The original message keeps only its content headers and becomes a part
+    for name in set(original.keys()):
+        if not name.lower().startswith("content-"):
+            del original[name]
+    summary.attach(MIMEText(
+        f"This message was received for {len(aliases)} of your account aliases within "
+        f"{DEDUP_WINDOW_SECONDS} seconds.  The copy for {first_alias} was forwarded on its own, "
+        "the other copies are collapsed into this message:\n\n" + "\n".join(aliases) + "\n"
+    ))
+    summary.attach(original)
+    return summary.as_bytes()
@@ -0,0 +1,114 @@
+"""Library for recording the outcome of every message in the delivery log table"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+import snapstart
+
+CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
+# Optional table the delivery records are written to
+DELIVERY_LOG_TABLE_NAME = os.getenv("DELIVERY_LOG_TABLE_NAME")
+DELIVERY_LOG_RETENTION_DAYS = int(os.getenv("DELIVERY_LOG_RETENTION_DAYS", "90"))
+# Outcomes
+FORWARDED = "FORWARDED"
+REROUTED = "REROUTED"
+NO_RECIPIENT = "NO_RECIPIENT"
+DROPPED = "DROPPED"
+QUARANTINED = "QUARANTINED"
+RATE_LIMITED = "RATE_LIMITED"
+SUPPRESSED = "SUPPRESSED"
+DIGESTED = "DIGESTED"
+DEDUPLICATED = "DEDUPLICATED"
+DEFERRED = "DEFERRED"
+FAILED = "FAILED"
+# Field Names
+MESSAGE_ID = "MessageId"
+TIMESTAMP = "Timestamp"
+ALIAS = "Alias"
+OWNER = "Owner"
+OUTCOME = "Outcome"
+SIZE = "Size"
+LATENCY_MS = "LatencyMs"
+S3_KEY = "S3Key"
+EXPIRES_AT = "ExpiresAt"
+logger = logging.getLogger("FWD-EMAIL")
+
+delivery_log_table = None
+# Records collected during the current invocation
+records = []
+# Messages may be forwarded from several threads in async mode
+records_lock = threading.Lock()
+
+
+@snapstart.register_after_restore
+def create_clients():
+    """Create the table, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global delivery_log_table
+    if DELIVERY_LOG_TABLE_NAME:
+        delivery_log_table = boto3.resource("dynamodb", region_name=CURRENT_REGION).Table(
+            DELIVERY_LOG_TABLE_NAME
+        )
+
+
+create_clients()
+
+
+def get_latency_ms(timestamp: str | None, now: float) -> int | None:
+    """Returns the time since SES received the message, None when the
+    notification has no usable timestamp"""
+    try:
+        return int((now - datetime.fromisoformat(timestamp).timestamp()) * 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+def record(decoded_message: dict, alias: str, outcome: str, owner: str | None = None, size: int | None = None):
+    """Collect the delivery record of a message, it is written by `flush`.
+    The latency is measured from the time SES received the message"""
+    if not delivery_log_table:
+        return
+    mail = decoded_message.get("mail")
+    now = time.time()
+    item = {
+        MESSAGE_ID: mail.get("messageId"),
+        # The indexes sort by it, so messages without one get the current time
+        TIMESTAMP: mail.get("timestamp")
+        or time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now % 1 * 1000):03d}Z",
+        ALIAS: alias,
+        OUTCOME: outcome,
+        S3_KEY: decoded_message.get("receipt").get("action").get("objectKey"),
+        EXPIRES_AT: int(now) + DELIVERY_LOG_RETENTION_DAYS * 86400,
+    }
+    latency_ms = get_latency_ms(mail.get("timestamp"), now)
+    if latency_ms is not None:
+        item[LATENCY_MS] = latency_ms
+    # Left out rather than empty so the records are missing from the owner index
+    if owner:
+        item[OWNER] = owner
+    if size is not None:
+        item[SIZE] = size
+    with records_lock:
+        records.append(item)
+
+
+def flush():
+    """Write the collected records in batches after the messages were handled,
+    so logging adds no latency to forwarding.  A failure is only logged as the
+    messages must not be forwarded again because their records were lost"""
+    global records
+    with records_lock:
+        if not records:
+            return
+        pending, records = records, []
+    try:
+        with delivery_log_table.batch_writer(overwrite_by_pkeys=[MESSAGE_ID]) as batch:
+            for item in pending:
+                batch.put_item(Item=item)
+    except (BotoCoreError, ClientError) as e:
+        logger.warning("Unable to write %d delivery records: %s", len(pending), e)
@@ -0,0 +1,43 @@
+"""Library for buffering catch-all messages for the admin digest"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import boto3
+import snapstart
+
+DIGEST_QUEUE_URL = os.getenv("DIGEST_QUEUE_URL")
+# Which catch-all messages are summarized in the digest instead of being
+# forwarded one by one: ALL of them or only those OVER_LIMIT of the rate limits
+ALL = "ALL"
+OVER_LIMIT = "OVER_LIMIT"
+DIGEST_CATCH_ALL = os.getenv("DIGEST_CATCH_ALL", ALL).upper() if DIGEST_QUEUE_URL else None
+
+sqs = None
+
+
+@snapstart.register_after_restore
+def create_clients():
+    """Create the client, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global sqs
+    sqs = boto3.client("sqs") if DIGEST_QUEUE_URL else None
+
+
+create_clients()
+
+
+def buffer_message(decoded_message: dict):
+    """Queue a summary of the message described by `decoded_message`"""
+    mail = decoded_message.get("mail")
+    receipt = decoded_message.get("receipt")
+    entry = {
+        "MessageId": mail.get("messageId"),
+        "Timestamp": mail.get("timestamp"),
+        "Source": mail.get("source"),
+        "Destination": receipt.get("recipients")[0],
+        "Subject": mail.get("commonHeaders", {}).get("subject", ""),
+        "Bucket": receipt.get("action").get("bucketName"),
+        "ObjectKey": receipt.get("action").get("objectKey"),
+    }
+    sqs.send_message(QueueUrl=DIGEST_QUEUE_URL, MessageBody=json.dumps(entry))
@@ -0,0 +1,46 @@
+"""Library for publishing CloudWatch metrics using the Embedded Metric Format"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import threading
+import time
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "AwsMailFwd")
+SERVICE_NAME = "fwdEmail"
+
+# Counters collected during the current invocation
+counters = {}
+# Messages may be forwarded from several threads in async mode
+counters_lock = threading.Lock()
+
+
+def add_count(name: str, value: int = 1):
+    """Increment the counter `name` by `value`"""
+    with counters_lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+def flush():
+    """Write the collected counters as one EMF log line and reset them.
+    CloudWatch extracts the metrics from the log line, so no API call is made"""
+    with counters_lock:
+        if not counters:
+            return
+        snapshot = dict(counters)
+        counters.clear()
+    document = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Service"]],
+                    "Metrics": [{"Name": name, "Unit": "Count"} for name in snapshot],
+                }
+            ],
+        },
+        "Service": SERVICE_NAME,
+        **snapshot,
+    }
+    print(json.dumps(document))
@@ -0,0 +1,40 @@
+"""Library for applying a policy to the SES receipt verdicts of a message"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+
+# Actions, ordered from the least to the most severe
+ALLOW = "ALLOW"
+QUARANTINE = "QUARANTINE"
+DROP = "DROP"
+ACTIONS = [ALLOW, QUARANTINE, DROP]
+
+FAIL_STATUS = "FAIL"
+
+# Receipt verdict fields and the action taken when their status is FAIL
+VERDICT_ACTIONS = {
+    "spamVerdict": os.getenv("SPAM_VERDICT_ACTION", ALLOW).upper(),
+    "virusVerdict": os.getenv("VIRUS_VERDICT_ACTION", ALLOW).upper(),
+    "spfVerdict": os.getenv("SPF_VERDICT_ACTION", ALLOW).upper(),
+    "dkimVerdict": os.getenv("DKIM_VERDICT_ACTION", ALLOW).upper(),
+    "dmarcVerdict": os.getenv("DMARC_VERDICT_ACTION", ALLOW).upper(),
+}
+for verdict, verdict_action in VERDICT_ACTIONS.items():
+    if verdict_action not in ACTIONS:
+        raise ValueError(
+            f"Invalid action {verdict_action} for {verdict}, must be one of {ACTIONS}"
+        )
+
+
+def evaluate(receipt: dict) -> tuple[str, list[str]]:
+    """Returns the most severe action configured for the verdicts that failed
+    in the SES `receipt` along with the names of those verdicts"""
+    action = ALLOW
+    failed_verdicts = []
+    for verdict, verdict_action in VERDICT_ACTIONS.items():
+        if receipt.get(verdict, {}).get("status") != FAIL_STATUS:
+            continue
+        failed_verdicts.append(verdict)
+        if ACTIONS.index(verdict_action) > ACTIONS.index(action):
+            action = verdict_action
+    return action, failed_verdicts
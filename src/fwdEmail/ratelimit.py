@@ -0,0 +1,121 @@
+"""Library for rate limiting the forwarding of catch-all messages"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+import boto3
+import snapstart
+
+CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
+WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+# Maximum forwards per window, 0 disables the limit
+SENDER_LIMIT = int(os.getenv("RATE_LIMIT_PER_SENDER", "0"))
+ALIAS_LIMIT = int(os.getenv("RATE_LIMIT_PER_ALIAS", "0"))
+# Share the counters between concurrent containers in the state table, which
+# may also be deployed for deduplication only
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", False)
+STATE_TABLE_NAME = os.getenv("STATE_TABLE_NAME")
+# Bounds the memory used when a flood comes from many different addresses
+MAX_TRACKED_KEYS = 10000
+# Field Names
+STATE_KEY = "Key"
+HITS = "Hits"
+EXPIRES_AT = "ExpiresAt"
+
+state_table = None
+
+
+@snapstart.register_after_restore
+def create_clients():
+    """Create the table, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global state_table
+    if RATE_LIMIT_SHARED and STATE_TABLE_NAME:
+        state_table = boto3.resource("dynamodb", region_name=CURRENT_REGION).Table(
+            STATE_TABLE_NAME
+        )
+
+
+create_clients()
+
+
+class SlidingWindowLimiter:
+    """Counts hits per key over the last `window_seconds`.  Hits are kept in
+    memory for the container and, when a state table is configured, in
+    DynamoDB using a weighted sum of the current and previous fixed windows"""
+
+    def __init__(self, name: str, limit: int, window_seconds: int = WINDOW_SECONDS):
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.hits = OrderedDict()
+        self.hits_lock = threading.Lock()
+        self.previous_counts = {}
+
+    def hit(self, key: str, now: float | None = None) -> bool:
+        """Record a hit for `key`, returns False when `key` is over the limit"""
+        if not self.limit:
+            return True
+        now = time.time() if now is None else now
+        count = self._local_count(key, now)
+        if state_table is not None and count <= self.limit:
+            count = self._shared_count(key, now)
+        return count <= self.limit
+
+    def _local_count(self, key: str, now: float) -> int:
+        # Messages may be forwarded from several threads in async mode
+        with self.hits_lock:
+            key_hits = self.hits.pop(key, None) or deque()
+            while key_hits and key_hits[0] <= now - self.window_seconds:
+                key_hits.popleft()
+            key_hits.append(now)
+            # Most recently hit keys are kept at the end
+            self.hits[key] = key_hits
+            while len(self.hits) > MAX_TRACKED_KEYS:
+                self.hits.popitem(last=False)
+            return len(key_hits)
+
+    def _item_key(self, key: str, window_start: int) -> str:
+        return f"ratelimit#{self.name}#{key}#{window_start}"
+
+    def _shared_count(self, key: str, now: float) -> float:
+        window_start = int(now // self.window_seconds) * self.window_seconds
+        resp = state_table.update_item(
+            Key={STATE_KEY: self._item_key(key, window_start)},
+            UpdateExpression=f"ADD {HITS} :one SET {EXPIRES_AT} = if_not_exists({EXPIRES_AT}, :expires)",
+            ExpressionAttributeValues={
+                ":one": 1,
+                ":expires": window_start + 3 * self.window_seconds,
+            },
+            ReturnValues="UPDATED_NEW",
+        )
+        current = int(resp["Attributes"][HITS])
+        previous = self._previous_count(key, window_start - self.window_seconds)
+        elapsed = (now - window_start) / self.window_seconds
+        return current + previous * (1 - elapsed)
+
+    def _previous_count(self, key: str, window_start: int) -> int:
+        """The previous window is closed, so its count is read only once"""
+        cache_key = (key, window_start)
+        if cache_key not in self.previous_counts:
+            if len(self.previous_counts) > MAX_TRACKED_KEYS:
+                self.previous_counts.clear()
+            resp = state_table.get_item(Key={STATE_KEY: self._item_key(key, window_start)})
+            self.previous_counts[cache_key] = int(resp.get("Item", {}).get(HITS, 0))
+        return self.previous_counts[cache_key]
+
+
+sender_limiter = SlidingWindowLimiter("sender", SENDER_LIMIT)
+alias_limiter = SlidingWindowLimiter("alias", ALIAS_LIMIT)
+
+
+def check(sender: str, alias: str) -> list[str]:
+    """Record a catch-all forward from `sender` to `alias`.  Returns the names
+    of the limits that were exceeded, an empty list means the forward is allowed"""
+    exceeded = []
+    for limiter, key in [(sender_limiter, sender), (alias_limiter, alias)]:
+        if not limiter.hit(key.lower()):
+            exceeded.append(limiter.name)
+    return exceeded
@@ -0,0 +1,140 @@
+"""Library for matching recipients against the domain routing rules"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import fnmatch
+import json
+import logging
+import os
+import re
+import time
+import ddb
+import snapstart
+
+# Rules defined in the configuration, e.g.
+# [{"Pattern": "*-prod-*@example.com", "Target": "on-call@example.com"}]
+ROUTING_RULES = os.getenv("ROUTING_RULES", "[]")
+# Read additional rules from the routing rules item of the account table
+ROUTING_RULES_IN_TABLE = os.getenv("ROUTING_RULES_IN_TABLE", False)
+# How often the version of the rules in the table is checked
+ROUTING_RULES_REFRESH_SECONDS = int(os.getenv("ROUTING_RULES_REFRESH_SECONDS", "60"))
+# When set, sub-addresses (user+tag@domain with "+") are looked up without their tag
+SUBADDRESS_DELIMITER = os.getenv("SUBADDRESS_DELIMITER", "")
+WILDCARDS = "*?["
+# Field Names
+PATTERN = "Pattern"
+TARGET = "Target"
+logger = logging.getLogger("FWD-EMAIL")
+
+
+def normalize_address(address: str) -> str:
+    """Removes the sub-address tag from `address`"""
+    if not SUBADDRESS_DELIMITER or "@" not in address:
+        return address
+    local_part, domain = address.rsplit("@", 1)
+    return local_part.split(SUBADDRESS_DELIMITER, 1)[0] + "@" + domain
+
+
+class RuleMatcher:
+    """Matches addresses against compiled routing rules.  The first rule
+    matching an address in the order they were defined wins.  Exact patterns
+    are kept in a dict and patterns with a single leading or trailing wildcard
+    in tries, so only the other patterns are matched as regexes.  Each of
+    them finds its first matching rule and the earliest of those wins"""
+
+    def __init__(self, rules: list[dict]):
+        self.exact = {}
+        self.prefixes = {}
+        self.suffixes = {}
+        regexes = []
+        self.regex_rules = []
+        for index, rule in enumerate(rules):
+            pattern = rule.get(PATTERN, "").lower()
+            target = rule.get(TARGET)
+            if not pattern or not target:
+                logger.warning("Ignoring invalid routing rule %s", rule)
+            elif not any(c in pattern for c in WILDCARDS):
+                self.exact.setdefault(pattern, (index, target))
+            elif pattern.count("*") == 1 and pattern.endswith("*") and not any(c in pattern for c in "?["):
+                self._add_to_trie(self.prefixes, pattern[:-1], (index, target))
+            elif pattern.count("*") == 1 and pattern.startswith("*") and not any(c in pattern for c in "?["):
+                self._add_to_trie(self.suffixes, pattern[:0:-1], (index, target))
+            else:
+                regexes.append(f"(?P<r{len(regexes)}>{fnmatch.translate(pattern)})")
+                self.regex_rules.append((index, target))
+        # All other patterns are combined into one regex so each address is
+        # scanned once, the first alternative that matches wins
+        self.regex = re.compile("|".join(regexes)) if regexes else None
+
+    @staticmethod
+    def _add_to_trie(trie: dict, key: str, rule: tuple[int, str]):
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, rule)
+
+    @staticmethod
+    def _first_match(trie: dict, key: str) -> tuple[int, str] | None:
+        """Returns the earliest rule whose key is a prefix of `key`"""
+        node = trie
+        first = node.get(None)
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            rule = node.get(None)
+            if rule and (first is None or rule < first):
+                first = rule
+        return first
+
+    def match(self, address: str) -> str | None:
+        """Returns the target of the first rule matching `address` or None"""
+        address = address.lower()
+        candidates = [
+            self.exact.get(address),
+            self._first_match(self.prefixes, address),
+            self._first_match(self.suffixes, address[::-1]),
+        ]
+        if self.regex is not None:
+            found = self.regex.match(address)
+            if found:
+                candidates.append(self.regex_rules[int(found.lastgroup[1:])])
+        first = min((rule for rule in candidates if rule), default=None)
+        return first[1] if first else None
+
+
+config_rules = json.loads(ROUTING_RULES)
+matcher = RuleMatcher(config_rules)
+table_rules_version = None
+table_rules_checked_at = float("-inf")
+
+
+@snapstart.register_after_restore
+def reset_refresh_timer():
+    """The monotonic clock of a restored environment is unrelated to the one
+    the snapshot was taken with, so check the version again on first use"""
+    global table_rules_checked_at
+    table_rules_checked_at = float("-inf")
+
+
+def get_matcher() -> RuleMatcher:
+    """Returns the compiled rules, recompiling them when the version of the
+    rules in the table changed"""
+    global matcher, table_rules_version, table_rules_checked_at
+    now = time.monotonic()
+    if not ROUTING_RULES_IN_TABLE or now - table_rules_checked_at < ROUTING_RULES_REFRESH_SECONDS:
+        return matcher
+    table_rules_checked_at = now
+    item = ddb.get_routing_rules_item()
+    version = item.get(ddb.VERSION)
+    if version != table_rules_version:
+        logger.info("Loading version %s of the routing rules", version)
+        # Rules from the table are listed first so they take precedence over
+        # the configured rules
+        matcher = RuleMatcher(item.get(ddb.RULES, []) + config_rules)
+        table_rules_version = version
+    return matcher
+
+
+def match(address: str) -> str | None:
+    """Returns the target address of the rule matching `address` or None"""
+    return get_matcher().match(address)
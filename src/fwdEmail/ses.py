@@ -4,30 +4,74 @@
 import os
 import boto3
 import email
+import threading
+import time
 from botocore.exceptions import ClientError
+import snapstart
 
 region = os.getenv("AWS_REGION", "us-east-1")
+QUARANTINE_PREFIX = os.getenv("QUARANTINE_PREFIX", "quarantine/")
+# Configuration set publishing bounces and complaints of forwarded messages
+SES_CONFIGURATION_SET = os.getenv("SES_CONFIGURATION_SET")
+# Cancelled and late downloads stop after the chunk being read
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
 
-# Create a new SES client.
-client_ses = boto3.client("ses")
-# Create a new S3 client.
-s3 = boto3.resource("s3")
+client_ses = None
+s3 = None
 
 
-def get_message_from_s3(incoming_email_bucket, object_path):
+@snapstart.register_after_restore
+def create_clients():
+    """Create the clients, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global client_ses, s3
+    # Create a new SES client.
+    client_ses = boto3.client("ses")
+    # Create a new S3 client.
+    s3 = boto3.resource("s3")
+
+
+create_clients()
+
+
+def get_message_from_s3(
+    incoming_email_bucket, object_path, cancelled: threading.Event | None = None, until: float | None = None
+):
+    """Download the message.  Returns None when `cancelled` is set before the
+    download finished, the rest of the body is then not read.  Raises
+    TimeoutError when the download is not done by the monotonic time `until`"""
 
     object_http_path = f"http://s3.console.aws.amazon.com/s3/object/{incoming_email_bucket}/{object_path}?region={region}"
 
+    if cancelled and cancelled.is_set():
+        return None
     # Get the email object from the S3 bucket.
-    object_s3 = s3.Object(incoming_email_bucket, object_path)
-    meta = object_s3.get()["Metadata"]
-    file = object_s3.get()["Body"].read()
-
-    file_dict = {"file": file, "path": object_http_path}
+    body = s3.Object(incoming_email_bucket, object_path).get()["Body"]
+    chunks = []
+    while chunk := body.read(DOWNLOAD_CHUNK_BYTES):
+        if cancelled and cancelled.is_set():
+            body.close()
+            return None
+        if until is not None and time.monotonic() > until:
+            body.close()
+            raise TimeoutError(f"Download of {object_path} did not finish in time")
+        chunks.append(chunk)
+
+    file_dict = {"file": b"".join(chunks), "path": object_http_path}
 
     return file_dict
 
 
+def quarantine_message(incoming_email_bucket, object_path):
+    """Copy the message to the quarantine prefix of the bucket. The copy is done
+    by S3 so the message is never downloaded"""
+    quarantine_path = QUARANTINE_PREFIX + object_path.rsplit("/", 1)[-1]
+    s3.Object(incoming_email_bucket, quarantine_path).copy_from(
+        CopySource={"Bucket": incoming_email_bucket, "Key": object_path}
+    )
+    return quarantine_path
+
+
 def create_message(address_from, address_to, file_dict):
     """Create multi-part MIME message"""
 
@@ -56,11 +100,15 @@ def create_message(address_from, address_to, file_dict):
 
 def send_email(message):
     """Use SES to send the `message`"""
+    send_kwargs = {}
+    if SES_CONFIGURATION_SET:
+        send_kwargs["ConfigurationSetName"] = SES_CONFIGURATION_SET
     try:
         response = client_ses.send_raw_email(
             Source=message["Source"],
             Destinations=[message["Destinations"]],
             RawMessage={"Data": message["Data"]},
+            **send_kwargs,
         )
     except ClientError as e:
         if e.response["Error"]["Code"] == "MessageRejected":
@@ -0,0 +1,45 @@
+"""Library for checking recipients against the addresses suppressed after bounces and complaints"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import logging
+import os
+import time
+import ddb
+import snapstart
+
+# What happens to messages for a suppressed recipient, None disables the check
+REROUTE = "REROUTE"
+DROP = "DROP"
+SUPPRESSED_RECIPIENT_ACTION = os.getenv("SUPPRESSED_RECIPIENT_ACTION")
+# How long the suppression of an address read from the account table is kept
+SUPPRESSION_REFRESH_SECONDS = int(os.getenv("SUPPRESSION_REFRESH_SECONDS", "60"))
+# The checked addresses are forgotten at once when there are more
+SUPPRESSION_CACHE_MAX_ENTRIES = 10000
+logger = logging.getLogger("FWD-EMAIL")
+
+# Lower case address -> (suppressed, monotonic time it was read)
+suppression_cache = {}
+
+
+@snapstart.register_after_restore
+def clear_cache():
+    """The monotonic clock of a restored environment is unrelated to the one
+    the snapshot was taken with, so read the addresses again on first use"""
+    suppression_cache.clear()
+
+
+def is_suppressed(address: str) -> bool:
+    """True when the address is suppressed, reading it from the table at most
+    once per SUPPRESSION_REFRESH_SECONDS"""
+    if not SUPPRESSED_RECIPIENT_ACTION:
+        return False
+    address = address.lower()
+    now = time.monotonic()
+    cached = suppression_cache.get(address)
+    if cached and now - cached[1] < SUPPRESSION_REFRESH_SECONDS:
+        return cached[0]
+    if len(suppression_cache) >= SUPPRESSION_CACHE_MAX_ENTRIES:
+        suppression_cache.clear()
+    suppressed = ddb.is_address_suppressed(address)
+    suppression_cache[address] = (suppressed, now)
+    return suppressed
@@ -0,0 +1,30 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import sys
+import logging
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+import ddb
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+logger = logging.getLogger("MAPPING-VERSION")
+logging.getLogger().setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+
+
+def changed_account(record: dict) -> str | None:
+    """Returns the account email of a stream record, None for control items"""
+    key = record.get("dynamodb", {}).get("Keys", {}).get(ddb.ACCOUNT_EMAIL, {}).get("S", "")
+    return None if key.startswith(ddb.CONTROL_KEY_PREFIX) else key
+
+
+def lambda_handler(event, context):
+    # Writing the marker adds a record for a control item to the stream,
+    # which is skipped here so the function does not trigger itself
+    keys = sorted({key for key in map(changed_account, event.get("Records", [])) if key})
+    if not keys:
+        logger.info("No account changes in the stream records")
+        return
+    version = ddb.publish_changes(keys)
+    logger.info(f"Published mapping version {version} for {len(keys)} changed accounts")
@@ -0,0 +1,65 @@
+"""Library for managing operations with DynamoDB"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import os
+
+CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
+TABLE_NAME = os.getenv("TABLE_NAME")
+# Number of changed keys kept in the marker, older changes are pruned
+MAX_TRACKED_CHANGES = int(os.getenv("MAX_TRACKED_CHANGES", "1000"))
+MAX_ATTEMPTS = 5
+# Field Names
+ACCOUNT_EMAIL = "AccountEmail"
+VERSION = "Version"
+CHANGES = "Changes"
+SINCE = "Since"
+# Keys of the items holding settings rather than accounts start with this prefix
+CONTROL_KEY_PREFIX = "#"
+MAPPING_VERSION_KEY = CONTROL_KEY_PREFIX + "mapping-version"
+
+ddb = boto3.resource("dynamodb", region_name=CURRENT_REGION)
+account_table = ddb.Table(TABLE_NAME)
+
+
+def next_marker(item: dict, keys: list) -> dict:
+    """Returns the marker recording the changed keys under the next version.
+    When too many keys are tracked the oldest are pruned and Since is raised
+    to the newest pruned version, readers older than that drop all entries"""
+    version = int(item.get(VERSION, 0)) + 1
+    since = int(item.get(SINCE, 0))
+    changes = {key: int(changed_in) for key, changed_in in item.get(CHANGES, {}).items()}
+    changes.update({key: version for key in keys})
+    if len(changes) > MAX_TRACKED_CHANGES:
+        ordered = sorted(changes.items(), key=lambda change: change[1], reverse=True)
+        since = max([since] + [changed_in for _, changed_in in ordered[MAX_TRACKED_CHANGES:]])
+        changes = dict(ordered[:MAX_TRACKED_CHANGES])
+    return {ACCOUNT_EMAIL: MAPPING_VERSION_KEY, VERSION: version, SINCE: since, CHANGES: changes}
+
+
+def publish_changes(keys: list) -> int:
+    """Records the changed keys under a new mapping version and returns it.
+    The write is conditional on the version read, so concurrent publishers
+    never reuse a version"""
+    for _ in range(MAX_ATTEMPTS):
+        item = account_table.get_item(
+            Key={ACCOUNT_EMAIL: MAPPING_VERSION_KEY}, ConsistentRead=True
+        ).get("Item", {})
+        marker = next_marker(item, keys)
+        try:
+            if item:
+                account_table.put_item(
+                    Item=marker,
+                    ConditionExpression="#v = :v",
+                    ExpressionAttributeNames={"#v": VERSION},
+                    ExpressionAttributeValues={":v": item[VERSION]},
+                )
+            else:
+                account_table.put_item(
+                    Item=marker,
+                    ConditionExpression=f"attribute_not_exists({ACCOUNT_EMAIL})",
+                )
+            return marker[VERSION]
+        except ddb.meta.client.exceptions.ConditionalCheckFailedException:
+            continue
+    raise RuntimeError(f"Unable to publish the mapping version after {MAX_ATTEMPTS} attempts")
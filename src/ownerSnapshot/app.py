@@ -0,0 +1,34 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import sys
+import logging
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+import ddb
+import s3
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+logger = logging.getLogger("OWNER-SNAPSHOT")
+logging.getLogger().setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+
+
+def changes_accounts(record: dict) -> bool:
+    """Returns False for stream records of control items"""
+    key = record.get("dynamodb", {}).get("Keys", {}).get(ddb.ACCOUNT_EMAIL, {}).get("S", "")
+    return not key.startswith(ddb.CONTROL_KEY_PREFIX)
+
+
+def lambda_handler(event, context):
+    # Invoked by the account table stream and by a daily schedule which keeps
+    # the snapshot from expiring when the table does not change
+    records = event.get("Records")
+    if records is not None and not any(changes_accounts(r) for r in records):
+        logger.info("No account changes in the stream records")
+        return
+    # The table is small, so a full scan keeps the snapshot exact without
+    # having to merge individual changes
+    owners = ddb.get_all_owner_addresses()
+    etag = s3.publish_snapshot(owners)
+    logger.info(f"Published a snapshot of {len(owners)} owners with ETag {etag}")
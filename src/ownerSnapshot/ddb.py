@@ -0,0 +1,32 @@
+"""Library for managing operations with DynamoDB"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import os
+
+CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
+TABLE_NAME = os.getenv("TABLE_NAME")
+# Field Names
+ACCOUNT_EMAIL = "AccountEmail"
+OWNER_ADDRESS = "OwnerAddress"
+# Keys of the items holding settings rather than accounts start with this prefix
+CONTROL_KEY_PREFIX = "#"
+
+ddb = boto3.resource("dynamodb", region_name=CURRENT_REGION)
+account_table = ddb.Table(TABLE_NAME)
+
+
+def get_all_owner_addresses() -> dict:
+    """Returns the owner address of every account in the table"""
+    owners = {}
+    scan_kwargs = {"ProjectionExpression": f"{ACCOUNT_EMAIL}, {OWNER_ADDRESS}"}
+    while True:
+        resp = account_table.scan(**scan_kwargs)
+        for item in resp.get("Items", []):
+            if item[ACCOUNT_EMAIL].startswith(CONTROL_KEY_PREFIX):
+                continue
+            if item.get(OWNER_ADDRESS):
+                owners[item[ACCOUNT_EMAIL]] = item[OWNER_ADDRESS]
+        if "LastEvaluatedKey" not in resp:
+            return owners
+        scan_kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
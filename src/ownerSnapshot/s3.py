@@ -0,0 +1,35 @@
+"""Library for publishing the owner snapshot to S3"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gzip
+import json
+import os
+import boto3
+
+SNAPSHOT_BUCKET = os.getenv("OWNER_SNAPSHOT_BUCKET")
+SNAPSHOT_KEY = os.getenv("OWNER_SNAPSHOT_KEY", "snapshot/owners.json.gz")
+SNAPSHOT_FORMAT_VERSION = 1
+
+s3 = boto3.client("s3")
+
+
+def encode_snapshot(owners: dict) -> bytes:
+    """Returns the compressed snapshot, keys are sorted so an unchanged table
+    always produces the same bytes"""
+    document = {"FormatVersion": SNAPSHOT_FORMAT_VERSION, "Owners": owners}
+    return gzip.compress(
+        json.dumps(document, sort_keys=True, separators=(",", ":")).encode("utf-8"),
+        mtime=0,
+    )
+
+
+def publish_snapshot(owners: dict) -> str:
+    """Write the snapshot to S3, returns its ETag"""
+    resp = s3.put_object(
+        Bucket=SNAPSHOT_BUCKET,
+        Key=SNAPSHOT_KEY,
+        Body=encode_snapshot(owners),
+        ContentType="application/json",
+        ContentEncoding="gzip",
+    )
+    return resp["ETag"]
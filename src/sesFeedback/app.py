@@ -0,0 +1,43 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import sys
+import logging
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+import ddb
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+logger = logging.getLogger("SES-FEEDBACK")
+logging.getLogger().setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+
+
+def get_suppressed_recipients(notification: dict) -> set:
+    """Returns the recipients of a permanent bounce or a complaint in lower
+    case.  Transient bounces are retried by SES and do not suppress"""
+    # Configuration set events use eventType, identity notifications notificationType
+    event_type = notification.get("eventType") or notification.get("notificationType")
+    if event_type == "Bounce":
+        bounce = notification.get("bounce", {})
+        if bounce.get("bounceType") != "Permanent":
+            return set()
+        recipients = bounce.get("bouncedRecipients", [])
+    elif event_type == "Complaint":
+        recipients = notification.get("complaint", {}).get("complainedRecipients", [])
+    else:
+        return set()
+    return {r["emailAddress"].lower() for r in recipients if r.get("emailAddress")}
+
+
+def lambda_handler(event, context):
+    addresses = set()
+    for record in event.get("Records", []):
+        notification = json.loads(record.get("Sns", {}).get("Message", "{}"))
+        addresses |= get_suppressed_recipients(notification)
+    if not addresses:
+        logger.info("No permanent bounces or complaints in the notifications")
+        return
+    ddb.suppress_addresses(addresses)
+    logger.info(f"Suppressed {len(addresses)} addresses: {', '.join(sorted(addresses))}")
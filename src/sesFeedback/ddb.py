@@ -0,0 +1,39 @@
+"""Library for managing operations with DynamoDB"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import os
+import time
+
+CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
+TABLE_NAME = os.getenv("TABLE_NAME")
+# Suppressions expire this long after the last bounce or complaint
+SUPPRESSION_RETENTION_DAYS = int(os.getenv("SUPPRESSION_RETENTION_DAYS", "90"))
+# Field Names
+ACCOUNT_EMAIL = "AccountEmail"
+SUPPRESSED_AT = "SuppressedAt"
+EXPIRES_AT = "ExpiresAt"
+LAST_UPDATED = "LastUpdated"
+# Keys of the items holding settings rather than accounts start with this prefix
+CONTROL_KEY_PREFIX = "#"
+SUPPRESSION_KEY_PREFIX = CONTROL_KEY_PREFIX + "suppression#"
+
+ddb = boto3.resource("dynamodb", region_name=CURRENT_REGION)
+account_table = ddb.Table(TABLE_NAME)
+
+
+def suppress_addresses(addresses: set):
+    """Write a suppression item per address, read by the forwarder.  Another
+    bounce or complaint restarts its retention, it is deleted by the table's
+    TTL once it expires"""
+    now = int(time.time())
+    with account_table.batch_writer() as batch:
+        for address in addresses:
+            batch.put_item(
+                Item={
+                    ACCOUNT_EMAIL: SUPPRESSION_KEY_PREFIX + address,
+                    SUPPRESSED_AT: now,
+                    EXPIRES_AT: now + SUPPRESSION_RETENTION_DAYS * 86400,
+                    LAST_UPDATED: now,
+                }
+            )
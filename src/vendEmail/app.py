@@ -1,5 +1,6 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import logging
 import os
 import sys
 from warnings import warn
@@ -10,6 +11,11 @@ import utils
 from schema import Schema, Optional as schema_Optional, Regex, Or, And, SchemaError
 import ddb
 import ses
+import pool
+import idempotency
+import profiling
+import snapstart
+import log
 
 SES_DOMAIN_NAME = os.getenv("SES_DOMAIN_NAME")
 COUNTER_LENGTH = os.getenv("COUNTER_LENGTH", "3")  # Number of digits with leading zeros
@@ -41,6 +47,8 @@ VALID_ACCOUNT_TYPES = [
     "DataEngineering",
 ]
 DEFAULT_ENV = "eval"
+logger = logging.getLogger("VEND-EMAIL")
+log.setup()
 
 
 def valid_acct_length(thing: str):
@@ -75,6 +83,23 @@ provision_aws_account_schema = Schema(
 )
 
 
+@snapstart.register_before_snapshot
+def warm_up():
+    """Validate a sample request so the schema code paths are part of the
+    SnapStart snapshot"""
+    provision_aws_account_schema.validate(
+        {
+            ddb.OWNER_ADDRESS: "owner@example.com",
+            ddb.ACCOUNT_TYPE: VALID_ACCOUNT_TYPES[0],
+            ddb.TAGS: {
+                "BusinessUnit": "warm",
+                "ApplicationName": "up",
+                "Environment": list(ENV_TRANSLATE_TABLE)[0],
+            },
+        }
+    )
+
+
 def get_next_number(account_name):
     """Get all the records in the DB that match the account name
     Find the highest number of the Enum column and increment it by one"""
@@ -90,6 +115,27 @@ def format_number(input: int) -> str:
     return f"{input:0{COUNTER_LENGTH}d}"
 
 
+def get_name_prefix(metadata: dict) -> str:
+    """Returns the account name without its counter"""
+    BUS = metadata.get("BusinessUnit").lower()
+    APP = metadata.get("ApplicationName").lower()
+    ENV = ENV_TRANSLATE_TABLE.get(metadata.get("Environment"), DEFAULT_ENV)
+    return "-".join([BUS, APP, ENV])
+
+
+def claim_reserved_account_data(metadata: dict):
+    """Returns a touple of (account name, account email) claimed from the name
+    pool of the account name prefix, or None if there is no reserved name"""
+    if metadata.get(ddb.ACCOUNT_NAME) or metadata.get(ddb.ACCOUNT_EMAIL):
+        return None
+    prefix = get_name_prefix(metadata)
+    counter = pool.claim(prefix)
+    if counter is None:
+        return None
+    account_name = f"{prefix}-{counter}"
+    return account_name, pool.account_email(account_name)
+
+
 def get_new_account_data(metadata: dict):
     """Function will generate a touple of (account name, account email)
     from the given `metadata` dictionary.  `metadata` should contain the following
@@ -97,12 +143,9 @@ def get_new_account_data(metadata: dict):
     You can override the email address and account name by specifying
     `AccountName` and/or `AccountEmail` in the metadata"""
 
-    BUS = metadata.get("BusinessUnit").lower()
-    APP = metadata.get("ApplicationName").lower()
-    ENV = ENV_TRANSLATE_TABLE.get(metadata.get("Environment"), DEFAULT_ENV)
     AN_OVERRIDE = metadata.get(ddb.ACCOUNT_NAME)
     AE_OVERRIDE = metadata.get(ddb.ACCOUNT_EMAIL)
-    proposed_name = AN_OVERRIDE if AN_OVERRIDE else "-".join([BUS, APP, ENV])
+    proposed_name = AN_OVERRIDE if AN_OVERRIDE else get_name_prefix(metadata)
     if not AN_OVERRIDE:
         # Some customers only want to enable counters for certain account types
         # here is where you would implement that functionality if needed
@@ -125,44 +168,120 @@ def get_new_account_data(metadata: dict):
     return proposed_name, proposed_email
 
 
+def run_idempotent(key: str, vend, request: dict) -> dict:
+    """Vend once per idempotency key, repeats get the stored response"""
+    try:
+        stored, allocation = idempotency.claim(key)
+    except idempotency.InProgress as ip:
+        return utils.failed({"message": str(ip)})
+    if stored:
+        logger.info("Returning the stored response of a repeated request")
+        return stored
+    if allocation:
+        logger.info("Finishing the vend of %s started by an earlier call", allocation[0])
+    try:
+        response = vend(request, idempotency.allocation_key(key), allocation)
+    except Exception:
+        idempotency.release(key)
+        raise
+    # Failed vends are not stored so a repeat can succeed once the cause is fixed
+    if response["statusCode"] == 200:
+        idempotency.complete(key, response)
+    else:
+        idempotency.release(key)
+    return response
+
+
+@profiling.profiled
+@log.invocation
 def lambda_handler(event, context):
+    try:
+        key = idempotency.get_client_key(event)
+    except ValueError as ve:
+        return utils.failed({"message": str(ve)})
+    # Repeats of a request share the client's key, the request ID is logged anyway
+    log.correlation_id.set(key)
+    if key:
+        # Repeats of a client key are answered before validation
+        return run_idempotent(key, validate_and_vend, event)
+    request_id = getattr(context, "aws_request_id", None)
+    if idempotency.IDEMPOTENCY_KEY_SOURCE == idempotency.REQUEST and request_id:
+        try:
+            validated_request = provision_aws_account_schema.validate(event)
+        except SchemaError as se:
+            return utils.failed({"message": str(se)})
+        return run_idempotent(idempotency.derive_key(validated_request, request_id), vend_account, validated_request)
+    return validate_and_vend(event)
+
+
+def validate_and_vend(event, allocation_key: str | None = None, allocation: tuple[str, str] | None = None) -> dict:
     try:
         validated_request = provision_aws_account_schema.validate(event)
     except SchemaError as se:
         return utils.failed({"message": str(se)})
+    return vend_account(validated_request, allocation_key, allocation)
+
+
+def vend_account(
+    validated_request: dict, allocation_key: str | None = None, allocation: tuple[str, str] | None = None
+) -> dict:
+    """Vend an account for the request.  The name and email are recorded on
+    the `allocation_key` item together with the account.  An `allocation` an
+    earlier call stored that way is finished instead of vending another"""
     tags = validated_request.get(ddb.TAGS)
     tags[ddb.ACCOUNT_NAME] = validated_request.get(ddb.ACCOUNT_NAME)
     tags[ddb.ACCOUNT_EMAIL] = validated_request.get(ddb.ACCOUNT_EMAIL)
     account_type = validated_request.get(ddb.ACCOUNT_TYPE)
     owner_email = validated_request.get(ddb.OWNER_ADDRESS)
 
-    # Attempt to generate new account email and name
-    try:
-        account_name, account_email = get_new_account_data(tags)
-    except ValueError as ve:
-        return utils.failed({"message": str(ve)})
+    if allocation:
+        account_name, account_email = allocation
+        return finish_vend(account_name, account_email, account_type, owner_email)
 
-    # If either the account email or account name already exist, fail the process
-    email_conflict = ddb.get_account_owner_address(account_email)
-    if email_conflict:
-        return utils.failed(
-            {"message": f"An account with email {account_email} already exists"}
-        )
+    # Names claimed from a name pool were checked for conflicts when they were reserved
+    reserved = claim_reserved_account_data(tags)
+    if reserved:
+        account_name, account_email = reserved
+    else:
+        # Attempt to generate new account email and name
+        try:
+            account_name, account_email = get_new_account_data(tags)
+        except ValueError as ve:
+            return utils.failed({"message": str(ve)})
 
-    name_conflict = ddb.get_account_by_name(account_name)
-    if name_conflict:
+        # If either the account email or account name already exist, fail the process
+        if ddb.account_exists(account_email):
+            return utils.failed(
+                {"message": f"An account with email {account_email} already exists"}
+            )
+
+        name_conflict = ddb.get_account_by_name(account_name)
+        if name_conflict:
+            return utils.failed(
+                {"message": f"An account with name {account_name} already exists"}
+            )
+
+    # Store the record in the table, unless the email was taken since the check
+    if not ddb.store_account_record(
+        account_name, account_email, account_type, owner_email, "NAME-ALLOCATED", tags,
+        claimed=bool(reserved), allocation_key=allocation_key,
+    ):
         return utils.failed(
-            {"message": f"An account with name {account_name} already exists"}
+            {"message": f"An account with email {account_email} already exists"}
         )
+    return finish_vend(account_name, account_email, account_type, owner_email)
 
-    # Store the record in the table
-    ddb.store_account_record(
-        account_name, account_email, account_type, owner_email, "NAME-ALLOCATED", tags
-    )
 
+def finish_vend(account_name: str, account_email: str, account_type: str, owner_email: str) -> dict:
+    """Verify the owner of the stored account and return the vended account"""
     # Check if owner's email is verified and if not, send verification request
-    # This is really only needed if your AWS account is still in SES sandbox mode
-    verification_status = ses.verify_email_address(owner_email)
+    # This is really only needed if your AWS account is still in SES sandbox mode.
+    # With a verification queue it is done in batches off the vend path and the
+    # status is recorded on the account item
+    if ses.VERIFICATION_QUEUE_URL:
+        verification_status = ses.queue_verification(owner_email, account_email)
+    else:
+        verification_status = ses.verify_email_address(owner_email)
 
     # Return success
     return utils.success(
@@ -2,9 +2,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import boto3
+import logging
 import os
 from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
 from utils import event_dt
+import snapstart
 
 CURRENT_REGION = os.getenv("AWS_REGION", "us-east-1")
 TABLE_NAME = os.getenv("TABLE_NAME", "AWSAccountTable")
@@ -17,31 +20,64 @@ COUNT = "Enum"
 TAGS = "Tags"
 LAST_UPDATED = "LastUpdated"
 STATUS = "Status"
-ACCOUNT_ENUM_INDEX = "-".join([ACCOUNT_NAME, COUNT, "Index"])
+VERIFICATION_STATUS = "VerificationStatus"
+VERIFICATION_CHECKED = "VerificationChecked"
+# Name and email of the account a control item was allocated, stored together
+# with the account item
+ALLOCATED_NAME = "AllocatedName"
+ALLOCATED_EMAIL = "AllocatedEmail"
+# The KEYS_ONLY index replacing the one projecting whole items is only used
+# once it is built, the CDK sets its name then
+ACCOUNT_ENUM_INDEX = os.getenv("ACCOUNT_INDEX_NAME", "-".join([ACCOUNT_NAME, COUNT, "Index"]))
+# Status of the placeholder items of names reserved for a name pool
+RESERVED = "RESERVED"
+# Keys of the items holding settings rather than accounts start with this prefix
+CONTROL_KEY_PREFIX = "#"
+logger = logging.getLogger("VEND-EMAIL")
 
-ddb = boto3.resource("dynamodb", region_name=CURRENT_REGION)
-account_table = ddb.Table(TABLE_NAME)
+ddb = None
+account_table = None
 
 
-def get_account_owner_address(incoming_email_address):
-    resp = account_table.get_item(Key={ACCOUNT_EMAIL: incoming_email_address})
-    return resp.get("Item", {}).get(OWNER_ADDRESS)
+@snapstart.register_after_restore
+def create_clients():
+    """Create the table, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global ddb, account_table
+    ddb = boto3.resource("dynamodb", region_name=CURRENT_REGION)
+    account_table = ddb.Table(TABLE_NAME)
 
 
-def get_records_by_account_prefix(account_name):
-    """Get all records matching `account_name`.  This function does not
-    expect `account_name` to contain the counter at the end."""
+create_clients()
 
-    resp = account_table.query(
-        IndexName=ACCOUNT_ENUM_INDEX,
-        KeyConditionExpression=Key(ACCOUNT_NAME).eq(account_name),
-    )
-    if len(resp.get("Items")) < 1:
-        resp = {"Items": []}
-    print(
-        f'Query DynamoDB table {TABLE_NAME} and returned {len(resp.get("Items"))} records'
+
+def account_exists(account_email: str) -> bool:
+    """True when an item uses the email, including the placeholders of
+    reserved names, which have no owner"""
+    resp = account_table.get_item(
+        Key={ACCOUNT_EMAIL: account_email}, ProjectionExpression=ACCOUNT_EMAIL
     )
-    return resp.get("Items")
+    return "Item" in resp
+
+
+def get_records_by_account_prefix(account_name):
+    """Get the counters of all records matching `account_name`.  This function
+    does not expect `account_name` to contain the counter at the end."""
+    query_kwargs = {
+        "IndexName": ACCOUNT_ENUM_INDEX,
+        "KeyConditionExpression": Key(ACCOUNT_NAME).eq(account_name),
+        "ProjectionExpression": "#c",
+        "ExpressionAttributeNames": {"#c": COUNT},
+    }
+    items = []
+    while True:
+        resp = account_table.query(**query_kwargs)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        query_kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    logger.debug("Query DynamoDB table %s and returned %d records", TABLE_NAME, len(items))
+    return items
 
 
 def get_account_by_name(account_name):
@@ -52,12 +88,12 @@ def get_account_by_name(account_name):
     resp = account_table.query(
         IndexName=ACCOUNT_ENUM_INDEX,
         KeyConditionExpression=Key(ACCOUNT_NAME).eq(name) & Key(COUNT).eq(count),
+        ProjectionExpression=ACCOUNT_EMAIL,
+        Limit=1,
     )
     if len(resp.get("Items")) < 1:
         resp = {"Items": [{}]}
-    print(
-        f'Query DynamoDB table {TABLE_NAME} and returned {len(resp.get("Items"))} records'
-    )
+    logger.debug("Query DynamoDB table %s and returned %d records", TABLE_NAME, len(resp.get("Items")))
     # Only return the first item
     return resp.get("Items")[0]
 
@@ -69,23 +105,124 @@ def store_account_record(
     owner_email: str,
     status: str,
     tags: dict,
-):
-    """PUT record in the Account Table table. Will overwrite the record if \
-        it exists"""
+    claimed: bool = False,
+    allocation_key: str | None = None,
+) -> bool:
+    """PUT record in the Account Table table.  Returns False when the email is
+    already taken.  A name `claimed` from a name pool replaces its placeholder.
+    With an `allocation_key` the name and email are also recorded on that
+    control item in the same transaction"""
     # First split the account name from the counter at the end so we can \
     # store them separately
     name, count = account_name.rsplit("-", 1)
     update_ts = event_dt()
-    resp = account_table.put_item(
-        Item={
-            STATUS: status,
-            ACCOUNT_NAME: name,
-            ACCOUNT_TYPE: account_type,
-            COUNT: count,
-            ACCOUNT_EMAIL: account_email,
-            OWNER_ADDRESS: owner_email,
-            TAGS: tags,
-            LAST_UPDATED: update_ts,
+    condition = {
+        "ConditionExpression": "attribute_not_exists(#k)",
+        "ExpressionAttributeNames": {"#k": ACCOUNT_EMAIL},
+    }
+    if claimed:
+        condition = {
+            "ConditionExpression": "attribute_not_exists(#k) OR #s = :reserved",
+            "ExpressionAttributeNames": {"#k": ACCOUNT_EMAIL, "#s": STATUS},
+            "ExpressionAttributeValues": {":reserved": RESERVED},
         }
-    )
-    return resp
+    item = {
+        STATUS: status,
+        ACCOUNT_NAME: name,
+        ACCOUNT_TYPE: account_type,
+        COUNT: count,
+        ACCOUNT_EMAIL: account_email,
+        OWNER_ADDRESS: owner_email,
+        TAGS: tags,
+        LAST_UPDATED: update_ts,
+    }
+    if allocation_key:
+        return store_allocated_account_record(item, condition, allocation_key, account_name)
+    try:
+        account_table.put_item(Item=item, **condition)
+    except ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+
+def store_allocated_account_record(item: dict, condition: dict, allocation_key: str, account_name: str) -> bool:
+    """Put the account item and record its name and email on the control
+    item `allocation_key` in one transaction"""
+    serializer = TypeSerializer()
+    put = {
+        "TableName": TABLE_NAME,
+        "Item": {name: serializer.serialize(value) for name, value in item.items()},
+        "ConditionExpression": condition["ConditionExpression"],
+        "ExpressionAttributeNames": condition["ExpressionAttributeNames"],
+    }
+    if "ExpressionAttributeValues" in condition:
+        put["ExpressionAttributeValues"] = {
+            name: serializer.serialize(value) for name, value in condition["ExpressionAttributeValues"].items()
+        }
+    allocate = {
+        "TableName": TABLE_NAME,
+        "Key": {ACCOUNT_EMAIL: serializer.serialize(allocation_key)},
+        "UpdateExpression": "SET #n = :name, #e = :email",
+        "ConditionExpression": "attribute_exists(#k)",
+        "ExpressionAttributeNames": {"#n": ALLOCATED_NAME, "#e": ALLOCATED_EMAIL, "#k": ACCOUNT_EMAIL},
+        "ExpressionAttributeValues": {
+            ":name": serializer.serialize(account_name),
+            ":email": serializer.serialize(item[ACCOUNT_EMAIL]),
+        },
+    }
+    try:
+        ddb.meta.client.transact_write_items(TransactItems=[{"Put": put}, {"Update": allocate}])
+    except ddb.meta.client.exceptions.TransactionCanceledException as tce:
+        reasons = tce.response.get("CancellationReasons", [])
+        if reasons and reasons[0].get("Code") == "ConditionalCheckFailed":
+            return False
+        raise
+    return True
+
+
+def reserve_account_name(name: str, count: str, account_email: str) -> bool:
+    """Store a placeholder for a name and email that are not used yet.
+    Returns False when the email is already taken"""
+    try:
+        account_table.put_item(
+            Item={
+                STATUS: RESERVED,
+                ACCOUNT_NAME: name,
+                COUNT: count,
+                ACCOUNT_EMAIL: account_email,
+                LAST_UPDATED: event_dt(),
+            },
+            ConditionExpression=f"attribute_not_exists({ACCOUNT_EMAIL})",
+        )
+    except ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+
+def release_account_name(account_email: str):
+    """Delete the placeholder of a reserved name unless it was claimed"""
+    try:
+        account_table.delete_item(
+            Key={ACCOUNT_EMAIL: account_email},
+            ConditionExpression="#s = :reserved",
+            ExpressionAttributeNames={"#s": STATUS},
+            ExpressionAttributeValues={":reserved": RESERVED},
+        )
+    except ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+
+
+def record_verification_status(account_email: str, status: str) -> bool:
+    """Record the SES verification status of the owner on the account.
+    Returns False when the account does not exist anymore"""
+    try:
+        account_table.update_item(
+            Key={ACCOUNT_EMAIL: account_email},
+            UpdateExpression="SET #v = :status, #c = :checked",
+            ConditionExpression=f"attribute_exists({ACCOUNT_EMAIL})",
+            ExpressionAttributeNames={"#v": VERIFICATION_STATUS, "#c": VERIFICATION_CHECKED},
+            ExpressionAttributeValues={":status": status, ":checked": event_dt()},
+        )
+    except ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
@@ -0,0 +1,134 @@
+"""Library for answering repeated vend requests with their original response.
+
+Each request is claimed with a conditional write of a control item keyed by
+its idempotency key.  The first call vends and stores its response on the
+item, repeats return the stored response until the item expires.  The name
+and email a call allocates are recorded on the item together with the account
+item, so a call taking over the claim of one that timed out finishes that vend
+instead of allocating another account."""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import hashlib
+import json
+import os
+import time
+import ddb
+import utils
+
+# CLIENT only uses the IdempotencyKey of the request, REQUEST also derives a
+# key from the validated request and the invocation when there is none, so
+# Lambda's retries of an invocation are repeats.  None disables it
+CLIENT = "CLIENT"
+REQUEST = "REQUEST"
+IDEMPOTENCY_KEY_SOURCE = os.getenv("IDEMPOTENCY_KEY_SOURCE")
+# How long a response is returned for repeats
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# A claim without a response is taken over after this long, its vend is
+# assumed to have failed without releasing it
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+IDEMPOTENCY_KEY = "IdempotencyKey"
+MAX_KEY_LENGTH = 256
+KEY_PREFIX = ddb.CONTROL_KEY_PREFIX + "idem#"
+# Field Names
+RESPONSE = "Response"
+LEASE_UNTIL = "LeaseUntil"
+EXPIRES_AT = "ExpiresAt"
+
+
+class InProgress(Exception):
+    """Another call with the same key is still vending"""
+
+
+def get_client_key(event) -> str | None:
+    """Returns the idempotency key sent by the client.  Raises ValueError
+    when it is not a usable key"""
+    if not IDEMPOTENCY_KEY_SOURCE or not isinstance(event, dict) or IDEMPOTENCY_KEY not in event:
+        return None
+    key = event[IDEMPOTENCY_KEY]
+    if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise ValueError(f"{IDEMPOTENCY_KEY} must be a string of 1 to {MAX_KEY_LENGTH} characters")
+    return key
+
+
+def derive_key(validated_request: dict, request_id: str) -> str:
+    """Returns a key for requests without a client key.  Lambda keeps the
+    request ID of an invocation when it retries it, identical requests in
+    other invocations get another key as they may be meant for a second
+    account with the same tags"""
+    request = json.dumps(validated_request, sort_keys=True, default=str)
+    return "sha256:" + hashlib.sha256(f"{request_id}\0{request}".encode()).hexdigest()
+
+
+def claim(key: str) -> tuple[dict | None, tuple[str, str] | None]:
+    """Claim `key` for this call.  Returns the stored response of an earlier
+    call with the same key, or the account name and email allocated by an
+    earlier call that did not finish, both None when the call should vend.
+    Raises InProgress while another call holds the claim"""
+    now = int(time.time())
+    conditional_check_failed = ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException
+    try:
+        ddb.account_table.put_item(
+            Item={
+                ddb.ACCOUNT_EMAIL: KEY_PREFIX + key,
+                LEASE_UNTIL: now + IDEMPOTENCY_LEASE_SECONDS,
+                EXPIRES_AT: now + IDEMPOTENCY_TTL_SECONDS,
+                ddb.LAST_UPDATED: utils.event_dt(),
+            },
+            # Expired items may not have been deleted by the TTL yet
+            ConditionExpression="attribute_not_exists(#k) OR #e < :now",
+            ExpressionAttributeNames={"#k": ddb.ACCOUNT_EMAIL, "#e": EXPIRES_AT},
+            ExpressionAttributeValues={":now": now},
+        )
+        return None, None
+    except conditional_check_failed:
+        pass
+    try:
+        # Take over a claim whose lease ran out, keeping what it allocated
+        resp = ddb.account_table.update_item(
+            Key={ddb.ACCOUNT_EMAIL: KEY_PREFIX + key},
+            UpdateExpression="SET #l = :lease, #u = :updated",
+            ConditionExpression="attribute_not_exists(#r) AND #l < :now",
+            ExpressionAttributeNames={"#l": LEASE_UNTIL, "#u": ddb.LAST_UPDATED, "#r": RESPONSE},
+            ExpressionAttributeValues={
+                ":lease": now + IDEMPOTENCY_LEASE_SECONDS, ":updated": utils.event_dt(), ":now": now,
+            },
+            ReturnValues="ALL_NEW",
+        )
+    except conditional_check_failed:
+        resp = ddb.account_table.get_item(Key={ddb.ACCOUNT_EMAIL: KEY_PREFIX + key}, ConsistentRead=True)
+        response = resp.get("Item", {}).get(RESPONSE)
+        if response is None:
+            raise InProgress("A request with the same idempotency key is still in progress")
+        return json.loads(response), None
+    item = resp["Attributes"]
+    if ddb.ALLOCATED_EMAIL in item:
+        return None, (item[ddb.ALLOCATED_NAME], item[ddb.ALLOCATED_EMAIL])
+    return None, None
+
+
+def complete(key: str, response: dict):
+    """Store the response returned for repeats of `key`"""
+    ddb.account_table.update_item(
+        Key={ddb.ACCOUNT_EMAIL: KEY_PREFIX + key},
+        UpdateExpression="SET #r = :response",
+        ExpressionAttributeNames={"#r": RESPONSE},
+        ExpressionAttributeValues={":response": json.dumps(response)},
+    )
+
+
+def allocation_key(key: str) -> str:
+    """Returns the key of the item the allocated name and email are recorded on"""
+    return KEY_PREFIX + key
+
+
+def release(key: str):
+    """Drop the claim of a call that did not vend so repeats try again.
+    Claims with an allocated account are kept for a repeat to finish"""
+    try:
+        ddb.account_table.delete_item(
+            Key={ddb.ACCOUNT_EMAIL: KEY_PREFIX + key},
+            ConditionExpression="attribute_not_exists(#r) AND attribute_not_exists(#a)",
+            ExpressionAttributeNames={"#r": RESPONSE, "#a": ddb.ALLOCATED_EMAIL},
+        )
+    except ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
@@ -0,0 +1,183 @@
+"""Library and scheduled handler for the pools of pre-reserved account names.
+
+Each pool is a control item holding a range of counters [Next, Limit) whose
+names and emails were reserved with placeholder items in the account table.
+A vend claims the next counter with a single conditional update instead of
+looking up the highest counter and checking the new name for conflicts."""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import logging
+import os
+import sys
+import time
+import boto3
+from botocore.exceptions import ClientError
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+import ddb
+import snapstart
+import log
+
+SES_DOMAIN_NAME = os.getenv("SES_DOMAIN_NAME")
+COUNTER_LENGTH = os.getenv("COUNTER_LENGTH", "3")  # Number of digits with leading zeros
+# Account name prefixes (BusinessUnit-ApplicationName-Environment) with a pool
+NAME_POOL_PREFIXES = [p for p in os.getenv("NAME_POOL_PREFIXES", "").split(",") if p]
+# Number of names kept reserved for each prefix, topped up at half of it
+NAME_POOL_SIZE = int(os.getenv("NAME_POOL_SIZE", "10"))
+# Reserved names left unclaimed for this long after the last top up are released
+NAME_POOL_TTL_SECONDS = int(os.getenv("NAME_POOL_TTL_SECONDS", "86400"))
+# Function invoked asynchronously to top up a pool running low
+NAME_POOL_FUNCTION_NAME = os.getenv("NAME_POOL_FUNCTION_NAME")
+POOL_KEY_PREFIX = ddb.CONTROL_KEY_PREFIX + "pool#"
+# Field Names
+NEXT = "Next"
+LIMIT = "Limit"
+RESERVED_UNTIL = "ReservedUntil"
+logger = logging.getLogger("NAME-POOL")
+log.setup()
+
+lambda_client = None
+
+
+@snapstart.register_after_restore
+def create_clients():
+    """Create the client, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global lambda_client
+    lambda_client = boto3.client("lambda") if NAME_POOL_FUNCTION_NAME else None
+
+
+create_clients()
+
+
+def format_number(input: int) -> str:
+    return f"{input:0{COUNTER_LENGTH}d}"
+
+
+def account_email(account_name: str) -> str:
+    return account_name + "@" + SES_DOMAIN_NAME
+
+
+def claim(prefix: str) -> str | None:
+    """Returns a reserved counter for `prefix`, or None when the prefix has
+    no pool or its pool is empty or expired"""
+    if prefix not in NAME_POOL_PREFIXES:
+        return None
+    try:
+        resp = ddb.account_table.update_item(
+            Key={ddb.ACCOUNT_EMAIL: POOL_KEY_PREFIX + prefix},
+            UpdateExpression="ADD #n :one",
+            ConditionExpression="#n < #l AND #r > :now",
+            ExpressionAttributeNames={"#n": NEXT, "#l": LIMIT, "#r": RESERVED_UNTIL},
+            ExpressionAttributeValues={":one": 1, ":now": int(time.time())},
+            ReturnValues="ALL_NEW",
+        )
+    except ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException:
+        request_top_up(prefix)
+        return None
+    pool = resp["Attributes"]
+    if pool[LIMIT] - pool[NEXT] == NAME_POOL_SIZE // 2:
+        # Only the claim crossing the threshold requests a top up
+        request_top_up(prefix)
+    return format_number(int(pool[NEXT]) - 1)
+
+
+def request_top_up(prefix: str):
+    """Top up the pool of `prefix` in the background, failures only delay it
+    until the next scheduled top up"""
+    if not lambda_client:
+        return
+    try:
+        lambda_client.invoke(
+            FunctionName=NAME_POOL_FUNCTION_NAME,
+            InvocationType="Event",
+            Payload=json.dumps({"Prefixes": [prefix]}).encode(),
+        )
+    except ClientError as ce:
+        logger.warning("Unable to request a top up of the %s name pool: %s", prefix, ce.response["Error"]["Message"])
+
+
+def get_pool(prefix: str) -> dict:
+    resp = ddb.account_table.get_item(
+        Key={ddb.ACCOUNT_EMAIL: POOL_KEY_PREFIX + prefix}, ConsistentRead=True
+    )
+    return resp.get("Item", {})
+
+
+def release(prefix: str, pool: dict):
+    """Delete the placeholders of the unclaimed names and the pool itself.
+    Claims fail once the pool expired, so Next does not move anymore"""
+    for number in range(int(pool[NEXT]), int(pool[LIMIT])):
+        ddb.release_account_name(account_email(f"{prefix}-{format_number(number)}"))
+    ddb.account_table.delete_item(
+        Key={ddb.ACCOUNT_EMAIL: POOL_KEY_PREFIX + prefix},
+        ConditionExpression="#n = :next",
+        ExpressionAttributeNames={"#n": NEXT},
+        ExpressionAttributeValues={":next": pool[NEXT]},
+    )
+    logger.info("Released %d unclaimed names of the %s pool", int(pool[LIMIT]) - int(pool[NEXT]), prefix)
+
+
+def top_up(prefix: str, now: int | None = None) -> int:
+    """Reserve names for `prefix` until NAME_POOL_SIZE are unclaimed and
+    returns the number of names reserved.  Top ups must not run concurrently,
+    the CDK limits the function to a single concurrent execution"""
+    now = int(time.time()) if now is None else now
+    pool = get_pool(prefix)
+    if pool and pool[RESERVED_UNTIL] <= now:
+        release(prefix, pool)
+        pool = {}
+    unclaimed = int(pool[LIMIT]) - int(pool[NEXT]) if pool else 0
+    if unclaimed > NAME_POOL_SIZE // 2:
+        return 0
+
+    # Placeholders make the reserved names count as used for vends that do
+    # not use the pool, so reservations start after the highest counter
+    counts = [int(r[ddb.COUNT]) for r in ddb.get_records_by_account_prefix(prefix)]
+    start = max(counts, default=0) + 1
+    if unclaimed and start != int(pool[LIMIT]):
+        # Another vend used the counter after the pool, which would leave a
+        # gap in the range.  Wait for the pool to drain instead
+        return 0
+    end = start
+    while end - start < NAME_POOL_SIZE - unclaimed:
+        if not ddb.reserve_account_name(prefix, format_number(end), account_email(f"{prefix}-{format_number(end)}")):
+            break
+        end += 1
+    if end == start:
+        return 0
+
+    names = {"#n": NEXT, "#l": LIMIT, "#r": RESERVED_UNTIL}
+    if unclaimed:
+        ddb.account_table.update_item(
+            Key={ddb.ACCOUNT_EMAIL: POOL_KEY_PREFIX + prefix},
+            UpdateExpression="SET #l = :end, #r = :until",
+            ConditionExpression="#l = :start",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={":start": start, ":end": end, ":until": now + NAME_POOL_TTL_SECONDS},
+        )
+    else:
+        ddb.account_table.put_item(
+            Item={
+                ddb.ACCOUNT_EMAIL: POOL_KEY_PREFIX + prefix,
+                NEXT: start,
+                LIMIT: end,
+                RESERVED_UNTIL: now + NAME_POOL_TTL_SECONDS,
+            },
+            ConditionExpression="attribute_not_exists(#n) OR #n = #l",
+            ExpressionAttributeNames={"#n": NEXT, "#l": LIMIT},
+        )
+    logger.info("Reserved %d names of the %s pool from %s", end - start, prefix, format_number(start))
+    return end - start
+
+
+@log.invocation
+def lambda_handler(event, context):
+    # Invoked on a schedule for every configured prefix and by vends for the
+    # prefix whose pool is running low
+    prefixes = event.get("Prefixes") or NAME_POOL_PREFIXES
+    for prefix in prefixes:
+        if prefix in NAME_POOL_PREFIXES:
+            top_up(prefix)
@@ -1,21 +1,45 @@
 """Library for managing SES"""
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+import json
+import logging
 import os
 import boto3
 from botocore.exceptions import ClientError
+import snapstart
 
-# Create a new SES client.
-ses = boto3.client("ses")
+# Optional queue the owner verification is handed off to
+VERIFICATION_QUEUE_URL = os.getenv("VERIFICATION_QUEUE_URL")
+# Most identities GetIdentityVerificationAttributes accepts in one call
+MAX_IDENTITIES = 100
+
+logger = logging.getLogger("VEND-EMAIL")
+
+ses = None
+sqs = None
+
+
+@snapstart.register_after_restore
+def create_clients():
+    """Create the client, again after every SnapStart restore so restored
+    environments do not share connections"""
+    global ses, sqs
+    # Create a new SES client.
+    ses = boto3.client("ses")
+    sqs = boto3.client("sqs") if VERIFICATION_QUEUE_URL else None
+
+
+create_clients()
 
 
 def verify_email_address(email_address: str) -> str:
     """Returns a message about the state of email verification.
     If no verification request was ever sent, one will be sent"""
+    response = {}
     try:
         response = ses.get_identity_verification_attributes(Identities=[email_address])
     except ClientError as ce:
-        print(ce.response)
+        logger.error("Unable to get the state of verification: %s", ce.response["Error"]["Message"])
         message = f"An error was generated when attempting to get the state of verification {ce.response['Error']['Message']}"
     if "VerificationAttributes" in response:
         status = (
@@ -35,4 +59,31 @@ def send_verification_request(email_address: str):
     try:
         response = ses.verify_email_identity(EmailAddress=email_address)
     except ClientError as ce:
-        print(ce.response)
+        logger.error("Unable to request the verification of %s: %s", email_address, ce.response["Error"]["Message"])
+
+
+def queue_verification(email_address: str, account_email: str) -> str:
+    """Hand the verification of `email_address` off to the verification
+    function and returns a message about it"""
+    try:
+        sqs.send_message(
+            QueueUrl=VERIFICATION_QUEUE_URL,
+            MessageBody=json.dumps({"OwnerAddress": email_address, "AccountEmail": account_email}),
+        )
+    except ClientError as ce:
+        logger.error("Unable to queue the verification of %s: %s", email_address, ce.response["Error"]["Message"])
+        return f"An error was generated when attempting to queue the verification {ce.response['Error']['Message']}"
+    return f"A request to verify {email_address} has been queued."
+
+
+def get_verification_statuses(email_addresses: list[str]) -> dict:
+    """Returns the verification status of every address SES knows, reading up
+    to MAX_IDENTITIES per call"""
+    statuses = {}
+    for i in range(0, len(email_addresses), MAX_IDENTITIES):
+        response = ses.get_identity_verification_attributes(
+            Identities=email_addresses[i:i + MAX_IDENTITIES]
+        )
+        for address, attributes in response["VerificationAttributes"].items():
+            statuses[address] = attributes.get("VerificationStatus")
+    return statuses
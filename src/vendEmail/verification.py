@@ -0,0 +1,63 @@
+"""Handler verifying the owner addresses of vended accounts in batches.
+
+Vends queue the verification instead of calling SES themselves when
+VERIFICATION_QUEUE_URL is set.  This function reads the statuses of a whole
+batch with one SES call, sends verification requests to the addresses SES
+does not know yet and records the status on the account items."""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import logging
+import os
+import sys
+from botocore.exceptions import ClientError
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+import ddb
+import ses
+import log
+
+# Status SES reports once a verification request was sent
+PENDING = "Pending"
+logger = logging.getLogger("OWNER-VERIFICATION")
+log.setup()
+
+
+@log.invocation
+def lambda_handler(event, context):
+    # Failed records are returned so only they are retried
+    requests = {
+        record["messageId"]: json.loads(record["body"]) for record in event.get("Records", [])
+    }
+    addresses = sorted({request["OwnerAddress"] for request in requests.values()})
+    try:
+        statuses = ses.get_verification_statuses(addresses)
+    except ClientError as ce:
+        logger.error("Unable to get the verification status of %d addresses: %s", len(addresses), ce.response["Error"]["Message"])
+        return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in requests]}
+
+    failed_addresses = set()
+    for address in addresses:
+        if statuses.get(address) is None:
+            try:
+                ses.ses.verify_email_identity(EmailAddress=address)
+                statuses[address] = PENDING
+            except ClientError as ce:
+                logger.warning("Unable to request the verification of %s: %s", address, ce.response["Error"]["Message"])
+                failed_addresses.add(address)
+
+    failures = []
+    for message_id, request in requests.items():
+        address = request["OwnerAddress"]
+        if address in failed_addresses:
+            failures.append({"itemIdentifier": message_id})
+            continue
+        try:
+            if not ddb.record_verification_status(request["AccountEmail"], statuses[address]):
+                logger.info("Account %s no longer exists, not recording its verification", request["AccountEmail"])
+        except ClientError as ce:
+            logger.warning("Unable to record the verification of %s: %s", request["AccountEmail"], ce.response["Error"]["Message"])
+            failures.append({"itemIdentifier": message_id})
+    logger.info("Checked %d owner addresses for %d accounts, %d failed", len(addresses), len(requests), len(failures))
+    return {"batchItemFailures": failures}
@@ -0,0 +1,102 @@
+"""Benchmark of the synchronous and asyncio forwarder pipelines
+
+Fake S3, DynamoDB and SES services sleep to simulate network latency, so the
+numbers show how well each mode overlaps waiting rather than raw CPU speed.
+Each mode also runs with PREFETCH_MESSAGE, which overlaps the download of a
+message with the lookup of its owner.
+
+    python -m tests.benchmark.bench_forwarder --records 200
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+from unittest.mock import patch
+from tests.unit import load_function
+from tools.fakes import FakeAccountTable, FakeBucket, FakeSes
+
+app = load_function("fwdEmail", "app")
+
+RAW_MESSAGE = (
+    b"From: sender@example.net\r\n"
+    b"To: acct-001@example.com\r\n"
+    b"Subject: Your AWS account\r\n"
+    b"Content-Type: text/plain\r\n\r\n" + b"Lorem ipsum dolor sit amet. " * 2000
+)
+
+
+def create_event(records: int) -> dict:
+    notifications = []
+    for i in range(records):
+        notifications.append(
+            {
+                "notificationType": "Received",
+                "mail": {"messageId": f"message-{i}", "source": "sender@example.net"},
+                "receipt": {
+                    "recipients": [f"acct-{i:03d}@example.com"],
+                    "action": {"bucketName": "mail-bucket", "objectKey": f"mail/message-{i}"},
+                },
+            }
+        )
+    return {
+        "Records": [
+            {"EventSource": "aws:sns", "Sns": {"Message": json.dumps(n)}}
+            for n in notifications
+        ]
+    }
+
+
+def run(mode: str, prefetch: bool, records: int, latency: float, concurrency: int) -> dict:
+    fake_ses = FakeSes(latency)
+    fake_bucket = FakeBucket(latency)
+    fake_bucket.objects = {f"mail/message-{i}": RAW_MESSAGE for i in range(records)}
+    owners = {f"acct-{i:03d}@example.com": "owner@example.com" for i in range(records)}
+    with patch.object(app, "FORWARDER_MODE", mode), \
+            patch.object(app, "PREFETCH_MESSAGE", "true" if prefetch else None), \
+            patch.object(app, "ASYNC_MAX_CONCURRENCY", concurrency), \
+            patch.object(app, "executor", None), \
+            patch.object(app, "ADDRESS_FROM", "from@example.com"), \
+            patch.object(app.ses, "s3", fake_bucket), \
+            patch.object(app.ses, "client_ses", fake_ses), \
+            patch.object(app.ddb, "account_table", FakeAccountTable(owners, latency)), \
+            patch.object(app.metrics, "flush"):
+        event = create_event(records)
+        tracemalloc.start()
+        start = time.perf_counter()
+        app.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    assert len(fake_ses.sent) == records
+    if prefetch:
+        mode += "+prefetch"
+    return {"mode": mode, "seconds": elapsed, "per_second": records / elapsed, "peak_mb": peak / 2**20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Latency of each fake service call")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    # Keep the forwarder's records out of the results
+    logging.getLogger().setLevel(logging.WARNING)
+    print(
+        f"{args.records} records, {args.latency_ms} ms per service call, "
+        f"async concurrency {args.concurrency}"
+    )
+    print(f"{'mode':<14} {'seconds':>8} {'msgs/s':>8} {'peak MB':>8}")
+    for mode in ["sync", app.ASYNC_MODE]:
+        for prefetch in [False, True]:
+            result = run(mode, prefetch, args.records, args.latency_ms / 1000, args.concurrency)
+            print(
+                f"{result['mode']:<14} {result['seconds']:>8.2f} "
+                f"{result['per_second']:>8.1f} {result['peak_mb']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Helpers shared by the unit tests"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import sys
+from tools.functions import COMMON_DIR, load_function
+
+# boto3 clients and tables are created when the function modules are imported
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("TABLE_NAME", "AWSAccountTable")
+# Functions imported as packages find the common modules where Lambda puts
+# the layer
+sys.path.append(COMMON_DIR)
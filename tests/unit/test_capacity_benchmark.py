@@ -0,0 +1,46 @@
+"""Unit tests for the account table capacity benchmark"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from unittest import TestCase
+from boto3.dynamodb.conditions import Key
+from tools import capacity_benchmark
+
+
+def account(number: int, **attributes) -> dict:
+    item = {
+        "AccountEmail": f"it-portal-prod-{number:03d}@example.com",
+        "AccountName": "it-portal-prod",
+        "Enum": f"{number:03d}",
+        "OwnerAddress": "owner@example.com",
+        "Tags": {"BusinessUnit": "it", "ApplicationName": "portal" * 100},
+    }
+    item.update(attributes)
+    return item
+
+
+class test_capacity_benchmark(TestCase):
+    def test_item_size_follows_dynamodb_rules(self):
+        self.assertEqual(capacity_benchmark.item_size({"a": "bcd", "n": 12345}), 2 + 3 + 4)
+        self.assertEqual(capacity_benchmark.item_size({"m": {"k": "v"}}), 1 + 3 + 1 + 1 + 1)
+
+    def test_keys_only_index_skips_non_key_writes(self):
+        for projection, index_writes in [("ALL", 1), ("KEYS_ONLY", 0)]:
+            with self.subTest(projection=projection):
+                table = capacity_benchmark.FakeAccountTable("Index", projection)
+                table.put_item(Item=account(1))
+                table.take_units()
+                table.put_item(Item=account(1, OwnerAddress="new@example.com"))
+                self.assertEqual(table.take_units(), (0, 1 + index_writes))
+
+    def test_keys_only_index_queries_read_less(self):
+        units = {}
+        for projection in ["ALL", "KEYS_ONLY"]:
+            table = capacity_benchmark.FakeAccountTable("Index", projection)
+            for number in range(20):
+                table.put_item(Item=account(number))
+            table.take_units()
+            resp = table.query(IndexName="Index", KeyConditionExpression=Key("AccountName").eq("it-portal-prod"))
+            self.assertEqual(resp["Count"], 20)
+            units[projection] = table.take_units()[0]
+        self.assertEqual(units["KEYS_ONLY"], 0.5)
+        self.assertGreater(units["ALL"], units["KEYS_ONLY"])
@@ -0,0 +1,166 @@
+"""Unit tests for collapsing identical messages to one owner"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import email
+import json
+import time
+from email.message import EmailMessage
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from tests.unit import load_function
+from tests.unit.test_fwd_email import sample_notification, sns_event
+
+app, dedup = load_function("fwdEmail", "app", "dedup")
+
+
+def notice(alias: str) -> bytes:
+    return (
+        f"From: no-reply@example.net\r\nTo: {alias}\r\nSubject: Scheduled maintenance\r\n"
+        f"Message-ID: <{alias}@example.net>\r\n\r\n"
+        f"Dear customer, instances in account 1234567890{alias[5:7]} ({alias}) will be rebooted.\r\n"
+    ).encode()
+
+
+def multipart_notice(alias: str) -> bytes:
+    """A text and HTML notice, with the text part quoted-printable and the
+    HTML part base64 encoded"""
+    message = EmailMessage()
+    message["From"] = "no-reply@example.net"
+    message["To"] = alias
+    message["Subject"] = "Scheduled maintenance"
+    message.set_content(f"Dear customer, instances for {alias} will be rebooted.\n", cte="quoted-printable")
+    message.add_alternative(f"<p>Dear customer, instances for <b>{alias}</b> will be rebooted.</p>\n",
+                            subtype="html", cte="base64")
+    return message.as_bytes()
+
+
+def copy_for(alias: str) -> dict:
+    notification = sample_notification()
+    notification["mail"]["messageId"] = f"message-{alias}"
+    notification["mail"]["commonHeaders"]["subject"] = "RE: Scheduled maintenance"
+    notification["receipt"]["recipients"] = [alias]
+    return notification
+
+
+class test_dedup(TestCase):
+    def setUp(self):
+        self.table = MagicMock()
+        self.sqs = MagicMock()
+        self.conflict = app.ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException(
+            {"Error": {"Code": "ConditionalCheckFailedException", "Message": "Failed"}}, "UpdateItem"
+        )
+        patchers = [
+            patch.object(dedup, "DEDUP_QUEUE_URL", "https://sqs/dedup"),
+            patch.object(dedup, "state_table", self.table),
+            patch.object(dedup, "sqs", self.sqs),
+            patch.object(app.ddb, "get_account_owner_address", return_value="owner@example.com"),
+            patch.object(app.ses, "get_message_from_s3", side_effect=lambda bucket, key, *args: {"file": notice(key)}),
+            patch.object(app.metrics, "flush"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(app.metrics.counters.clear)
+
+    def test_copies_for_other_aliases_share_a_fingerprint(self):
+        first = dedup.get_fingerprint("acct-01@example.com", "Scheduled maintenance", notice("acct-01@example.com"))
+        self.assertEqual(
+            dedup.get_fingerprint("acct-02@example.com", "Re: scheduled  Maintenance", notice("acct-02@example.com")),
+            first,
+        )
+        self.assertNotEqual(
+            dedup.get_fingerprint("acct-02@example.com", "Scheduled maintenance", notice("acct-02@example.com") + b"!"),
+            first,
+        )
+
+    def test_multipart_copies_share_a_fingerprint(self):
+        first = multipart_notice("acct-01@example.com")
+        second = multipart_notice("acct-02@example.com")
+        self.assertEqual(
+            dedup.get_fingerprint("acct-01@example.com", "Scheduled maintenance", first),
+            dedup.get_fingerprint("acct-02@example.com", "Scheduled maintenance", second),
+        )
+        self.assertNotEqual(
+            dedup.get_fingerprint("acct-01@example.com", "Scheduled maintenance", first),
+            dedup.get_fingerprint("acct-01@example.com", "Scheduled maintenance", multipart_notice("other@example.com")),
+        )
+
+    def test_first_copy_is_forwarded_and_later_copies_collected(self):
+        closes_at = int(time.time()) + 60
+        self.table.update_item.side_effect = [
+            self.conflict,
+            {"Attributes": {"GroupId": "message-acct-01@example.com", "ClosesAt": closes_at}},
+            {"Attributes": {"GroupId": "message-acct-01@example.com", "ClosesAt": closes_at, "FlushScheduled": True}},
+        ]
+        copies = [copy_for(f"acct-0{n}@example.com") for n in range(1, 4)]
+        # The stored copies are found by their object key in the fake bucket
+        for copy in copies:
+            copy["receipt"]["action"]["objectKey"] = copy["receipt"]["recipients"][0]
+        with patch.object(app.ses, "create_message", return_value={}), \
+                patch.object(app.ses, "send_email", return_value="Email sent!") as send_email:
+            app.lambda_handler(sns_event(*copies), None)
+        send_email.assert_called_once()
+        item = self.table.put_item.call_args.kwargs["Item"]
+        self.assertEqual((item["Owner"], item["Aliases"]), ("owner@example.com", {"acct-01@example.com"}))
+        self.assertEqual(len({c.kwargs["Key"]["Key"] for c in self.table.update_item.call_args_list}), 1)
+        self.sqs.send_message.assert_called_once()
+        self.assertIn(self.sqs.send_message.call_args.kwargs["DelaySeconds"], [59, 60])
+        self.assertEqual(app.metrics.counters["MessagesDeduplicated"], 2)
+
+    def test_failed_schedule_is_cleared_for_the_retry(self):
+        self.table.update_item.side_effect = [
+            {"Attributes": {"GroupId": "message-1", "ClosesAt": int(time.time()) + 60}},
+            {},
+        ]
+        self.sqs.send_message.side_effect = RuntimeError("Throttling")
+        with self.assertRaises(RuntimeError):
+            dedup.collect("owner@example.com", "acct-02@example.com", copy_for("acct-02@example.com"), b"")
+        self.assertEqual(self.table.update_item.call_args.kwargs["UpdateExpression"], "REMOVE #s")
+
+    def test_group_is_forwarded_once_with_its_aliases(self):
+        group = {
+            "GroupId": "message-1",
+            "Owner": "owner@example.com",
+            "FirstAlias": "acct-01@example.com",
+            "Aliases": {"acct-01@example.com", "acct-03@example.com", "acct-02@example.com"},
+            "Bucket": "mail-bucket",
+            "ObjectKey": "acct-01@example.com",
+        }
+        self.table.update_item.side_effect = [{"Attributes": group}, {}, {}, self.conflict]
+        event = {
+            "Records": [
+                {"eventSource": "aws:sqs", "messageId": f"sqs-{n}", "body": json.dumps({"Key": "dedup#k", "GroupId": "message-1"})}
+                for n in range(2)
+            ]
+        }
+        with patch.object(app, "ADDRESS_FROM", "from@example.com"), \
+                patch.object(app.ses, "send_email", return_value="Email sent!") as send_email:
+            self.assertEqual(app.lambda_handler(event, None), {"batchItemFailures": []})
+        send_email.assert_called_once()
+        message = send_email.call_args.args[0]
+        self.assertEqual(message["Destinations"], "owner@example.com")
+        forwarded = email.message_from_string(message["Data"])
+        self.assertEqual(forwarded["Subject"], "Scheduled maintenance")
+        summary, original = forwarded.get_payload()
+        self.assertIn("acct-01@example.com\nacct-02@example.com\nacct-03@example.com", summary.get_payload())
+        self.assertIn("will be rebooted", original.get_payload())
+        self.assertEqual(self.table.update_item.call_args_list[1].kwargs["UpdateExpression"], "SET #sending = :now")
+        self.assertEqual(self.table.update_item.call_args_list[2].kwargs["UpdateExpression"], "SET #sent = :true")
+        self.assertEqual(app.metrics.counters["CollapsedAliases"], 3)
+
+    def test_failed_group_is_retried(self):
+        self.table.update_item.side_effect = RuntimeError("Throttling")
+        event = {"Records": [{"eventSource": "aws:sqs", "messageId": "sqs-1", "body": json.dumps({"Key": "k", "GroupId": "g"})}]}
+        self.assertEqual(app.lambda_handler(event, None), {"batchItemFailures": [{"itemIdentifier": "sqs-1"}]})
+
+    def test_claimed_group_is_not_sent_again(self):
+        """A flush interrupted between the send and marking it sent is not repeated"""
+        group = {
+            "GroupId": "g", "Owner": "owner@example.com", "FirstAlias": "acct-01@example.com",
+            "Aliases": {"acct-01@example.com"}, "Bucket": "mail-bucket", "ObjectKey": "acct-01@example.com",
+        }
+        self.table.update_item.side_effect = [{"Attributes": group}, self.conflict]
+        event = {"Records": [{"eventSource": "aws:sqs", "messageId": "sqs-1", "body": json.dumps({"Key": "k", "GroupId": "g"})}]}
+        with patch.object(app.ses, "send_email") as send_email:
+            self.assertEqual(app.lambda_handler(event, None), {"batchItemFailures": []})
+        send_email.assert_not_called()
@@ -0,0 +1,61 @@
+"""Unit tests for catch-all digest function"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from unittest import TestCase
+from unittest.mock import patch
+from tests.unit import load_function
+
+app = load_function("digestEmail", "app")
+
+entries = [
+    {
+        "MessageId": "second",
+        "Timestamp": "2021-06-10T10:46:00.000Z",
+        "Source": "spammer@example.net",
+        "Destination": "unknown@example.com",
+        "Subject": "Second",
+        "Bucket": "mail-bucket",
+        "ObjectKey": "mail/second",
+    },
+    {
+        "MessageId": "first",
+        "Timestamp": "2021-06-10T10:45:00.000Z",
+        "Source": "jdoe@example.net",
+        "Destination": "typo@example.com",
+        "Subject": "First",
+        "Bucket": "mail-bucket",
+        "ObjectKey": "mail/first",
+    },
+]
+
+
+class test_digest_email(TestCase):
+    def test_digest_lists_every_message(self):
+        body = app.create_digest_body(entries, [512, None])
+        self.assertIn("2 messages were received", body)
+        self.assertIn("From:     spammer@example.net", body)
+        self.assertIn("Size:     512 B", body)
+        self.assertIn("Size:     unknown", body)
+        self.assertIn("mail-bucket/mail/first", body)
+
+    def test_one_email_per_run(self):
+        received = [(f"handle-{i}", entry) for i, entry in enumerate(entries)]
+        with patch.object(app.sqs, "receive_entries", return_value=received), \
+                patch.object(app.sqs, "delete_entries") as delete_entries, \
+                patch.object(app.ses, "get_message_size", return_value=2048), \
+                patch.object(app.ses, "send_digest", return_value="Digest sent!") as send_digest:
+            app.lambda_handler({}, None)
+        send_digest.assert_called_once()
+        body = send_digest.call_args.args[3]
+        self.assertLess(body.index("Subject:  First"), body.index("Subject:  Second"))
+        delete_entries.assert_called_once_with(["handle-0", "handle-1"])
+
+    def test_entries_are_kept_when_sending_fails(self):
+        received = [("handle-0", entries[0])]
+        with patch.object(app.sqs, "receive_entries", return_value=received), \
+                patch.object(app.sqs, "delete_entries") as delete_entries, \
+                patch.object(app.ses, "get_message_size", return_value=None), \
+                patch.object(app.ses, "send_digest", side_effect=RuntimeError("Throttling")):
+            with self.assertRaises(RuntimeError):
+                app.lambda_handler({}, None)
+        delete_entries.assert_not_called()
@@ -0,0 +1,619 @@
+"""Unit tests for forward email function"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+from tests.unit import load_function
+
+app, ddb, policy, ratelimit, routing = load_function(
+    "fwdEmail", "app", "ddb", "policy", "ratelimit", "routing"
+)
+
+EVENTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "src", "events")
+
+
+def sample_notification(**verdicts) -> dict:
+    """Returns the sample SES notification with the given verdict statuses"""
+    with open(os.path.join(EVENTS_DIR, "event_SNS_message.json")) as f:
+        notification = json.load(f)
+    for verdict, status in verdicts.items():
+        notification["receipt"][verdict] = {"status": status}
+    return notification
+
+
+def sns_event(*notifications) -> dict:
+    return {
+        "Records": [
+            {"EventSource": "aws:sns", "Sns": {"Message": json.dumps(n)}}
+            for n in notifications
+        ]
+    }
+
+
+class test_verdict_policy(TestCase):
+    def test_passing_verdicts_are_allowed(self):
+        action, failed = policy.evaluate(sample_notification()["receipt"])
+        self.assertEqual(action, policy.ALLOW)
+        self.assertEqual(failed, [])
+
+    def test_most_severe_action_wins(self):
+        receipt = sample_notification(spamVerdict="FAIL", virusVerdict="FAIL")["receipt"]
+        actions = {"spamVerdict": policy.QUARANTINE, "virusVerdict": policy.DROP}
+        with patch.dict(policy.VERDICT_ACTIONS, actions):
+            action, failed = policy.evaluate(receipt)
+        self.assertEqual(action, policy.DROP)
+        self.assertEqual(failed, ["spamVerdict", "virusVerdict"])
+
+    def test_failed_verdict_with_allow_action(self):
+        receipt = sample_notification(dkimVerdict="FAIL")["receipt"]
+        action, failed = policy.evaluate(receipt)
+        self.assertEqual(action, policy.ALLOW)
+        self.assertEqual(failed, ["dkimVerdict"])
+
+
+class test_rate_limit(TestCase):
+    def test_sliding_window(self):
+        limiter = ratelimit.SlidingWindowLimiter("sender", 2, window_seconds=60)
+        self.assertTrue(limiter.hit("spammer@example.com", now=0))
+        self.assertTrue(limiter.hit("spammer@example.com", now=30))
+        self.assertFalse(limiter.hit("spammer@example.com", now=45))
+        self.assertTrue(limiter.hit("other@example.com", now=45))
+        # The hit at 0 has left the window but the rejected hit at 45 still counts
+        self.assertFalse(limiter.hit("spammer@example.com", now=61))
+        self.assertTrue(limiter.hit("spammer@example.com", now=106))
+
+    def test_shared_counter_weights_previous_window(self):
+        limiter = ratelimit.SlidingWindowLimiter("alias", 10, window_seconds=60)
+        table = MagicMock()
+        table.update_item.return_value = {"Attributes": {"Hits": 4}}
+        table.get_item.return_value = {"Item": {"Hits": 12}}
+        with patch.object(ratelimit, "state_table", table):
+            # 4 + 12 * 0.75 = 13 hits in the last 60 seconds
+            self.assertFalse(limiter.hit("alias@example.com", now=135))
+            # 4 + 12 * 0.25 = 7 hits in the last 60 seconds
+            self.assertTrue(limiter.hit("other@example.com", now=165))
+        self.assertEqual(
+            table.update_item.call_args_list[0].kwargs["Key"],
+            {"Key": "ratelimit#alias#alias@example.com#120"},
+        )
+
+    def test_state_table_alone_keeps_counters_local(self):
+        """Deduplication deploys the state table without sharing the counters"""
+        with patch.object(ratelimit, "STATE_TABLE_NAME", "state"), \
+                patch.object(ratelimit, "state_table", None), \
+                patch.object(ratelimit.boto3, "resource") as resource:
+            with patch.object(ratelimit, "RATE_LIMIT_SHARED", False):
+                ratelimit.create_clients()
+                self.assertIsNone(ratelimit.state_table)
+            with patch.object(ratelimit, "RATE_LIMIT_SHARED", "true"):
+                ratelimit.create_clients()
+                self.assertIs(ratelimit.state_table, resource.return_value.Table.return_value)
+
+    def test_disabled_limit_allows_everything(self):
+        limiter = ratelimit.SlidingWindowLimiter("sender", 0)
+        for _ in range(100):
+            self.assertTrue(limiter.hit("spammer@example.com"))
+
+
+class test_routing_rules(TestCase):
+    rules = [
+        {"Pattern": "billing@example.com", "Target": "finance@example.com"},
+        {"Pattern": "*-prod-*@example.com", "Target": "on-call@example.com"},
+        {"Pattern": "security-incident-*", "Target": "csirt@example.com"},
+        {"Pattern": "security-*", "Target": "security@example.com"},
+        {"Pattern": "*@example.com", "Target": "domain@example.com"},
+        {"Pattern": "*-dev-*", "Target": "dev@example.com"},
+        {"Pattern": "*-prod-?@example.com"},
+    ]
+
+    def test_matcher_precedence(self):
+        """The first matching rule wins, whatever kind of pattern it has"""
+        matcher = routing.RuleMatcher(self.rules)
+        for address, target in [
+            ("billing@example.com", "finance@example.com"),
+            ("Billing@Example.com", "finance@example.com"),
+            ("security-incident-42@example.net", "csirt@example.com"),
+            ("security-audit@example.net", "security@example.com"),
+            ("app-prod-001@example.com", "on-call@example.com"),
+            ("app-prod-001@example.net", None),
+            ("app-dev-001@example.com", "domain@example.com"),
+            ("app-dev-001@example.net", "dev@example.com"),
+            ("nobody@example.org", None),
+        ]:
+            with self.subTest(address=address):
+                self.assertEqual(matcher.match(address), target)
+
+    def test_earlier_rules_shadow_later_ones(self):
+        matcher = routing.RuleMatcher(list(reversed(self.rules[:6])))
+        self.assertEqual(matcher.match("billing@example.com"), "domain@example.com")
+        self.assertEqual(matcher.match("app-prod-001@example.com"), "domain@example.com")
+        self.assertEqual(matcher.match("security-incident-42@example.net"), "security@example.com")
+
+    def test_regex_rules_in_order(self):
+        matcher = routing.RuleMatcher(self.rules[1:2] + self.rules[5:6])
+        self.assertEqual(matcher.match("app-prod-dev-001@example.com"), "on-call@example.com")
+        self.assertEqual(matcher.match("app-dev-prod-001@example.net"), "dev@example.com")
+
+    def test_normalize_subaddress(self):
+        # Off unless a delimiter is configured
+        self.assertEqual(routing.normalize_address("a+b@example.com"), "a+b@example.com")
+        with patch.object(routing, "SUBADDRESS_DELIMITER", "+"):
+            self.assertEqual(routing.normalize_address("acct-001+billing@example.com"), "acct-001@example.com")
+            self.assertEqual(routing.normalize_address("acct-001@example.com"), "acct-001@example.com")
+
+    def test_table_rules_reload_on_new_version(self):
+        items = [
+            {"Version": 1, "Rules": [{"Pattern": "ops-*", "Target": "ops@example.com"}]},
+            {"Version": 1, "Rules": [{"Pattern": "ops-*", "Target": "ops@example.com"}]},
+            {"Version": 2, "Rules": [{"Pattern": "ops-*", "Target": "new-ops@example.com"}]},
+        ]
+        with patch.object(routing, "ROUTING_RULES_IN_TABLE", "true"), \
+                patch.object(routing, "ROUTING_RULES_REFRESH_SECONDS", 0), \
+                patch.object(routing, "table_rules_version", None), \
+                patch.object(routing, "matcher", routing.matcher), \
+                patch.object(routing.ddb, "get_routing_rules_item", side_effect=items):
+            first = routing.get_matcher()
+            self.assertEqual(first.match("ops-1@example.com"), "ops@example.com")
+            self.assertIs(routing.get_matcher(), first)
+            self.assertEqual(routing.match("ops-1@example.com"), "new-ops@example.com")
+
+    def test_table_rules_take_precedence(self):
+        item = {"Version": 1, "Rules": [
+            {"Pattern": "*-prod-*@example.com", "Target": "on-call@example.com"},
+            {"Pattern": "app-*", "Target": "apps@example.com"},
+        ]}
+        config_rules = [
+            {"Pattern": "*@example.com", "Target": "domain@example.com"},
+            {"Pattern": "app-prod-*", "Target": "prod@example.com"},
+        ]
+        with patch.object(routing, "ROUTING_RULES_IN_TABLE", "true"), \
+                patch.object(routing, "ROUTING_RULES_REFRESH_SECONDS", 0), \
+                patch.object(routing, "table_rules_version", None), \
+                patch.object(routing, "config_rules", config_rules), \
+                patch.object(routing, "matcher", routing.matcher), \
+                patch.object(routing.ddb, "get_routing_rules_item", return_value=item):
+            self.assertEqual(routing.match("web-prod-1@example.com"), "on-call@example.com")
+            self.assertEqual(routing.match("app-prod-1@example.net"), "apps@example.com")
+            self.assertEqual(routing.match("billing@example.com"), "domain@example.com")
+
+
+def snapshot_object(owners: dict, etag: str) -> dict:
+    body = gzip.compress(json.dumps({"FormatVersion": 1, "Owners": owners}).encode())
+    return {"Body": io.BytesIO(body), "ETag": etag}
+
+
+class test_owner_snapshot(TestCase):
+    def setUp(self):
+        self.s3 = MagicMock()
+        self.table = MagicMock()
+        self.table.get_item.return_value = {"Item": {"OwnerAddress": "table@example.com"}}
+        patchers = [
+            patch.object(ddb, "s3", self.s3),
+            patch.object(ddb, "account_table", self.table),
+            patch.object(ddb, "OWNER_SNAPSHOT_REFRESH_SECONDS", 0),
+            patch.object(ddb, "owner_snapshot", None),
+            patch.object(ddb, "owner_snapshot_etag", None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_hits_are_served_from_the_snapshot(self):
+        self.s3.get_object.side_effect = [
+            snapshot_object({"acct-001@example.com": "owner@example.com"}, '"v1"'),
+            ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"),
+        ]
+        self.assertEqual(ddb.get_account_owner_address("acct-001@example.com"), "owner@example.com")
+        self.assertEqual(ddb.get_account_owner_address("acct-002@example.com"), "table@example.com")
+        self.table.get_item.assert_called_once()
+        self.assertEqual(self.s3.get_object.call_args.kwargs["IfNoneMatch"], '"v1"')
+
+    def test_snapshot_is_replaced_when_etag_changes(self):
+        self.s3.get_object.side_effect = [
+            snapshot_object({"acct-001@example.com": "owner@example.com"}, '"v1"'),
+            snapshot_object({"acct-001@example.com": "new-owner@example.com"}, '"v2"'),
+        ]
+        self.assertEqual(ddb.get_account_owner_address("acct-001@example.com"), "owner@example.com")
+        self.assertEqual(ddb.get_account_owner_address("acct-001@example.com"), "new-owner@example.com")
+        self.table.get_item.assert_not_called()
+
+    def test_table_is_used_when_snapshot_is_missing(self):
+        self.s3.get_object.side_effect = ClientError(
+            {"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject"
+        )
+        self.assertEqual(ddb.get_account_owner_address("acct-001@example.com"), "table@example.com")
+
+
+class test_owner_cache(TestCase):
+    def setUp(self):
+        self.table = MagicMock()
+        self.marker = {"Version": 1, "Since": 0, "Changes": {}}
+        self.owners = {"acct-001@example.com": "a@example.com", "acct-002@example.com": "b@example.com"}
+
+        def get_item(Key, **kwargs):
+            if Key["AccountEmail"] == ddb.MAPPING_VERSION_KEY:
+                return {"Item": dict(self.marker)}
+            return {"Item": {"OwnerAddress": self.owners[Key["AccountEmail"]]}}
+
+        self.table.get_item.side_effect = get_item
+        patchers = [
+            patch.object(ddb, "account_table", self.table),
+            patch.object(ddb, "s3", None),
+            patch.object(ddb, "OWNER_CACHE_TTL_SECONDS", 3600),
+            patch.object(ddb, "MAPPING_VERSION_CHECK_SECONDS", 0),
+            patch.object(ddb, "owner_cache", {}),
+            patch.object(ddb, "mapping_version", None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def owner_reads(self) -> int:
+        return sum(
+            1 for c in self.table.get_item.call_args_list
+            if c.kwargs["Key"]["AccountEmail"] != ddb.MAPPING_VERSION_KEY
+        )
+
+    def test_only_changed_owners_are_dropped(self):
+        ddb.get_account_owner_address("acct-001@example.com")
+        ddb.get_account_owner_address("acct-002@example.com")
+        self.assertEqual(self.owner_reads(), 2)
+        self.owners["acct-001@example.com"] = "new-a@example.com"
+        self.marker = {"Version": 2, "Since": 0, "Changes": {"acct-001@example.com": 2}}
+        self.assertEqual(ddb.get_account_owner_address("acct-001@example.com"), "new-a@example.com")
+        self.assertEqual(ddb.get_account_owner_address("acct-002@example.com"), "b@example.com")
+        self.assertEqual(self.owner_reads(), 3)
+
+    def test_pruned_changes_clear_the_cache(self):
+        ddb.get_account_owner_address("acct-001@example.com")
+        ddb.get_account_owner_address("acct-002@example.com")
+        self.marker = {"Version": 9, "Since": 5, "Changes": {}}
+        ddb.get_account_owner_address("acct-002@example.com")
+        self.assertEqual(self.owner_reads(), 3)
+        self.assertEqual(ddb.mapping_version, 9)
+
+
+class test_forward_email(TestCase):
+    def test_rejected_message_is_not_fetched(self):
+        """Dropped and quarantined messages never reach S3, DynamoDB or SES"""
+        for action in [policy.DROP, policy.QUARANTINE]:
+            with self.subTest(action=action):
+                with patch.dict(policy.VERDICT_ACTIONS, {"virusVerdict": action}), \
+                        patch.object(app.ses, "get_message_from_s3") as get_message, \
+                        patch.object(app.ses, "quarantine_message") as quarantine, \
+                        patch.object(app.ses, "send_email") as send_email, \
+                        patch.object(app.ddb, "get_account_owner_address") as get_owner, \
+                        patch.object(app.metrics, "flush"):
+                    app.lambda_handler(sns_event(sample_notification(virusVerdict="FAIL")), None)
+                    get_message.assert_not_called()
+                    get_owner.assert_not_called()
+                    send_email.assert_not_called()
+                    self.assertEqual(quarantine.called, action == policy.QUARANTINE)
+                    self.assertEqual(app.metrics.counters.get("VirusVerdictFailed"), 1)
+                    app.metrics.counters.clear()
+
+    def test_all_records_are_processed(self):
+        """A message without a recipient does not stop the rest of the batch"""
+        with patch.object(app, "DISABLE_CATCH_ALL", "true"), \
+                patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}), \
+                patch.object(app.ses, "create_message", return_value={}), \
+                patch.object(app.ses, "send_email", return_value="Email sent!") as send_email, \
+                patch.object(app.ddb, "get_account_owner_address", side_effect=[None, "owner@example.com"]):
+            app.lambda_handler(sns_event(sample_notification(), sample_notification()), None)
+        send_email.assert_called_once()
+
+    def test_rate_limited_catch_all_is_not_fetched(self):
+        with patch.object(app, "ADDRESS_ADMIN", "admin@example.com"), \
+                patch.object(app.ratelimit, "check", return_value=["sender"]), \
+                patch.object(app.ses, "get_message_from_s3") as get_message, \
+                patch.object(app.ses, "send_email") as send_email, \
+                patch.object(app.ddb, "get_account_owner_address", return_value=None), \
+                patch.object(app.metrics, "flush"):
+            app.lambda_handler(sns_event(sample_notification()), None)
+        get_message.assert_not_called()
+        send_email.assert_not_called()
+        self.assertEqual(app.metrics.counters.pop("RateLimitedSender"), 1)
+        app.metrics.counters.clear()
+
+    def test_owned_alias_is_not_rate_limited(self):
+        with patch.object(app.ratelimit, "check") as check, \
+                patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}), \
+                patch.object(app.ses, "create_message", return_value={}), \
+                patch.object(app.ses, "send_email", return_value="Email sent!") as send_email, \
+                patch.object(app.ddb, "get_account_owner_address", return_value="owner@example.com"):
+            app.lambda_handler(sns_event(sample_notification()), None)
+        check.assert_not_called()
+        send_email.assert_called_once()
+
+    def test_catch_all_digest(self):
+        """Catch-all messages are queued for the digest instead of being sent"""
+        for mode, exceeded, digested in [
+            ("ALL", [], True),
+            ("OVER_LIMIT", [], False),
+            ("OVER_LIMIT", ["alias"], True),
+        ]:
+            with self.subTest(mode=mode, exceeded=exceeded):
+                with patch.object(app, "ADDRESS_ADMIN", "admin@example.com"), \
+                        patch.object(app.digest, "DIGEST_CATCH_ALL", mode), \
+                        patch.object(app.digest, "buffer_message") as buffer_message, \
+                        patch.object(app.ratelimit, "check", return_value=exceeded), \
+                        patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}), \
+                        patch.object(app.ses, "create_message", return_value={}), \
+                        patch.object(app.ses, "send_email", return_value="Email sent!") as send_email, \
+                        patch.object(app.ddb, "get_account_owner_address", return_value=None), \
+                        patch.object(app.metrics, "flush"):
+                    app.lambda_handler(sns_event(sample_notification()), None)
+                self.assertEqual(buffer_message.called, digested)
+                self.assertEqual(send_email.called, not digested and not exceeded)
+                app.metrics.counters.clear()
+
+    def test_routing_rule_skips_table_lookup(self):
+        matcher = routing.RuleMatcher([{"Pattern": "john@*", "Target": "on-call@example.com"}])
+        with patch.object(app.routing, "matcher", matcher), \
+                patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}), \
+                patch.object(app.ses, "create_message", return_value={}) as create_message, \
+                patch.object(app.ses, "send_email", return_value="Email sent!"), \
+                patch.object(app.ddb, "get_account_owner_address") as get_owner:
+            app.lambda_handler(sns_event(sample_notification()), None)
+        get_owner.assert_not_called()
+        self.assertEqual(create_message.call_args.args[1], "on-call@example.com")
+
+    def test_async_mode_forwards_every_record(self):
+        """A failing record does not stop the other records in async mode"""
+        owners = {
+            "a@example.com": "owner-a@example.com",
+            "b@example.com": "owner-b@example.com",
+            "c@example.com": "owner-c@example.com",
+        }
+        notifications = []
+        for recipient in owners:
+            notification = sample_notification()
+            notification["receipt"]["recipients"] = [recipient]
+            notifications.append(notification)
+
+        def send_email(message):
+            if message == "owner-b@example.com":
+                raise RuntimeError("Throttling")
+            return "Email sent!"
+
+        with patch.object(app, "FORWARDER_MODE", app.ASYNC_MODE), \
+                patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}), \
+                patch.object(app.ses, "create_message", side_effect=lambda f, to, d: to), \
+                patch.object(app.ses, "send_email", side_effect=send_email) as send, \
+                patch.object(app.ddb, "get_account_owner_address", side_effect=owners.get):
+            with self.assertRaises(RuntimeError):
+                app.lambda_handler(sns_event(*notifications), None)
+        self.assertCountEqual(
+            [c.args[0] for c in send.call_args_list], list(owners.values())
+        )
+
+    def test_delivery_log_records_outcomes(self):
+        """Each message gets one record, written in a batch after forwarding"""
+        table = MagicMock()
+        dropped = sample_notification(virusVerdict="FAIL")
+        dropped["mail"]["messageId"] = "dropped-id"
+        dropped["receipt"]["recipients"] = ["acct-001+billing@example.com"]
+        with patch.object(app.deliverylog, "delivery_log_table", table), \
+                patch.object(app, "ADDRESS_ADMIN", "admin@example.com"), \
+                patch.object(routing, "SUBADDRESS_DELIMITER", "+"), \
+                patch.dict(policy.VERDICT_ACTIONS, {"virusVerdict": policy.DROP}), \
+                patch.object(app.ses, "get_message_from_s3", return_value={"file": b"12345"}), \
+                patch.object(app.ses, "create_message", return_value={}), \
+                patch.object(app.ses, "send_email", side_effect=["Verification_Error", "Email sent!"]), \
+                patch.object(app.ddb, "get_account_owner_address", return_value="owner@example.com"), \
+                patch.object(app.metrics, "flush"):
+            app.lambda_handler(sns_event(dropped, sample_notification()), None)
+        app.metrics.counters.clear()
+        batch = table.batch_writer.return_value.__enter__.return_value
+        items = {c.kwargs["Item"]["MessageId"]: c.kwargs["Item"] for c in batch.put_item.call_args_list}
+        self.assertEqual(items["dropped-id"]["Outcome"], "DROPPED")
+        self.assertEqual(items["dropped-id"]["Alias"], "acct-001@example.com")
+        self.assertNotIn("Owner", items["dropped-id"])
+        rerouted = items[sample_notification()["mail"]["messageId"]]
+        self.assertEqual(rerouted["Outcome"], "REROUTED")
+        self.assertEqual(rerouted["Owner"], "admin@example.com")
+        self.assertEqual(rerouted["Size"], 5)
+        self.assertEqual(app.deliverylog.records, [])
+
+    def test_failure_is_raised_without_a_timestamp(self):
+        """Recording a failure never replaces the error being handled"""
+        notification = sample_notification()
+        del notification["mail"]["timestamp"]
+        with patch.object(app.deliverylog, "delivery_log_table", MagicMock()), \
+                patch.object(app.deliverylog, "records", []) as records, \
+                patch.object(app.ses, "get_message_from_s3", side_effect=RuntimeError("S3 unavailable")), \
+                patch.object(app.ddb, "get_account_owner_address", return_value="owner@example.com"), \
+                patch.object(app.deliverylog, "flush"), \
+                patch.object(app.metrics, "flush"):
+            with self.assertRaisesRegex(RuntimeError, "S3 unavailable"):
+                app.lambda_handler(sns_event(notification), None)
+            self.assertEqual(records[0]["Outcome"], "FAILED")
+            self.assertNotIn("LatencyMs", records[0])
+            self.assertTrue(records[0]["Timestamp"].endswith("Z"))
+        app.metrics.counters.clear()
+
+    def test_suppressed_recipient(self):
+        """Suppressed owners are rerouted to the admin or dropped before fetching"""
+        for action, sent_to in [("REROUTE", "admin@example.com"), ("DROP", None)]:
+            with self.subTest(action=action):
+                with patch.object(app, "ADDRESS_ADMIN", "admin@example.com"), \
+                        patch.object(app.suppression, "SUPPRESSED_RECIPIENT_ACTION", action), \
+                        patch.dict(app.suppression.suppression_cache, clear=True), \
+                        patch.object(app.ddb, "account_table") as table, \
+                        patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}) as get_message, \
+                        patch.object(app.ses, "create_message", return_value={}) as create_message, \
+                        patch.object(app.ses, "send_email", return_value="Email sent!") as send_email, \
+                        patch.object(app.ddb, "get_account_owner_address", return_value="owner@example.com"), \
+                        patch.object(app.metrics, "flush"):
+                    table.get_item.return_value = {"Item": {"ExpiresAt": int(time.time()) + 60}}
+                    app.lambda_handler(sns_event(sample_notification()), None)
+                    self.assertEqual(
+                        table.get_item.call_args.kwargs["Key"], {"AccountEmail": "#suppression#owner@example.com"}
+                    )
+                    # Expired suppressions the TTL has not deleted yet are ignored
+                    table.get_item.return_value = {"Item": {"ExpiresAt": int(time.time()) - 60}}
+                    self.assertFalse(app.ddb.is_address_suppressed("owner@example.com"))
+                if sent_to:
+                    self.assertEqual(create_message.call_args.args[1], sent_to)
+                else:
+                    get_message.assert_not_called()
+                    send_email.assert_not_called()
+                self.assertEqual(app.metrics.counters.pop("MessagesSuppressed"), 1)
+                app.metrics.counters.clear()
+
+
+class test_prefetch(TestCase):
+    def test_download_overlaps_owner_lookup(self):
+        downloading = threading.Event()
+
+        def get_message(bucket, key, cancelled):
+            downloading.set()
+            return {"file": b"12345"}
+
+        def get_owner(address):
+            # Only returns once the download runs alongside the lookup
+            self.assertTrue(downloading.wait(5))
+            return "owner@example.com"
+
+        for mode in ["sync", app.ASYNC_MODE]:
+            downloading.clear()
+            with self.subTest(mode=mode):
+                with patch.object(app, "PREFETCH_MESSAGE", "true"), \
+                        patch.object(app, "FORWARDER_MODE", mode), \
+                        patch.object(app.ses, "get_message_from_s3", side_effect=get_message), \
+                        patch.object(app.ses, "create_message", return_value={}) as create_message, \
+                        patch.object(app.ses, "send_email", return_value="Email sent!"), \
+                        patch.object(app.ddb, "get_account_owner_address", side_effect=get_owner):
+                    app.lambda_handler(sns_event(sample_notification()), None)
+                self.assertEqual(create_message.call_args.args[1:], ("owner@example.com", {"file": b"12345"}))
+
+    def test_download_is_cancelled_when_dropped(self):
+        def get_message(bucket, key, cancelled):
+            self.assertTrue(cancelled.wait(5))
+            return None
+
+        with patch.object(app, "PREFETCH_MESSAGE", "true"), \
+                patch.object(app, "DISABLE_CATCH_ALL", "true"), \
+                patch.object(app.ses, "get_message_from_s3", side_effect=get_message), \
+                patch.object(app.ses, "send_email") as send_email, \
+                patch.object(app.ddb, "get_account_owner_address", return_value=None), \
+                patch.object(app.metrics, "flush"):
+            app.lambda_handler(sns_event(sample_notification()), None)
+        send_email.assert_not_called()
+        self.assertEqual(app.metrics.counters.pop("PrefetchesCancelled"), 1)
+        app.metrics.counters.clear()
+
+    def test_cached_owner_is_resolved_before_download(self):
+        address = routing.normalize_address(sample_notification()["receipt"]["recipients"][0])
+        with patch.object(app, "PREFETCH_MESSAGE", "true"), \
+                patch.object(app, "DISABLE_CATCH_ALL", "true"), \
+                patch.dict(ddb.owner_cache, {address: (None, float("inf"))}), \
+                patch.object(app.ddb, "check_mapping_version"), \
+                patch.object(app.ses, "get_message_from_s3") as get_message:
+            app.lambda_handler(sns_event(sample_notification()), None)
+        get_message.assert_not_called()
+
+    def test_cancelled_download_stops_reading(self):
+        body = MagicMock()
+        body.read.side_effect = [b"a" * 10, b"b" * 10, b""]
+        s3 = MagicMock()
+        s3.Object.return_value.get.return_value = {"Body": body}
+        cancelled = threading.Event()
+        with patch.object(app.ses, "s3", s3):
+            self.assertEqual(app.ses.get_message_from_s3("bucket", "key")["file"], b"a" * 10 + b"b" * 10)
+            s3.Object.return_value.get.assert_called_once()
+
+            def read(size):
+                # The message is dropped while the first chunk is read
+                cancelled.set()
+                return b"a" * 10
+
+            body.read.side_effect = read
+            self.assertIsNone(app.ses.get_message_from_s3("bucket", "key", cancelled))
+            self.assertEqual(body.read.call_count, 4)
+            body.close.assert_called_once()
+            self.assertIsNone(app.ses.get_message_from_s3("bucket", "key", cancelled))
+        self.assertEqual(s3.Object.return_value.get.call_count, 2)
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms: int):
+        self.remaining_ms = remaining_ms
+        self.aws_request_id = "request"
+
+    def get_remaining_time_in_millis(self) -> int:
+        return self.remaining_ms
+
+
+class test_deadline(TestCase):
+    def setUp(self):
+        patchers = [
+            patch.object(app.deadline, "DEADLINE_SAFETY_MARGIN_MS", 500),
+            patch.dict(app.deadline.estimates, {"route": 0, "fetch": 100, "send": 800}, clear=True),
+            patch.object(app.ses, "create_message", return_value={}),
+            patch.object(app.ddb, "get_account_owner_address", return_value="owner@example.com"),
+            patch.object(app.metrics, "flush"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(app.metrics.counters.clear)
+
+    def test_messages_that_do_not_fit_are_deferred(self):
+        def send_email(message):
+            # The send takes 1.5 seconds of the invocation
+            app.deadline.invocation_deadline -= 1.5
+            return "Email sent!"
+
+        first, second = sample_notification(), sample_notification()
+        second["mail"]["messageId"] = "second"
+        with patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}), \
+                patch.object(app.ses, "send_email", side_effect=send_email) as send:
+            # Only the deferred message is returned, the event is not retried
+            response = app.lambda_handler(sns_event(first, second), LambdaContext(2500))
+        send.assert_called_once()
+        self.assertEqual(response, {app.DEFERRED_MESSAGE_IDS: ["second"]})
+        self.assertEqual(app.metrics.counters.get("MessagesDeferred"), 1)
+
+    def test_send_is_not_started_after_slow_download(self):
+        def get_message(bucket, key, cancelled, until):
+            # The download leaves less than the send takes
+            app.deadline.invocation_deadline -= 1.5
+            return {"file": b""}
+
+        for mode in ["sync", app.ASYNC_MODE]:
+            with self.subTest(mode=mode):
+                with patch.object(app, "FORWARDER_MODE", mode), \
+                        patch.object(app.ses, "get_message_from_s3", side_effect=get_message), \
+                        patch.object(app.ses, "send_email") as send:
+                    with self.assertRaises(app.deadline.DeadlineExceeded):
+                        app.lambda_handler(sns_event(sample_notification()), LambdaContext(2500))
+                send.assert_not_called()
+                self.assertEqual(app.metrics.counters.pop("MessagesDeferred"), 1)
+
+    def test_late_download_stops_reading(self):
+        body = MagicMock()
+        body.read.side_effect = [b"a" * 10, b"b" * 10, b""]
+        s3 = MagicMock()
+        s3.Object.return_value.get.return_value = {"Body": body}
+        with patch.object(app.ses, "s3", s3), self.assertRaises(TimeoutError):
+            app.ses.get_message_from_s3("bucket", "key", None, app.time.monotonic() - 1)
+        body.close.assert_called_once()
+
+    def test_groups_that_do_not_fit_are_returned(self):
+        event = {"Records": [
+            {"eventSource": "aws:sqs", "messageId": f"sqs-{i}", "body": json.dumps({"Key": "k", "GroupId": "g"})}
+            for i in range(3)
+        ]}
+        with patch.object(app, "forward_collapsed") as forward_collapsed:
+            response = app.lambda_handler(event, LambdaContext(1000))
+        forward_collapsed.assert_not_called()
+        self.assertEqual([f["itemIdentifier"] for f in response["batchItemFailures"]], ["sqs-0", "sqs-1", "sqs-2"])
+        self.assertEqual(app.metrics.counters.get("GroupsDeferred"), 3)
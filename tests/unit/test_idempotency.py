@@ -0,0 +1,98 @@
+"""Unit tests for idempotent vend requests"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from src.vendEmail import app
+
+os.environ["SES_DOMAIN_NAME"] = "example.com"
+
+REQUEST = {
+    "OwnerAddress": "owner@example.com",
+    "AccountType": "IT",
+    "Tags": {"BusinessUnit": "it", "ApplicationName": "portal", "Environment": "PRODUCTION"},
+}
+VENDED = {"statusCode": 200, "body": {"AccountName": "it-portal-prod-001"}, "headers": {}}
+
+
+class test_idempotency(TestCase):
+    def setUp(self):
+        self.table = MagicMock()
+        self.conflict = app.ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException(
+            {"Error": {"Code": "ConditionalCheckFailedException", "Message": "Exists"}}, "PutItem"
+        )
+        patchers = [
+            patch.object(app.ddb, "account_table", self.table),
+            patch.object(app.idempotency, "IDEMPOTENCY_KEY_SOURCE", app.idempotency.REQUEST),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_repeat_returns_stored_response(self):
+        with patch.object(app, "vend_account", return_value=VENDED) as vend:
+            self.assertEqual(app.lambda_handler(dict(REQUEST, IdempotencyKey="order-1"), None), VENDED)
+            stored = self.table.update_item.call_args.kwargs["ExpressionAttributeValues"][":response"]
+            self.table.put_item.side_effect = self.conflict
+            self.table.update_item.side_effect = self.conflict
+            self.table.get_item.return_value = {"Item": {"Response": stored}}
+            # Repeats are answered before the request is validated
+            self.assertEqual(app.lambda_handler({"IdempotencyKey": "order-1"}, None), VENDED)
+        vend.assert_called_once()
+        self.assertEqual(self.table.put_item.call_args.kwargs["Item"]["AccountEmail"], "#idem#order-1")
+
+    def test_request_hash_is_the_default_key(self):
+        with patch.object(app, "vend_account", return_value=VENDED):
+            # A retry of the invocation and an identical request in another one
+            app.lambda_handler(dict(REQUEST), SimpleNamespace(aws_request_id="request-1"))
+            app.lambda_handler(json.loads(json.dumps(REQUEST)), SimpleNamespace(aws_request_id="request-1"))
+            app.lambda_handler(dict(REQUEST), SimpleNamespace(aws_request_id="request-2"))
+        keys = [c.kwargs["Item"]["AccountEmail"] for c in self.table.put_item.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+        self.assertTrue(keys[0].startswith("#idem#sha256:"))
+
+    def test_claimed_key_without_response_is_in_progress(self):
+        # The lease of the claim has not run out
+        self.table.put_item.side_effect = self.conflict
+        self.table.update_item.side_effect = self.conflict
+        self.table.get_item.return_value = {"Item": {}}
+        with patch.object(app, "vend_account") as vend:
+            response = app.lambda_handler(dict(REQUEST, IdempotencyKey="order-2"), None)
+        vend.assert_not_called()
+        self.assertEqual(response["statusCode"], 500)
+
+    def test_failed_vend_releases_the_key(self):
+        failed = {"statusCode": 500, "body": {"message": "exists"}, "headers": {}}
+        with patch.object(app, "vend_account", return_value=failed):
+            app.lambda_handler(dict(REQUEST, IdempotencyKey="order-3"), None)
+        self.table.delete_item.assert_called_once()
+        self.table.update_item.assert_not_called()
+
+    def test_timeout_after_store_is_finished_by_the_retry(self):
+        allocation = {"AllocatedName": "it-portal-prod-001", "AllocatedEmail": "it-portal-prod-001@example.com"}
+        client = app.ddb.ddb.meta.client
+        with patch.object(client, "transact_write_items") as transact, \
+                patch.object(app, "get_new_account_data", return_value=tuple(allocation.values())) as allocate, \
+                patch.object(app, "claim_reserved_account_data", return_value=None), \
+                patch.object(app.ddb, "account_exists", return_value=False), \
+                patch.object(app.ddb, "get_account_by_name", return_value={}), \
+                patch.object(app.ses, "verify_email_address", side_effect=[TimeoutError, "Success"]):
+            with self.assertRaises(TimeoutError):
+                app.lambda_handler(dict(REQUEST, IdempotencyKey="order-4"), None)
+            # The account and its allocation on the claim are written together
+            put, update = (item.popitem()[1] for item in transact.call_args.kwargs["TransactItems"])
+            self.assertEqual(put["Item"]["AccountEmail"], {"S": "it-portal-prod-001@example.com"})
+            self.assertEqual(update["Key"], {"AccountEmail": {"S": "#idem#order-4"}})
+            # The claim keeps its allocation for the retry to take over
+            self.assertIn("attribute_not_exists(#a)", self.table.delete_item.call_args.kwargs["ConditionExpression"])
+            self.table.put_item.side_effect = self.conflict
+            self.table.update_item.return_value = {"Attributes": dict(allocation, LeaseUntil=1)}
+            response = app.lambda_handler(dict(REQUEST, IdempotencyKey="order-4"), None)
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(response["body"]["AccountName"], "it-portal-prod-001")
+        allocate.assert_called_once()
+        transact.assert_called_once()
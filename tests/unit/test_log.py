@@ -0,0 +1,83 @@
+"""Unit tests for the structured logging library"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import json
+import logging
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from tests.unit import load_function
+
+app, log = load_function("fwdEmail", "app", "log")
+
+
+class Expensive:
+    """Counts how often it is rendered"""
+
+    def __init__(self):
+        self.rendered = 0
+
+    def __str__(self) -> str:
+        self.rendered += 1
+        return "expensive"
+
+
+class test_log(TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.addFilter(log.SamplingFilter())
+        handler.setFormatter(log.JsonFormatter())
+        self.logger = logging.getLogger("test-log")
+        self.logger.handlers = [handler]
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        log.start_invocation(SimpleNamespace(aws_request_id="request-1"))
+
+    def records(self) -> list[dict]:
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_suppressed_levels_are_not_rendered(self):
+        value = Expensive()
+        self.logger.debug("Value %s", value)
+        with patch.dict(log.LOG_SAMPLE_RATES, {"INFO": 0}):
+            self.logger.info("Value %s", value)
+            self.logger.warning("Value %s", value)
+        self.assertEqual(value.rendered, 1)
+        self.assertEqual([r["level"] for r in self.records()], ["WARNING"])
+
+    def test_event_is_not_serialized_below_debug(self):
+        with patch.object(log.json, "dumps") as dumps, \
+                patch.object(app, "forward_message"), \
+                patch.object(app.metrics, "flush"):
+            logging.getLogger().setLevel(logging.INFO)
+            app.lambda_handler({"Records": []}, None)
+        dumps.assert_not_called()
+
+    def test_budget_drops_records_after_the_limit(self):
+        value = Expensive()
+        with patch.object(log, "LOG_BUDGET", 2):
+            for _ in range(5):
+                self.logger.info("Value %s", value)
+            self.logger.error("Always kept")
+            with patch.object(log.logging, "getLogger", return_value=self.logger):
+                log.end_invocation()
+        self.assertEqual(value.rendered, 2)
+        messages = [r["message"] for r in self.records()]
+        self.assertEqual(messages[-1], "Log budget of 2 records exhausted, 3 records dropped")
+        self.assertIn("Always kept", messages)
+
+    def test_records_carry_correlation_ids(self):
+        log.correlation_id.set("message-1")
+        self.logger.info("Forwarded")
+        self.assertEqual(
+            {k: v for k, v in self.records()[0].items() if k != "timestamp"},
+            {
+                "level": "INFO",
+                "logger": "test-log",
+                "message": "Forwarded",
+                "requestId": "request-1",
+                "correlationId": "message-1",
+            },
+        )
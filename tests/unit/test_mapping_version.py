@@ -0,0 +1,48 @@
+"""Unit tests for mapping version function"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from tests.unit import load_function
+
+app, ddb = load_function("mappingVersion", "app", "ddb")
+
+
+def stream_record(account_email: str) -> dict:
+    return {"dynamodb": {"Keys": {"AccountEmail": {"S": account_email}}}}
+
+
+class test_mapping_version(TestCase):
+    def test_changed_keys_get_the_next_version(self):
+        item = {"Version": 4, "Since": 0, "Changes": {"acct-001@example.com": 2}}
+        marker = ddb.next_marker(item, ["acct-002@example.com"])
+        self.assertEqual(marker["Version"], 5)
+        self.assertEqual(marker["Changes"], {"acct-001@example.com": 2, "acct-002@example.com": 5})
+        self.assertEqual(marker["Since"], 0)
+
+    def test_oldest_changes_are_pruned(self):
+        item = {"Version": 3, "Changes": {"a@example.com": 1, "b@example.com": 2, "c@example.com": 3}}
+        with patch.object(ddb, "MAX_TRACKED_CHANGES", 2):
+            marker = ddb.next_marker(item, ["d@example.com"])
+        self.assertEqual(marker["Changes"], {"c@example.com": 3, "d@example.com": 4})
+        self.assertEqual(marker["Since"], 2)
+
+    def test_conflicting_write_is_retried(self):
+        table = MagicMock()
+        table.get_item.side_effect = [{"Item": {"Version": 1}}, {"Item": {"Version": 2}}]
+        conflict = ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException(
+            {"Error": {"Code": "ConditionalCheckFailedException", "Message": "Conflict"}}, "PutItem"
+        )
+        table.put_item.side_effect = [conflict, None]
+        with patch.object(ddb, "account_table", table):
+            self.assertEqual(ddb.publish_changes(["acct-001@example.com"]), 3)
+        self.assertEqual(table.put_item.call_args.kwargs["ExpressionAttributeValues"], {":v": 2})
+
+    def test_control_items_are_skipped(self):
+        with patch.object(app.ddb, "publish_changes", return_value=1) as publish:
+            app.lambda_handler({"Records": [stream_record("#mapping-version")]}, None)
+            publish.assert_not_called()
+            app.lambda_handler(
+                {"Records": [stream_record("#mapping-version"), stream_record("acct-001@example.com")]}, None
+            )
+            publish.assert_called_once_with(["acct-001@example.com"])
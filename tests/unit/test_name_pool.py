@@ -0,0 +1,95 @@
+"""Unit tests for the pools of reserved account names"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from tests.unit import load_function
+
+app, ddb, pool = load_function("vendEmail", "app", "ddb", "pool")
+
+PREFIX = "it-portal-prod"
+REQUEST = {
+    "OwnerAddress": "owner@example.com",
+    "AccountType": "IT",
+    "Tags": {"BusinessUnit": "IT", "ApplicationName": "Portal", "Environment": "PRODUCTION"},
+}
+
+
+def conditional_check_failed():
+    return ddb.ddb.meta.client.exceptions.ConditionalCheckFailedException(
+        {"Error": {"Code": "ConditionalCheckFailedException", "Message": "Failed"}}, "UpdateItem"
+    )
+
+
+class test_name_pool(TestCase):
+    def setUp(self):
+        self.table = MagicMock()
+        self.lambda_client = MagicMock()
+        patchers = [
+            patch.object(ddb, "account_table", self.table),
+            patch.object(pool, "lambda_client", self.lambda_client),
+            patch.object(pool, "NAME_POOL_PREFIXES", [PREFIX]),
+            patch.object(pool, "NAME_POOL_SIZE", 4),
+            patch.object(pool, "SES_DOMAIN_NAME", "example.com"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_claim_skips_the_conflict_checks(self):
+        self.table.update_item.return_value = {"Attributes": {"Next": 7, "Limit": 10, "ReservedUntil": 1}}
+        with patch.object(app.ddb, "store_account_record") as store, \
+                patch.object(app.ses, "verify_email_address", return_value="verified"):
+            response = app.lambda_handler(REQUEST, None)
+        self.assertEqual(response["body"]["AccountName"], "it-portal-prod-006")
+        self.assertEqual(response["body"]["AccountEmail"], "it-portal-prod-006@example.com")
+        self.table.query.assert_not_called()
+        self.table.get_item.assert_not_called()
+        store.assert_called_once()
+        self.lambda_client.invoke.assert_not_called()
+
+    def test_empty_pool_falls_back_and_requests_a_top_up(self):
+        self.table.update_item.side_effect = conditional_check_failed()
+        self.assertIsNone(pool.claim(PREFIX))
+        self.assertEqual(self.lambda_client.invoke.call_args.kwargs["InvocationType"], "Event")
+        # Prefixes without a pool never touch the table
+        self.assertIsNone(pool.claim("sales-crm-dev"))
+        self.table.update_item.assert_called_once()
+
+    def test_top_up_reserves_after_the_highest_counter(self):
+        self.table.get_item.return_value = {}
+        self.table.query.return_value = {"Items": [{"Enum": "001"}, {"Enum": "005"}]}
+        self.assertEqual(pool.top_up(PREFIX, now=1000), 4)
+        placeholders = [c.kwargs["Item"]["AccountEmail"] for c in self.table.put_item.call_args_list[:-1]]
+        self.assertEqual(placeholders[0], "it-portal-prod-006@example.com")
+        self.assertEqual(len(placeholders), 4)
+        pool_item = self.table.put_item.call_args.kwargs["Item"]
+        self.assertEqual((pool_item["Next"], pool_item["Limit"]), (6, 10))
+
+    def test_expired_pool_is_released(self):
+        self.table.get_item.return_value = {"Item": {"Next": 8, "Limit": 10, "ReservedUntil": 999}}
+        self.table.query.return_value = {"Items": [{"Enum": "007"}]}
+        self.table.put_item.side_effect = conditional_check_failed()
+        pool.top_up(PREFIX, now=1000)
+        released = [c.kwargs["Key"]["AccountEmail"] for c in self.table.delete_item.call_args_list]
+        self.assertEqual(
+            released,
+            ["it-portal-prod-008@example.com", "it-portal-prod-009@example.com", "#pool#it-portal-prod"],
+        )
+
+    def test_reserved_placeholder_is_not_overwritten(self):
+        self.table.get_item.return_value = {"Item": {"AccountEmail": "it-portal-prod-008@example.com"}}
+        self.table.query.return_value = {"Items": []}
+        response = app.lambda_handler(dict(REQUEST, AccountEmail="it-portal-prod-008@example.com"), None)
+        self.assertIn("already exists", response["body"]["message"])
+        self.table.put_item.assert_not_called()
+
+        # A claim only replaces the placeholder, never an account
+        self.table.put_item.side_effect = conditional_check_failed()
+        self.assertFalse(
+            ddb.store_account_record("it-portal-prod-008", "it-portal-prod-008@example.com", "IT", "o@example.com",
+                                     "NAME-ALLOCATED", {}, claimed=True)
+        )
+        self.assertEqual(
+            self.table.put_item.call_args.kwargs["ConditionExpression"], "attribute_not_exists(#k) OR #s = :reserved"
+        )
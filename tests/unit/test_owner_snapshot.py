@@ -0,0 +1,36 @@
+"""Unit tests for owner snapshot function"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gzip
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from tests.unit import load_function
+
+app, s3 = load_function("ownerSnapshot", "app", "s3")
+
+
+def stream_record(account_email: str) -> dict:
+    return {"dynamodb": {"Keys": {"AccountEmail": {"S": account_email}}}}
+
+
+class test_owner_snapshot(TestCase):
+    def test_snapshot_is_deterministic(self):
+        first = s3.encode_snapshot({"b@example.com": "x@example.com", "a@example.com": "y@example.com"})
+        second = s3.encode_snapshot({"a@example.com": "y@example.com", "b@example.com": "x@example.com"})
+        self.assertEqual(first, second)
+        document = json.loads(gzip.decompress(first))
+        self.assertEqual(list(document["Owners"]), ["a@example.com", "b@example.com"])
+
+    def test_control_items_do_not_publish(self):
+        with patch.object(app.ddb, "get_all_owner_addresses", return_value={}) as get_owners, \
+                patch.object(app.s3, "publish_snapshot", return_value='"etag"') as publish:
+            app.lambda_handler({"Records": [stream_record("#routing-rules")]}, None)
+            get_owners.assert_not_called()
+            app.lambda_handler(
+                {"Records": [stream_record("#routing-rules"), stream_record("acct-001@example.com")]}, None
+            )
+            publish.assert_called_once()
+            # Scheduled invocations always publish
+            app.lambda_handler({"source": "aws.events"}, None)
+            self.assertEqual(publish.call_count, 2)
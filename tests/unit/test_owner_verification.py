@@ -0,0 +1,57 @@
+"""Unit tests for the batched owner verification"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+from tests.unit import load_function
+
+verification, ses = load_function("vendEmail", "verification", "ses")
+
+
+def sqs_event(*requests) -> dict:
+    return {
+        "Records": [
+            {"messageId": f"m{i}", "body": json.dumps({"OwnerAddress": owner, "AccountEmail": account})}
+            for i, (owner, account) in enumerate(requests)
+        ]
+    }
+
+
+class test_owner_verification(TestCase):
+    def setUp(self):
+        self.ses = MagicMock()
+        self.ses.get_identity_verification_attributes.return_value = {
+            "VerificationAttributes": {"known@example.com": {"VerificationStatus": "Success"}}
+        }
+        ses_patcher = patch.object(ses, "ses", self.ses)
+        ses_patcher.start()
+        self.addCleanup(ses_patcher.stop)
+        record_patcher = patch.object(verification.ddb, "record_verification_status", return_value=True)
+        self.record = record_patcher.start()
+        self.addCleanup(record_patcher.stop)
+
+    def test_batch_is_checked_with_one_call(self):
+        event = sqs_event(
+            ("known@example.com", "a-001@example.com"),
+            ("new@example.com", "a-002@example.com"),
+            ("known@example.com", "a-003@example.com"),
+        )
+        self.assertEqual(verification.lambda_handler(event, None), {"batchItemFailures": []})
+        self.ses.get_identity_verification_attributes.assert_called_once_with(
+            Identities=["known@example.com", "new@example.com"]
+        )
+        self.ses.verify_email_identity.assert_called_once_with(EmailAddress="new@example.com")
+        self.assertCountEqual(
+            [c.args for c in self.record.call_args_list],
+            [("a-001@example.com", "Success"), ("a-002@example.com", "Pending"), ("a-003@example.com", "Success")],
+        )
+
+    def test_failed_requests_are_retried(self):
+        self.ses.verify_email_identity.side_effect = ClientError(
+            {"Error": {"Code": "Throttling", "Message": "Rate exceeded"}}, "VerifyEmailIdentity"
+        )
+        event = sqs_event(("known@example.com", "a-001@example.com"), ("new@example.com", "a-002@example.com"))
+        self.assertEqual(verification.lambda_handler(event, None), {"batchItemFailures": [{"itemIdentifier": "m1"}]})
+        self.record.assert_called_once_with("a-001@example.com", "Success")
@@ -0,0 +1,62 @@
+"""Unit tests for the profiling hooks and the profile aggregation tool"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gzip
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from tests.unit import load_function
+from tools import aggregate_profiles
+
+profiling = load_function("fwdEmail", "profiling")
+
+
+def handler(event, context):
+    return [str(i) for i in range(1000)]
+
+
+class test_profiling(TestCase):
+    def test_handler_is_unchanged_when_off(self):
+        self.assertIs(profiling.profiled(handler), handler)
+
+    def test_profiles_are_written_and_aggregated(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(profiling, "PROFILE_OUTPUT", tmp), \
+                patch.object(profiling, "PROFILE_EVENT_FLAG", "true"):
+            wrapped = profiling.profiled(handler)
+            self.assertIsNot(wrapped, handler)
+            # Not sampled and not flagged
+            self.assertEqual(len(wrapped({}, None)), 1000)
+            self.assertEqual(os.listdir(tmp), [])
+            wrapped({"Profile": True}, None)
+            with patch.object(profiling, "PROFILE_SAMPLE_RATE", 1.0):
+                wrapped({}, None)
+            stats, allocations, invocations = aggregate_profiles.aggregate(
+                aggregate_profiles.read_artifacts(tmp)
+            )
+        self.assertEqual(invocations, 2)
+        self.assertTrue(any(name == "handler" for _, _, name in stats.stats))
+        self.assertIn("2 profiled invocations", aggregate_profiles.format_report(stats, allocations, invocations, 5))
+
+    def test_artifacts_are_json(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(profiling, "PROFILE_OUTPUT", tmp):
+            profiling.run_profiled(handler, {}, None)
+            artifacts = {}
+            for root, _, files in os.walk(tmp):
+                for file_name in files:
+                    with gzip.open(os.path.join(root, file_name)) as f:
+                        artifacts[file_name] = json.load(f)
+        self.assertEqual(len(artifacts), 2)
+        self.assertTrue(all(isinstance(statistics, list) for statistics in artifacts.values()))
+
+    def test_failed_write_keeps_the_handler_outcome(self):
+        with patch.object(profiling, "PROFILE_OUTPUT", "/proc/nope"), \
+                self.assertLogs("PROFILING", "WARNING"):
+            self.assertEqual(len(profiling.run_profiled(handler, {}, None)), 1000)
+        with patch.object(profiling, "write_artifact", side_effect=OSError("No space left")), \
+                self.assertLogs("PROFILING", "WARNING"), \
+                self.assertRaises(KeyError):
+            profiling.run_profiled(lambda event, context: event["missing"], {}, None)
@@ -0,0 +1,24 @@
+"""Unit tests for the delivery log query tool"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from unittest import TestCase
+from unittest.mock import MagicMock
+from tools import query_delivery_log
+
+
+class test_query_delivery_log(TestCase):
+    def test_pages_are_read_until_the_limit(self):
+        table = MagicMock()
+        table.query.side_effect = [
+            {"Items": [{"MessageId": "1"}, {"MessageId": "2"}], "LastEvaluatedKey": {"MessageId": "2"}},
+            {"Items": [{"MessageId": "3"}, {"MessageId": "4"}], "LastEvaluatedKey": {"MessageId": "4"}},
+        ]
+        items = query_delivery_log.query_index(table, "Alias", "acct-001@example.com", since="2024-05-01", limit=3)
+        self.assertEqual([i["MessageId"] for i in items], ["1", "2", "3"])
+        self.assertEqual(table.query.call_args.kwargs["IndexName"], "AliasIndex")
+        self.assertFalse(table.query.call_args.kwargs["ScanIndexForward"])
+        self.assertEqual(table.query.call_args.kwargs["ExclusiveStartKey"], {"MessageId": "2"})
+
+    def test_missing_fields_are_shown_as_dashes(self):
+        output = query_delivery_log.format_records([{"Timestamp": "t", "Outcome": "DROPPED"}])
+        self.assertEqual(output.splitlines()[1], "t\tDROPPED\t-\t-\t-\t-\t-")
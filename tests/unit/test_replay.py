@@ -0,0 +1,86 @@
+"""Unit tests for the replay tool"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesHeaderParser
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from tests.unit import load_function
+from tools import replay
+
+app = load_function("fwdEmail", "app")
+
+RECEIVED = datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc)
+HEADERS = BytesHeaderParser().parsebytes(
+    b"Return-Path: <bounce@example.net>\r\n"
+    b"From: Sender <sender@example.net>\r\n"
+    b"To: Acct <acct-001@example.com>, other@example.net\r\n"
+    b"Cc: acct-002@EXAMPLE.com\r\n"
+    b"Subject: Your AWS account\r\n\r\n"
+)
+
+
+class FakePaginator:
+    def __init__(self, keys: list[str]):
+        self.keys = sorted(keys)
+
+    def paginate(self, Bucket, Prefix, StartAfter=""):
+        keys = [k for k in self.keys if k.startswith(Prefix) and k > StartAfter]
+        for i in range(0, len(keys), 2):
+            yield {"Contents": [
+                {"Key": k, "LastModified": RECEIVED + timedelta(minutes=len(k))} for k in keys[i:i + 2]
+            ]}
+
+
+class test_replay(TestCase):
+    def test_shards_cover_every_key(self):
+        keys = [f"mail/{c}{n}" for c in "09afz" for n in range(3)] + ["mail/AMAZON_SES_SETUP_NOTIFICATION"]
+        s3 = MagicMock()
+        s3.get_paginator.return_value = FakePaginator(keys + ["other/0"])
+        objects = replay.list_messages(s3, "bucket")
+        self.assertCountEqual([o["Key"] for o in objects], keys)
+
+    def test_time_bounds(self):
+        s3 = MagicMock()
+        s3.get_paginator.return_value = FakePaginator(["mail/a", "mail/ab", "mail/abc"])
+        objects = replay.list_messages(
+            s3, "bucket", start=RECEIVED + timedelta(minutes=7), end=RECEIVED + timedelta(minutes=8)
+        )
+        self.assertEqual([o["Key"] for o in objects], ["mail/ab"])
+
+    def test_notification_is_forwarded(self):
+        recipients = replay.get_recipients(HEADERS, "example.com")
+        self.assertEqual(recipients, ["acct-001@example.com", "acct-002@EXAMPLE.com"])
+        notification = replay.build_notification(
+            "bucket", {"Key": "mail/abc123", "LastModified": RECEIVED}, HEADERS, recipients
+        )
+        self.assertEqual(notification["mail"]["source"], "bounce@example.net")
+        self.assertEqual(notification["mail"]["timestamp"], "2024-05-01T10:00:00.000Z")
+        with patch.object(app.ses, "get_message_from_s3", return_value={"file": b""}) as get_message, \
+                patch.object(app.ses, "create_message", return_value={}), \
+                patch.object(app.ses, "send_email", return_value="Email sent!"), \
+                patch.object(app.ddb, "get_account_owner_address", return_value="owner@example.com") as get_owner:
+            app.lambda_handler(replay.sns_event([notification]), None)
+        get_owner.assert_called_once_with("acct-001@example.com")
+        get_message.assert_called_once_with("bucket", "mail/abc123", None, None)
+
+    def test_checkpoint_skips_replayed_keys(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoint.txt")
+            replay.Checkpoint(path).add(["mail/a", "mail/b"])
+            self.assertEqual(replay.Checkpoint(path).done, {"mail/a", "mail/b"})
+
+    def test_deferred_messages_are_sent_again(self):
+        notifications = [{"mail": {"messageId": message_id}} for message_id in ["a", "b", "c"]]
+        payloads = [b'{"deferredMessageIds": ["c"]}', b"null"]
+        lambda_client = MagicMock()
+        lambda_client.invoke.side_effect = lambda **kwargs: {"Payload": io.BytesIO(payloads.pop(0))}
+        replay.invoke(lambda_client, "forwarder", notifications)
+        sent = [json.loads(c.kwargs["Payload"])["Records"] for c in lambda_client.invoke.call_args_list]
+        self.assertEqual([len(records) for records in sent], [3, 1])
+        self.assertEqual(json.loads(sent[1][0]["Sns"]["Message"])["mail"]["messageId"], "c")
+        self.assertEqual(replay.DEFERRED_MESSAGE_IDS, app.DEFERRED_MESSAGE_IDS)
@@ -0,0 +1,76 @@
+"""Unit tests for the local SES inbound emulator"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import email
+import os
+import random
+import smtplib
+from argparse import Namespace
+from unittest import TestCase
+from unittest.mock import patch
+from tools import ses_emulator
+
+
+def create_emulator(**kwargs):
+    args = Namespace(domain="example.com", accounts=10, latency_ms=0, fail_rates={}, concurrency=2, seed=1)
+    for name, value in kwargs.items():
+        setattr(args, name, value)
+    with patch.dict(os.environ):
+        return ses_emulator.create_emulator(args)
+
+
+class test_ses_emulator(TestCase):
+    def setUp(self):
+        self.emulator = create_emulator()
+        self.listener = ses_emulator.SmtpListener(self.emulator)
+        self.port = self.listener.start()
+
+    def tearDown(self):
+        self.listener.stop()
+
+    def test_messages_are_forwarded_to_their_owner(self):
+        corpus = ses_emulator.generate_corpus(6, "example.com", 10, unknown_rate=0.5, seed=3)
+        ses_emulator.send_corpus("127.0.0.1", self.port, corpus, connections=2, rate=0)
+        self.emulator.wait()
+        report = self.emulator.report()
+        self.assertEqual((report["Accepted"], report["Forwarded"], report["Failed"]), (6, 6, 0))
+        sent = self.emulator.app.ses.client_ses.sent
+        destinations = sorted(s["Destinations"][0] for s in sent)
+        expected = sorted(
+            f"owner-{int(recipient[5:8]) % 10}@example.org" if recipient.startswith("acct-") else "admin@example.org"
+            for _, recipient, _ in corpus
+        )
+        self.assertEqual(destinations, expected)
+
+    def test_notification_and_stored_message(self):
+        with patch.object(self.emulator, "invoke") as invoke, smtplib.SMTP("127.0.0.1", self.port) as client:
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                client.sendmail("sender@example.net", ["someone@example.org"], b"Subject: x\r\n\r\nx\r\n")
+            client.sendmail("sender@example.net", ["Acct-001@example.com"], b"Subject: Hi\r\n\r\n.leading dot\r\n")
+            self.emulator.wait()
+        notification = invoke.call_args.args[0]
+        self.assertEqual(notification["receipt"]["recipients"], ["Acct-001@example.com"])
+        self.assertEqual(notification["receipt"]["spamVerdict"], {"status": "PASS"})
+        self.assertEqual(notification["mail"]["commonHeaders"]["subject"], "Hi")
+        stored = self.emulator.app.ses.s3.objects[notification["receipt"]["action"]["objectKey"]]
+        self.assertTrue(stored.startswith(b"Return-Path: <sender@example.net>\r\n"))
+        self.assertTrue(stored.endswith(b"\r\n\r\n.leading dot\r\n"))
+
+    def test_failed_verdicts_are_applied(self):
+        self.emulator.fail_rates = {"virusVerdict": 1.0}
+        with patch.dict(self.emulator.app.policy.VERDICT_ACTIONS, {"virusVerdict": "DROP"}):
+            corpus = ses_emulator.generate_corpus(2, "example.com", 10, unknown_rate=0, seed=3)
+            ses_emulator.send_corpus("127.0.0.1", self.port, corpus, connections=1, rate=0)
+            self.emulator.wait()
+        report = self.emulator.report()
+        self.assertEqual((report["Forwarded"], report["NotForwarded"]), (0, 2))
+
+
+class test_corpus(TestCase):
+    def test_message_sizes(self):
+        rng = random.Random(7)
+        for size in [3_000, 40_000, 600_000]:
+            with self.subTest(size=size):
+                data = ses_emulator.generate_message(rng, "a@example.net", "b@example.com", size)
+                self.assertLess(abs(len(data) - size) / size, 0.1)
+                self.assertEqual(email.message_from_bytes(data)["To"], "b@example.com")
@@ -0,0 +1,47 @@
+"""Unit tests for SES feedback function"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from tests.unit import load_function
+
+app = load_function("sesFeedback", "app")
+
+
+def feedback_event(*notifications) -> dict:
+    return {"Records": [{"Sns": {"Message": json.dumps(n)}} for n in notifications]}
+
+
+def bounce(bounce_type: str, *addresses) -> dict:
+    return {
+        "eventType": "Bounce",
+        "bounce": {
+            "bounceType": bounce_type,
+            "bouncedRecipients": [{"emailAddress": a} for a in addresses],
+        },
+    }
+
+
+class test_ses_feedback(TestCase):
+    def test_permanent_bounces_and_complaints_are_suppressed(self):
+        complaint = {
+            "notificationType": "Complaint",
+            "complaint": {"complainedRecipients": [{"emailAddress": "B@example.com"}]},
+        }
+        with patch.object(app.ddb, "suppress_addresses") as suppress:
+            app.lambda_handler(feedback_event(bounce("Permanent", "a@example.com"), complaint), None)
+        suppress.assert_called_once_with({"a@example.com", "b@example.com"})
+
+    def test_transient_bounces_are_ignored(self):
+        with patch.object(app.ddb, "suppress_addresses") as suppress:
+            app.lambda_handler(feedback_event(bounce("Transient", "a@example.com")), None)
+        suppress.assert_not_called()
+
+    def test_one_expiring_item_per_address(self):
+        with patch.object(app.ddb, "account_table") as table:
+            app.ddb.suppress_addresses({"a@example.com", "b@example.com"})
+        batch = table.batch_writer.return_value.__enter__.return_value
+        items = sorted((c.kwargs["Item"] for c in batch.put_item.call_args_list), key=lambda i: i["AccountEmail"])
+        self.assertEqual([i["AccountEmail"] for i in items], ["#suppression#a@example.com", "#suppression#b@example.com"])
+        self.assertEqual(items[0]["ExpiresAt"] - items[0]["SuppressedAt"], app.ddb.SUPPRESSION_RETENTION_DAYS * 86400)
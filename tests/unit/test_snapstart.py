@@ -0,0 +1,40 @@
+"""Unit tests simulating the SnapStart snapshot and restore lifecycle"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from unittest import TestCase
+from unittest.mock import patch
+from tests.unit import load_function
+
+
+class test_snapstart(TestCase):
+    def test_forwarder_clients_are_recreated_on_restore(self):
+        app, ddb, ses, routing, snapstart = load_function(
+            "fwdEmail", "app", "ddb", "ses", "routing", "snapstart"
+        )
+        self.assertIn(app.warm_up, snapstart.before_snapshot_hooks)
+        clients_before = (ses.client_ses, ses.s3, ddb.account_table)
+        # Pretend the snapshot was taken long after the last refresh
+        ddb.owner_snapshot_checked_at = 1e9
+        routing.table_rules_checked_at = 1e9
+        with patch.object(ses, "create_message", wraps=ses.create_message) as create_message:
+            snapstart.simulate_snapshot_restore()
+        create_message.assert_called_once()
+        for before, after in zip(clients_before, (ses.client_ses, ses.s3, ddb.account_table)):
+            self.assertIsNot(before, after)
+        # The restored environment's monotonic clock may be behind the one
+        # the snapshot was taken with, the caches must refresh on first use
+        self.assertEqual(ddb.owner_snapshot_checked_at, float("-inf"))
+        self.assertEqual(routing.table_rules_checked_at, float("-inf"))
+
+    def test_vend_clients_are_recreated_on_restore(self):
+        app, ddb, ses, snapstart = load_function("vendEmail", "app", "ddb", "ses", "snapstart")
+        clients_before = (ses.ses, ddb.account_table)
+        with patch.object(
+            app.provision_aws_account_schema,
+            "validate",
+            wraps=app.provision_aws_account_schema.validate,
+        ) as validate:
+            snapstart.simulate_snapshot_restore()
+        validate.assert_called_once()
+        for before, after in zip(clients_before, (ses.ses, ddb.account_table)):
+            self.assertIsNot(before, after)
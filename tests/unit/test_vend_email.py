@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: MIT-0
 import os
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 from src.vendEmail import app
 from schema import SchemaError
 
@@ -131,3 +132,13 @@ class test_vend_email(TestCase):
                         account_name, account_email = app.get_new_account_data(metadata)
                         self.assertEqual(account_name, expected_name)
                         self.assertEqual(account_email, expected_email)
+
+    def test_counters_are_read_from_every_page(self):
+        table = MagicMock()
+        table.query.side_effect = [
+            {"Items": [{"Enum": "001"}], "LastEvaluatedKey": {"AccountEmail": "a"}},
+            {"Items": [{"Enum": "002"}]},
+        ]
+        with patch.object(app.ddb, "account_table", table):
+            self.assertEqual(app.get_next_number("it-portal-prod"), "003")
+        self.assertEqual(table.query.call_args.kwargs["ExclusiveStartKey"], {"AccountEmail": "a"})
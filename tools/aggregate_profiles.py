@@ -0,0 +1,116 @@
+"""Aggregate the profiles written by the fwdEmail and vendEmail functions
+
+Combines the cProfile and tracemalloc statistics of many profiled
+invocations into one report of the functions using the most time and the
+lines allocating the most memory.
+
+    python -m tools.aggregate_profiles /tmp/profiles
+    python -m tools.aggregate_profiles s3://<mail bucket>/profiles/SesMailForwardFunction --top 30
+    python -m tools.aggregate_profiles s3://<mail bucket>/profiles --output combined.prof
+
+The combined cProfile statistics can be saved with --output and opened with
+pstats or a viewer such as snakeviz.
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import argparse
+import gzip
+import io
+import json
+import os
+import pstats
+import sys
+import boto3
+
+S3_SCHEME = "s3://"
+# Artifact suffixes written by profiling.py
+CPU_SUFFIX = ".prof.json.gz"
+MEMORY_SUFFIX = ".tracemalloc.json.gz"
+
+
+class LoadedProfile:
+    """Profile statistics in the form pstats.Stats accepts"""
+
+    def __init__(self, statistics: list):
+        self.stats = {
+            tuple(func): (cc, nc, tt, ct, {tuple(caller): tuple(timing) for caller, *timing in callers})
+            for func, cc, nc, tt, ct, callers in statistics
+        }
+
+    def create_stats(self):
+        pass
+
+
+def read_artifacts(location: str):
+    """Yields the name and decompressed content of every profile artifact in a
+    local directory or under an S3 prefix"""
+    if location.startswith(S3_SCHEME):
+        bucket, _, prefix = location[len(S3_SCHEME):].partition("/")
+        s3 = boto3.client("s3")
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith((CPU_SUFFIX, MEMORY_SUFFIX)):
+                    body = s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+                    yield obj["Key"], gzip.decompress(body)
+        return
+    for root, _, files in os.walk(location):
+        for file_name in sorted(files):
+            if file_name.endswith((CPU_SUFFIX, MEMORY_SUFFIX)):
+                with open(os.path.join(root, file_name), "rb") as f:
+                    yield file_name, gzip.decompress(f.read())
+
+
+def aggregate(artifacts) -> tuple[pstats.Stats | None, dict, int]:
+    """Returns the combined cProfile statistics, the allocated bytes and count
+    per source line summed over all snapshots, and the number of invocations"""
+    stats = None
+    allocations = {}
+    invocations = 0
+    for name, data in artifacts:
+        if name.endswith(CPU_SUFFIX):
+            invocations += 1
+            profile = LoadedProfile(json.loads(data))
+            if stats is None:
+                stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                stats.add(profile)
+        else:
+            for filename, lineno, stat_size, stat_count in json.loads(data):
+                size, count = allocations.get((filename, lineno), (0, 0))
+                allocations[(filename, lineno)] = (size + stat_size, count + stat_count)
+    return stats, allocations, invocations
+
+
+def format_report(stats: pstats.Stats | None, allocations: dict, invocations: int, top: int) -> str:
+    lines = [f"{invocations} profiled invocations", "", f"Top {top} functions by cumulative time"]
+    if stats:
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        lines.append(stream.getvalue().strip())
+    lines += ["", f"Top {top} lines by memory still allocated when the handler returned", "bytes\tblocks\tline"]
+    ranked = sorted(allocations.items(), key=lambda item: item[1][0], reverse=True)
+    for (filename, lineno), (size, count) in ranked[:top]:
+        lines.append(f"{size}\t{count}\t{filename}:{lineno}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("location", help="local directory or s3://bucket/prefix of the profiles")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", help="file to save the combined cProfile statistics to")
+    args = parser.parse_args(argv)
+
+    stats, allocations, invocations = aggregate(read_artifacts(args.location))
+    if not invocations and not allocations:
+        print(f"No profiles found in {args.location}")
+        return 1
+    print(format_report(stats, allocations, invocations, args.top))
+    if stats and args.output:
+        stats.dump_stats(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
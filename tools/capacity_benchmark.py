@@ -0,0 +1,202 @@
+"""Count the DynamoDB capacity units consumed per vend and per forward
+
+Runs the vendEmail handler and the fwdEmail owner lookup against an in memory
+stand-in for the account table that charges read and write units the way
+DynamoDB does, once for each layout of the AccountName-Enum index.
+
+    python -m tools.capacity_benchmark --accounts 200 --vends 20 --forwards 1000
+
+The stand-in sizes items with the DynamoDB rules, so the numbers match an on
+demand table as long as items stay far from the 400 KB limit.  It only
+supports the calls the two functions make and does not evaluate conditions.
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import argparse
+import math
+import os
+import sys
+from decimal import Decimal
+from tools.functions import load_function
+
+ACCOUNT_EMAIL = "AccountEmail"
+ACCOUNT_NAME = "AccountName"
+COUNT = "Enum"
+LAYOUTS = {
+    "ALL": ("AccountName-Enum-Index", "ALL"),
+    "KEYS_ONLY": ("AccountName-Enum-KeysIndex", "KEYS_ONLY"),
+}
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+
+
+def value_size(value) -> int:
+    """Size of an attribute value as DynamoDB counts it"""
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        digits = str(abs(value)).replace(".", "").strip("0")
+        return math.ceil(len(digits) / 2) + 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return 3 + sum(len(k.encode()) + value_size(v) + 1 for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(value_size(v) + 1 for v in value)
+    if isinstance(value, (set, frozenset)):
+        return sum(value_size(v) for v in value)
+    raise TypeError(f"Unsupported attribute value {value!r}")
+
+
+def item_size(item: dict) -> int:
+    return sum(len(name.encode()) + value_size(value) for name, value in item.items())
+
+
+def key_conditions(condition) -> dict:
+    """Returns the attribute values of a boto3 Key(...).eq(...) condition,
+    possibly combined with &"""
+    expression = condition.get_expression()
+    if expression["operator"] == "AND":
+        return {k: v for part in expression["values"] for k, v in key_conditions(part).items()}
+    if expression["operator"] != "=":
+        raise NotImplementedError(f"Unsupported key condition {expression['operator']}")
+    key, value = expression["values"]
+    return {key.name: value}
+
+
+class FakeAccountTable:
+    """In memory account table with one index on AccountName and Enum that
+    adds up the capacity units consumed by the calls"""
+
+    def __init__(self, index_name: str, projection: str):
+        self.index_name = index_name
+        self.projection = projection
+        self.items = {}
+        self.read_units = 0.0
+        self.write_units = 0.0
+
+    def index_item(self, item: dict | None) -> dict | None:
+        """Returns the copy of `item` stored in the index, None when it has no index keys"""
+        if not item or ACCOUNT_NAME not in item or COUNT not in item:
+            return None
+        if self.projection == "ALL":
+            return dict(item)
+        return {name: item[name] for name in [ACCOUNT_EMAIL, ACCOUNT_NAME, COUNT]}
+
+    def charge_write(self, old: dict | None, new: dict | None):
+        sizes = [item_size(i) for i in (old, new) if i]
+        self.write_units += math.ceil(max(sizes) / WRITE_UNIT_BYTES) if sizes else 1
+        old_index, new_index = self.index_item(old), self.index_item(new)
+        if old_index == new_index:
+            return
+        if old_index and new_index and (old_index[ACCOUNT_NAME], old_index[COUNT]) == (new_index[ACCOUNT_NAME], new_index[COUNT]):
+            self.write_units += math.ceil(item_size(new_index) / WRITE_UNIT_BYTES)
+            return
+        # A changed index key deletes the old index item and puts the new one
+        for index_item in (old_index, new_index):
+            if index_item:
+                self.write_units += math.ceil(item_size(index_item) / WRITE_UNIT_BYTES)
+
+    def get_item(self, Key: dict, ConsistentRead: bool = False, **kwargs) -> dict:
+        # Projection expressions do not reduce the units, the whole item is read
+        item = self.items.get(Key[ACCOUNT_EMAIL])
+        units = math.ceil(item_size(item) / READ_UNIT_BYTES) if item else 1
+        self.read_units += units if ConsistentRead else units / 2
+        return {"Item": dict(item)} if item else {}
+
+    def put_item(self, Item: dict, **kwargs) -> dict:
+        self.charge_write(self.items.get(Item[ACCOUNT_EMAIL]), Item)
+        self.items[Item[ACCOUNT_EMAIL]] = dict(Item)
+        return {}
+
+    def delete_item(self, Key: dict, **kwargs) -> dict:
+        self.charge_write(self.items.pop(Key[ACCOUNT_EMAIL], None), None)
+        return {}
+
+    def query(self, IndexName: str, KeyConditionExpression, Limit: int | None = None, **kwargs) -> dict:
+        if IndexName != self.index_name:
+            raise ValueError(f"The table has no index {IndexName}")
+        conditions = key_conditions(KeyConditionExpression)
+        matches = sorted(
+            (self.index_item(item) for item in self.items.values()
+             if self.index_item(item) and all(item.get(k) == v for k, v in conditions.items())),
+            key=lambda item: item[COUNT],
+        )
+        if Limit:
+            matches = matches[:Limit]
+        # Index reads are eventually consistent and summed before rounding up
+        self.read_units += max(1, math.ceil(sum(map(item_size, matches)) / READ_UNIT_BYTES)) / 2
+        return {"Items": matches, "Count": len(matches)}
+
+    def take_units(self) -> tuple[float, float]:
+        units = (self.read_units, self.write_units)
+        self.read_units = self.write_units = 0.0
+        return units
+
+
+def vend_request(number: int) -> dict:
+    return {
+        "OwnerAddress": f"owner-{number % 10}@example.com",
+        "AccountType": "IT",
+        "Tags": {"BusinessUnit": "it", "ApplicationName": "portal", "Environment": "PRODUCTION"},
+    }
+
+
+def run(layout: str, accounts: int, vends: int, forwards: int) -> dict:
+    """Returns the average units of a vend and a forward lookup for `layout`"""
+    os.environ["ACCOUNT_INDEX_NAME"] = LAYOUTS[layout][0]
+    vend_app, vend_ddb = load_function("vendEmail", "app", "ddb")
+    fwd_ddb = load_function("fwdEmail", "ddb")
+    table = FakeAccountTable(*LAYOUTS[layout])
+    vend_ddb.account_table = table
+    fwd_ddb.account_table = table
+    vend_app.ses.verify_email_address = lambda address: "Already verified"
+
+    for number in range(accounts):
+        vend_app.lambda_handler(vend_request(number), None)
+    table.take_units()
+    for number in range(vends):
+        vend_app.lambda_handler(vend_request(number), None)
+    vend_read, vend_write = table.take_units()
+
+    emails = sorted(email for email in table.items if not email.startswith("#"))
+    for number in range(forwards):
+        fwd_ddb.get_account_owner_address(emails[number % len(emails)])
+    forward_read, _ = table.take_units()
+
+    # Reassigning an owner rewrites the item without touching the index keys
+    for number in range(vends):
+        item = dict(table.items[emails[number]], OwnerAddress="new-owner@example.com")
+        table.put_item(Item=item)
+    _, owner_change_write = table.take_units()
+    return {
+        "Layout": layout,
+        "VendRead": vend_read / vends,
+        "VendWrite": vend_write / vends,
+        "ForwardRead": forward_read / forwards,
+        "OwnerChangeWrite": owner_change_write / vends,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=200, help="accounts vended under the same prefix first")
+    parser.add_argument("--vends", type=int, default=20)
+    parser.add_argument("--forwards", type=int, default=1000)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("SES_DOMAIN_NAME", "example.com")
+    os.environ.setdefault("TABLE_NAME", "AWSAccountTable")
+
+    results = [run(layout, args.accounts, args.vends, args.forwards) for layout in LAYOUTS]
+    print("layout\tRCU/vend\tWCU/vend\tRCU/forward\tWCU/owner change")
+    for result in results:
+        print(f"{result['Layout']}\t{result['VendRead']:.2f}\t{result['VendWrite']:.2f}\t"
+              f"{result['ForwardRead']:.2f}\t{result['OwnerChangeWrite']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Fake S3, DynamoDB and SES services for running the fwdEmail handler locally
+
+Each call sleeps for a configurable latency to stand in for the network, so
+the tools and benchmarks show how well the forwarder overlaps waiting.
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import threading
+import time
+from email.parser import HeaderParser
+from botocore.exceptions import ClientError
+
+# Header the emulator adds to stored messages to match sends with accepts
+MESSAGE_ID_HEADER = "X-Emulator-Message-Id"
+
+
+class FakeBucket:
+    """Stand-in for the S3 resource of the forwarder holding the mail bucket"""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.objects = {}
+
+    def Object(self, bucket: str, key: str):
+        fake = self
+
+        class FakeObject:
+            def get(self):
+                time.sleep(fake.latency)
+                return {"Metadata": {}, "Body": io.BytesIO(fake.objects[key])}
+
+            def copy_from(self, CopySource: dict):
+                time.sleep(fake.latency)
+                fake.objects[key] = fake.objects[CopySource["Key"]]
+
+        return FakeObject()
+
+
+class FakeAccountTable:
+    """Stand-in for the account table answering owner lookups"""
+
+    def __init__(self, owners: dict, latency: float = 0):
+        self.owners = owners
+        self.latency = latency
+
+    def get_item(self, Key: dict, **kwargs) -> dict:
+        time.sleep(self.latency)
+        owner = self.owners.get(next(iter(Key.values())))
+        return {"Item": {"OwnerAddress": owner}} if owner else {}
+
+
+class FakeSes:
+    """Stand-in for the SES client that captures sent messages.  Sends to
+    `unverified` addresses are rejected like in the SES sandbox"""
+
+    def __init__(self, latency: float = 0, unverified: set | None = None):
+        self.latency = latency
+        self.unverified = unverified or set()
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send_raw_email(self, Source: str, Destinations: list, RawMessage: dict, **kwargs) -> dict:
+        time.sleep(self.latency)
+        rejected = [d for d in Destinations if d in self.unverified]
+        if rejected:
+            raise ClientError(
+                {"Error": {"Code": "MessageRejected", "Message": f"Email address is not verified: {rejected[0]}"}},
+                "SendRawEmail",
+            )
+        headers = HeaderParser().parsestr(RawMessage["Data"], headersonly=True)
+        with self.lock:
+            self.sent.append({
+                "MessageId": headers.get(MESSAGE_ID_HEADER),
+                "Destinations": Destinations,
+                "Size": len(RawMessage["Data"]),
+                "SentAt": time.monotonic(),
+            })
+            return {"MessageId": f"sent-{len(self.sent)}"}
@@ -0,0 +1,37 @@
+"""Load the Lambda functions in src/ for local runs of the tools and tests"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import importlib
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+# Modules shared by the functions through the common layer, which Lambda puts
+# on the path from its python/ directory
+COMMON_DIR = os.path.join(SRC_DIR, "common", "python")
+
+
+def load_function(function_name: str, *module_names: str):
+    """Import `module_names` from the Lambda function in src/`function_name`.
+    The functions import their own modules by bare name (ddb, ses, ...) so
+    those names are removed from `sys.modules` before and after loading to keep
+    the modules of different functions apart.  Each function also gets its own
+    instance of the common modules, as it does in Lambda"""
+    function_dir = os.path.join(SRC_DIR, function_name)
+    local_names = [
+        file_name[:-3]
+        for directory in [function_dir, COMMON_DIR]
+        for file_name in os.listdir(directory)
+        if file_name.endswith(".py")
+    ]
+    saved_path = list(sys.path)
+    for name in local_names:
+        sys.modules.pop(name, None)
+    sys.path[:0] = [function_dir, COMMON_DIR]
+    try:
+        modules = [importlib.import_module(name) for name in module_names]
+    finally:
+        sys.path[:] = saved_path
+        for name in local_names:
+            sys.modules.pop(name, None)
+    return modules[0] if len(modules) == 1 else modules
@@ -0,0 +1,102 @@
+"""Check the move of the account table to its KEYS_ONLY index
+
+The vend functions only read counters from the AccountName-Enum index, so
+the index no longer needs to project whole items.  Projections cannot be
+changed in place, so existing tables move in two deployments:
+
+1. Deploy with cdk.json context "ACCOUNT_INDEX_LAYOUT": "MIGRATE".  This adds
+   the KEYS_ONLY index next to the old one, the functions keep using the old
+   index while DynamoDB builds the new one.
+2. Run this tool until it reports the new index ready and complete:
+
+       python -m tools.migrate_account_index --table-name AWSAccountTable --wait --verify
+
+3. Deploy with "ACCOUNT_INDEX_LAYOUT": "KEYS_ONLY".  The functions switch to
+   the new index and the old one is deleted.
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import argparse
+import sys
+import time
+import boto3
+
+LEGACY_INDEX_NAME = "AccountName-Enum-Index"
+KEYS_INDEX_NAME = "AccountName-Enum-KeysIndex"
+ACCOUNT_EMAIL = "AccountEmail"
+
+
+def get_index_states(dynamodb_client, table_name: str) -> dict:
+    """Returns the status, backfilling flag and projection of every index"""
+    table = dynamodb_client.describe_table(TableName=table_name)["Table"]
+    return {
+        index["IndexName"]: {
+            "IndexStatus": index["IndexStatus"],
+            "Backfilling": index.get("Backfilling", False),
+            "ProjectionType": index["Projection"]["ProjectionType"],
+            "ItemCount": index.get("ItemCount", 0),
+        }
+        for index in table.get("GlobalSecondaryIndexes", [])
+    }
+
+
+def is_ready(states: dict) -> bool:
+    """The new index can be queried once it is active and backfilled"""
+    state = states.get(KEYS_INDEX_NAME)
+    return bool(state) and state["IndexStatus"] == "ACTIVE" and not state["Backfilling"]
+
+
+def scan_index_keys(dynamodb_client, table_name: str, index_name: str) -> set:
+    """Returns the account emails of all items in an index"""
+    keys = set()
+    paginator = dynamodb_client.get_paginator("scan")
+    for page in paginator.paginate(TableName=table_name, IndexName=index_name, ProjectionExpression=ACCOUNT_EMAIL):
+        keys.update(item[ACCOUNT_EMAIL]["S"] for item in page.get("Items", []))
+    return keys
+
+
+def verify(dynamodb_client, table_name: str) -> list[str]:
+    """Returns the account emails of the old index missing from the new one.
+    Accounts vended during the scans may show up as missing, run it again"""
+    legacy = scan_index_keys(dynamodb_client, table_name, LEGACY_INDEX_NAME)
+    keys = scan_index_keys(dynamodb_client, table_name, KEYS_INDEX_NAME)
+    print(f"{LEGACY_INDEX_NAME} has {len(legacy)} items, {KEYS_INDEX_NAME} has {len(keys)} items")
+    return sorted(legacy - keys)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table-name", required=True, help="cdk.json context.ACCOUNT_TABLE_NAME")
+    parser.add_argument("--wait", action="store_true", help="wait until the new index is ready")
+    parser.add_argument("--verify", action="store_true", help="compare the keys of both indexes")
+    parser.add_argument("--interval", type=int, default=30, help="seconds between checks with --wait")
+    args = parser.parse_args(argv)
+
+    dynamodb_client = boto3.client("dynamodb")
+    while True:
+        states = get_index_states(dynamodb_client, args.table_name)
+        for name, state in states.items():
+            print(f"{name}: {state['IndexStatus']}, {state['ProjectionType']}, "
+                  f"backfilling {state['Backfilling']}, about {state['ItemCount']} items")
+        if is_ready(states) or not args.wait:
+            break
+        time.sleep(args.interval)
+    if KEYS_INDEX_NAME not in states:
+        print(f"{KEYS_INDEX_NAME} does not exist, deploy with ACCOUNT_INDEX_LAYOUT set to MIGRATE first")
+        return 1
+    if not is_ready(states):
+        print(f"{KEYS_INDEX_NAME} is not ready yet")
+        return 1
+
+    if args.verify and LEGACY_INDEX_NAME in states:
+        missing = verify(dynamodb_client, args.table_name)
+        for account_email in missing:
+            print(f"Missing from {KEYS_INDEX_NAME}: {account_email}")
+        if missing:
+            return 1
+    print(f"{KEYS_INDEX_NAME} is ready, deploy with ACCOUNT_INDEX_LAYOUT set to KEYS_ONLY")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
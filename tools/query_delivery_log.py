@@ -0,0 +1,94 @@
+"""Query the delivery log written by the fwdEmail function
+
+Answers questions such as "was the mail for this account forwarded, and to
+whom?" without searching the function logs or listing the mail bucket.
+
+    python -m tools.query_delivery_log --table-name <DeliveryLogTableName> --alias my-account-001@example.com
+    python -m tools.query_delivery_log --owner owner@example.com --since 2024-05-01T00:00:00Z
+    python -m tools.query_delivery_log --message-id 0000014fbe1c09cf-7cb9f704-7531-4e53-89a1-5fa9744f5eb6-000000
+
+The table name is taken from DELIVERY_LOG_TABLE_NAME when --table-name is not given.
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import argparse
+import os
+import sys
+import boto3
+from boto3.dynamodb.conditions import Key
+
+# Field Names
+MESSAGE_ID = "MessageId"
+TIMESTAMP = "Timestamp"
+ALIAS = "Alias"
+OWNER = "Owner"
+INDEX_NAMES = {ALIAS: "AliasIndex", OWNER: "OwnerIndex"}
+COLUMNS = [TIMESTAMP, "Outcome", ALIAS, OWNER, "Size", "LatencyMs", "S3Key"]
+
+
+def query_index(table, field: str, value: str, since: str | None = None, until: str | None = None, limit: int = 50) -> list[dict]:
+    """Returns up to `limit` records of the alias or owner `value`, newest first"""
+    condition = Key(field).eq(value)
+    if since and until:
+        condition = condition & Key(TIMESTAMP).between(since, until)
+    elif since:
+        condition = condition & Key(TIMESTAMP).gte(since)
+    elif until:
+        condition = condition & Key(TIMESTAMP).lte(until)
+    query_kwargs = {
+        "IndexName": INDEX_NAMES[field],
+        "KeyConditionExpression": condition,
+        "ScanIndexForward": False,
+        "Limit": limit,
+    }
+    items = []
+    while len(items) < limit:
+        resp = table.query(**query_kwargs)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        query_kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return items[:limit]
+
+
+def get_record(table, message_id: str) -> list[dict]:
+    """Returns the record of a single message, if any"""
+    item = table.get_item(Key={MESSAGE_ID: message_id}).get("Item")
+    return [item] if item else []
+
+
+def format_records(items: list[dict]) -> str:
+    """Returns the records as a tab separated table"""
+    lines = ["\t".join(COLUMNS)]
+    for item in items:
+        lines.append("\t".join(str(item.get(column, "-")) for column in COLUMNS))
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table-name", default=os.getenv("DELIVERY_LOG_TABLE_NAME"))
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--alias", help="account email the message was sent to, without any +tag")
+    target.add_argument("--owner", help="address the message was forwarded to")
+    target.add_argument("--message-id", help="SES message ID, also the S3 object name")
+    parser.add_argument("--since", help="ISO 8601 time of the oldest message to return")
+    parser.add_argument("--until", help="ISO 8601 time of the newest message to return")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+    if not args.table_name:
+        parser.error("--table-name or DELIVERY_LOG_TABLE_NAME is required")
+
+    table = boto3.resource("dynamodb").Table(args.table_name)
+    if args.message_id:
+        items = get_record(table, args.message_id)
+    elif args.alias:
+        items = query_index(table, ALIAS, args.alias, args.since, args.until, args.limit)
+    else:
+        items = query_index(table, OWNER, args.owner, args.since, args.until, args.limit)
+    print(format_records(items))
+    return 0 if items else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
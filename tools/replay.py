@@ -0,0 +1,298 @@
+"""Replay stored mail through the fwdEmail function
+
+Messages are read from the `mail/` prefix of the mail bucket, optionally
+limited to the time they were received, or from the forwarder's dead-letter
+queue (cdk.json context FORWARDER_DLQ).  Each message is sent to the
+forwarder in the SNS event format it receives from SES.
+
+    python -m tools.replay bucket --bucket <MailBucket> --function-name <ForwarderFunctionArn> \\
+        --domain example.com --start 2024-05-01T08:00:00Z --end 2024-05-01T14:00:00Z \\
+        --checkpoint replay-0501.txt
+    python -m tools.replay queue --queue-url <ForwarderDeadLetterQueueUrl> --function-name <ForwarderFunctionArn>
+
+Replayed object keys are appended to the checkpoint file once the forwarder
+handled them, so an interrupted replay resumes where it stopped when it is run
+again with the same file.  Use --dry-run to print the notifications instead.
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import argparse
+import json
+import logging
+import string
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses, parseaddr
+import boto3
+from botocore.config import Config
+
+MAIL_PREFIX = "mail/"
+# SES names the objects after the message ID, which starts with a lower case
+# letter or a digit.  Listing the ranges between these boundaries in parallel
+# still covers every key
+SHARD_BOUNDARIES = string.digits[1:] + string.ascii_lowercase
+# Enough of the message to read its headers without downloading attachments
+HEADER_BYTES = 65536
+# Key of the forwarder's response listing the messages it handed back
+DEFERRED_MESSAGE_IDS = "deferredMessageIds"
+logger = logging.getLogger("REPLAY")
+
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO 8601 time, times without an offset are UTC"""
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def list_shard(s3, bucket: str, prefix: str, lower: str | None, upper: str | None,
+               start: datetime | None = None, end: datetime | None = None) -> list[dict]:
+    """Returns the objects with keys between `lower` and `upper` that were
+    stored between `start` and `end`"""
+    list_kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if lower:
+        list_kwargs["StartAfter"] = lower
+    objects = []
+    for page in s3.get_paginator("list_objects_v2").paginate(**list_kwargs):
+        for obj in page.get("Contents", []):
+            if upper and obj["Key"] >= upper:
+                return objects
+            if (start and obj["LastModified"] < start) or (end and obj["LastModified"] >= end):
+                continue
+            objects.append(obj)
+    return objects
+
+
+def list_messages(s3, bucket: str, prefix: str = MAIL_PREFIX, start: datetime | None = None,
+                  end: datetime | None = None, workers: int = 8) -> list[dict]:
+    """Returns the stored messages, oldest first.  The key space is split into
+    shards that are listed in parallel"""
+    boundaries = [None] + [prefix + c for c in SHARD_BOUNDARIES] + [None]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        shards = pool.map(
+            lambda bounds: list_shard(s3, bucket, prefix, bounds[0], bounds[1], start, end),
+            zip(boundaries, boundaries[1:]),
+        )
+        objects = [obj for shard in shards for obj in shard]
+    return sorted(objects, key=lambda obj: obj["LastModified"])
+
+
+def read_headers(s3, bucket: str, key: str):
+    """Returns the headers of a stored message"""
+    resp = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{HEADER_BYTES - 1}")
+    return BytesHeaderParser().parsebytes(resp["Body"].read())
+
+
+def get_recipients(headers, domain: str) -> list[str]:
+    """Returns the To and Cc addresses in `domain`.  Bcc recipients are not in
+    the headers and cannot be recovered"""
+    addresses = getaddresses(headers.get_all("To", []) + headers.get_all("Cc", []))
+    recipients = []
+    for _, address in addresses:
+        if address.lower().endswith("@" + domain.lower()) and address not in recipients:
+            recipients.append(address)
+    return recipients
+
+
+def build_notification(bucket: str, obj: dict, headers, recipients: list[str]) -> dict:
+    """Returns the SES receipt notification for a stored message.  Verdicts are
+    left out as they were already applied when the message was received"""
+    timestamp = obj["LastModified"].astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+    source = parseaddr(headers.get("Return-Path") or headers.get("From", ""))[1]
+    return {
+        "notificationType": "Received",
+        "mail": {
+            "timestamp": timestamp,
+            "source": source,
+            "messageId": obj["Key"].rsplit("/", 1)[-1],
+            "destination": recipients,
+            "commonHeaders": {"subject": headers.get("Subject", "")},
+        },
+        "receipt": {
+            "timestamp": timestamp,
+            "recipients": recipients,
+            "action": {"type": "S3", "bucketName": bucket, "objectKey": obj["Key"]},
+        },
+    }
+
+
+def sns_event(notifications: list[dict]) -> dict:
+    """Returns the event SNS invokes the forwarder with"""
+    return {
+        "Records": [
+            {"EventSource": "aws:sns", "Sns": {"Message": json.dumps(n)}}
+            for n in notifications
+        ]
+    }
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self, count: int = 1):
+        with self.lock:
+            now = time.monotonic()
+            wait_until = max(self.next_at, now)
+            self.next_at = wait_until + self.interval * count
+        time.sleep(max(0, wait_until - now))
+
+
+class Checkpoint:
+    """Object keys that were replayed, one per line"""
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+        if path:
+            try:
+                with open(path) as f:
+                    self.done = {line.strip() for line in f if line.strip()}
+            except FileNotFoundError:
+                pass
+
+    def add(self, keys: list[str]):
+        with self.lock:
+            self.done.update(keys)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.writelines(key + "\n" for key in keys)
+
+
+def invoke(lambda_client, function_name: str, notifications: list[dict]):
+    """Forward the messages synchronously so failures are known.  Messages the
+    forwarder returns as they did not fit in its invocation are sent again,
+    without the ones it already handled"""
+    while notifications:
+        resp = lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType="RequestResponse",
+            Payload=json.dumps(sns_event(notifications)).encode(),
+        )
+        payload = resp["Payload"].read()
+        if resp.get("FunctionError"):
+            raise RuntimeError(payload.decode())
+        deferred = set((json.loads(payload or b"null") or {}).get(DEFERRED_MESSAGE_IDS, []))
+        if deferred:
+            logger.info(f"{len(deferred)} of {len(notifications)} messages were deferred, sending them again")
+        notifications = [n for n in notifications if n["mail"]["messageId"] in deferred]
+
+
+def replay_bucket(args, s3, lambda_client) -> int:
+    checkpoint = Checkpoint(args.checkpoint)
+    start = parse_time(args.start) if args.start else None
+    end = parse_time(args.end) if args.end else None
+    objects = [
+        obj for obj in list_messages(s3, args.bucket, args.prefix, start, end, args.workers)
+        if obj["Key"] not in checkpoint.done
+    ]
+    logger.info(f"Replaying {len(objects)} messages, {len(checkpoint.done)} already done")
+    limiter = RateLimiter(args.rate)
+    failures = []
+
+    def replay_batch(batch: list[dict]):
+        notifications = []
+        for obj in batch:
+            headers = read_headers(s3, args.bucket, obj["Key"])
+            recipients = get_recipients(headers, args.domain)
+            if not recipients:
+                logger.warning(f"No recipient in {args.domain} found for {obj['Key']}, skipping")
+                continue
+            notifications.append(build_notification(args.bucket, obj, headers, recipients))
+        if notifications:
+            limiter.wait(len(notifications))
+            if args.dry_run:
+                print(json.dumps(sns_event(notifications)))
+                return
+            try:
+                invoke(lambda_client, args.function_name, notifications)
+            except Exception as e:
+                logger.error(f"Replay of {len(batch)} messages from {batch[0]['Key']} failed: {e}")
+                failures.extend(batch)
+                return
+        checkpoint.add([obj["Key"] for obj in batch])
+
+    batches = [objects[i:i + args.batch_size] for i in range(0, len(objects), args.batch_size)]
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(replay_batch, batches))
+    logger.info(f"Replayed {len(objects) - len(failures)} messages, {len(failures)} failed")
+    return 1 if failures else 0
+
+
+def replay_queue(args, sqs, lambda_client) -> int:
+    """Each dead-letter message holds the event of a failed invocation.  It is
+    deleted once the forwarder handled the event again"""
+    limiter = RateLimiter(args.rate)
+    replayed = failed = 0
+    while True:
+        resp = sqs.receive_message(QueueUrl=args.queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=1)
+        messages = resp.get("Messages", [])
+        if not messages:
+            break
+
+        def replay_message(message: dict) -> bool:
+            records = json.loads(message["Body"]).get("Records", [])
+            notifications = [json.loads(r["Sns"]["Message"]) for r in records if r.get("EventSource") == "aws:sns"]
+            limiter.wait(len(notifications))
+            if args.dry_run:
+                print(json.dumps(sns_event(notifications)))
+                return False
+            try:
+                invoke(lambda_client, args.function_name, notifications)
+            except Exception as e:
+                logger.error(f"Replay of dead-letter message {message['MessageId']} failed: {e}")
+                return False
+            sqs.delete_message(QueueUrl=args.queue_url, ReceiptHandle=message["ReceiptHandle"])
+            return True
+
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(replay_message, messages))
+        replayed += results.count(True)
+        failed += results.count(False)
+        if args.dry_run:
+            # Messages are not deleted, so the queue would be read forever
+            break
+    logger.info(f"Replayed {replayed} dead-letter messages, {failed} not replayed")
+    return 1 if failed and not args.dry_run else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sources = parser.add_subparsers(dest="source", required=True)
+    bucket = sources.add_parser("bucket", help="replay messages stored in the mail bucket")
+    bucket.add_argument("--bucket", required=True)
+    bucket.add_argument("--prefix", default=MAIL_PREFIX)
+    bucket.add_argument("--domain", required=True, help="cdk.json context.SES_DOMAIN_NAME")
+    bucket.add_argument("--start", help="ISO 8601 time of the oldest message to replay")
+    bucket.add_argument("--end", help="ISO 8601 time after the newest message to replay")
+    bucket.add_argument("--checkpoint", help="file recording the replayed keys")
+    bucket.add_argument("--batch-size", type=int, default=10, help="messages per invocation, a failed invocation is replayed whole")
+    queue = sources.add_parser("queue", help="replay the forwarder's dead-letter queue")
+    queue.add_argument("--queue-url", required=True)
+    for source in [bucket, queue]:
+        source.add_argument("--function-name", required=True)
+        source.add_argument("--workers", type=int, default=8, help="concurrent invocations")
+        source.add_argument("--rate", type=float, default=10, help="messages per second, 0 for no limit")
+        source.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # Throttled invocations are retried with backoff rather than failed
+    lambda_client = boto3.client("lambda", config=Config(
+        retries={"mode": "adaptive", "max_attempts": 10}, read_timeout=900
+    ))
+    if args.source == "bucket":
+        return replay_bucket(args, boto3.client("s3"), lambda_client)
+    return replay_queue(args, boto3.client("sqs"), lambda_client)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
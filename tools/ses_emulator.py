@@ -0,0 +1,482 @@
+"""Emulate the SES inbound path locally to measure the forwarder end to end
+
+An SMTP listener accepts mail for the domain like an SES receipt rule, writes
+each message to an in memory bucket under `mail/` and invokes the fwdEmail
+handler in-process with the SNS notification SES would publish, verdicts
+included.  The bucket, account table and SES are fakes with a configurable
+latency per call, and sent messages are captured instead of delivered.
+
+    python -m tools.ses_emulator load --domain example.com --messages 500 --connections 8
+    python -m tools.ses_emulator serve --domain example.com --port 2525
+    python -m tools.ses_emulator corpus --domain example.com --messages 100 --output corpus/
+
+`load` runs the emulator and an SMTP client sending a generated corpus (or
+the .eml files of --corpus) and reports the throughput and the latency from
+SMTP accept to the forwarded send.  `serve` only runs the emulator for other
+SMTP clients and prints the same report when stopped.  Concurrent invocations
+share one process here, unlike Lambda, so set --concurrency to the reserved
+concurrency being modelled rather than to large values.
+"""
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import math
+import os
+import random
+import smtplib
+import string
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.parser import BytesHeaderParser
+from email.utils import formatdate, getaddresses, make_msgid, parseaddr
+from tools.fakes import MESSAGE_ID_HEADER, FakeAccountTable, FakeBucket, FakeSes
+from tools.functions import load_function
+from tools.replay import RateLimiter, sns_event
+
+MAIL_PREFIX = "mail/"
+VERDICTS = ["spamVerdict", "virusVerdict", "spfVerdict", "dkimVerdict", "dmarcVerdict"]
+# SES limits
+MAX_MESSAGE_BYTES = 40 * 1024 * 1024
+MAX_RECIPIENTS = 50
+# Share of the corpus, and the range of sizes in bytes, of plain notes, HTML
+# newsletters and messages with attachments
+SIZE_PROFILE = [
+    (0.70, 2_000, 15_000),
+    (0.25, 15_000, 150_000),
+    (0.05, 150_000, 5_000_000),
+]
+WORDS = (
+    "account billing invoice root security alert notification support case "
+    "service limit quota region console budget usage report reserved instance"
+).split()
+logger = logging.getLogger("SES-EMULATOR")
+
+
+def parse_rates(value: str) -> dict:
+    """Parse "spamVerdict=0.05,virusVerdict=0.001" into a dict"""
+    rates = {}
+    for setting in filter(None, value.split(",")):
+        name, _, rate = setting.partition("=")
+        if name.strip() not in VERDICTS:
+            raise argparse.ArgumentTypeError(f"Unknown verdict {name}, use one of {', '.join(VERDICTS)}")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest rank percentile of sorted `values`"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Emulator:
+    """Receives messages like SES and forwards them with the fwdEmail handler"""
+
+    def __init__(self, app, domain: str, bucket_name: str = "emulator-mail-bucket",
+                 fail_rates: dict | None = None, concurrency: int = 4, seed: int | None = None):
+        self.app = app
+        self.domain = domain.lower()
+        self.bucket_name = bucket_name
+        self.fail_rates = fail_rates or {}
+        self.random = random.Random(seed)
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.invocations = []
+        self.accepted = {}
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def accepts(self, address: str) -> bool:
+        return address.lower().endswith("@" + self.domain)
+
+    def new_message_id(self) -> str:
+        with self.lock:
+            return "".join(self.random.choices(string.ascii_lowercase + string.digits, k=40))
+
+    def get_verdicts(self) -> dict:
+        with self.lock:
+            return {
+                verdict: {"status": "FAIL" if self.random.random() < self.fail_rates.get(verdict, 0) else "PASS"}
+                for verdict in VERDICTS
+            }
+
+    def receive(self, source: str, recipients: list[str], data: bytes) -> str:
+        """Store the message and start its invocation, returns its message ID"""
+        message_id = self.new_message_id()
+        now = datetime.now(timezone.utc)
+        timestamp = now.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        verdicts = self.get_verdicts()
+        # SES prepends its own headers to the stored message
+        stored = (
+            f"Return-Path: <{source}>\r\n"
+            f"X-SES-Spam-Verdict: {verdicts['spamVerdict']['status']}\r\n"
+            f"X-SES-Virus-Verdict: {verdicts['virusVerdict']['status']}\r\n"
+            f"{MESSAGE_ID_HEADER}: {message_id}\r\n"
+        ).encode() + data
+        key = MAIL_PREFIX + message_id
+        self.app.ses.s3.objects[key] = stored
+        headers = BytesHeaderParser().parsebytes(stored)
+        notification = {
+            "notificationType": "Received",
+            "mail": {
+                "timestamp": timestamp,
+                "source": source,
+                "messageId": message_id,
+                "destination": recipients,
+                "headersTruncated": False,
+                "headers": [{"name": name, "value": value} for name, value in headers.items()],
+                "commonHeaders": {
+                    "returnPath": source,
+                    "from": headers.get_all("From", []),
+                    "date": headers.get("Date", ""),
+                    "to": headers.get_all("To", []),
+                    "messageId": headers.get("Message-ID", ""),
+                    "subject": headers.get("Subject", ""),
+                },
+            },
+            "receipt": {
+                "timestamp": timestamp,
+                "processingTimeMillis": 0,
+                "recipients": recipients,
+                **verdicts,
+                "action": {
+                    "type": "S3",
+                    "topicArn": "arn:aws:sns:us-east-1:000000000000:EmailReceivedTopic",
+                    "bucketName": self.bucket_name,
+                    "objectKeyPrefix": MAIL_PREFIX,
+                    "objectKey": key,
+                },
+            },
+        }
+        with self.lock:
+            self.accepted[message_id] = time.monotonic()
+            self.invocations.append(self.pool.submit(self.invoke, notification))
+        return message_id
+
+    def invoke(self, notification: dict):
+        """SNS invokes the forwarder with one record per notification"""
+        try:
+            self.app.lambda_handler(sns_event([notification]), None)
+        except Exception as e:
+            logger.warning("Forwarding message ID %s failed: %s", notification["mail"]["messageId"], e)
+            with self.lock:
+                self.failed += 1
+
+    def wait(self):
+        """Wait for the invocations started so far"""
+        with self.lock:
+            invocations = list(self.invocations)
+        for invocation in invocations:
+            invocation.result()
+
+    def report(self) -> dict:
+        """Throughput and accept to send latency of the messages forwarded"""
+        sent = {s["MessageId"]: s["SentAt"] for s in self.app.ses.client_ses.sent}
+        latencies = sorted((sent[i] - accepted) * 1000 for i, accepted in self.accepted.items() if i in sent)
+        elapsed = max(sent.values()) - min(self.accepted.values()) if sent else 0
+        return {
+            "Accepted": len(self.accepted),
+            "Forwarded": len(latencies),
+            "NotForwarded": len(self.accepted) - len(latencies) - self.failed,
+            "Failed": self.failed,
+            "PerSecond": len(latencies) / elapsed if elapsed else 0.0,
+            "P50Ms": percentile(latencies, 0.50),
+            "P90Ms": percentile(latencies, 0.90),
+            "P99Ms": percentile(latencies, 0.99),
+            "MaxMs": latencies[-1] if latencies else 0.0,
+        }
+
+
+async def read_data(reader: asyncio.StreamReader) -> bytes | None:
+    """Read the DATA of a message up to the lone dot, undoing dot stuffing.
+    Returns None when the message is larger than SES accepts"""
+    lines = []
+    size = 0
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed during DATA")
+        if line in (b".\r\n", b".\n"):
+            break
+        if line.startswith(b".."):
+            line = line[1:]
+        size += len(line)
+        if size <= MAX_MESSAGE_BYTES:
+            lines.append(line)
+    return b"".join(lines) if size <= MAX_MESSAGE_BYTES else None
+
+
+async def handle_session(emulator: Emulator, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Minimal ESMTP server side, enough for smtplib and common MTAs"""
+
+    def reply(line: str):
+        writer.write(line.encode() + b"\r\n")
+
+    source, recipients = None, []
+    reply("220 inbound-smtp.emulator ESMTP")
+    try:
+        while line := await reader.readline():
+            command, _, argument = line.decode(errors="replace").strip().partition(" ")
+            command = command.upper()
+            if command == "EHLO":
+                writer.write(f"250-inbound-smtp.emulator\r\n250-8BITMIME\r\n250 SIZE {MAX_MESSAGE_BYTES}\r\n".encode())
+            elif command == "HELO":
+                reply("250 inbound-smtp.emulator")
+            elif command == "MAIL" and argument.upper().startswith("FROM:"):
+                source, recipients = parseaddr(argument[5:].split(" ")[0])[1], []
+                reply("250 Ok")
+            elif command == "RCPT" and argument.upper().startswith("TO:"):
+                recipient = parseaddr(argument[3:].split(" ")[0])[1]
+                if source is None:
+                    reply("503 Need MAIL command")
+                elif not emulator.accepts(recipient):
+                    reply("550 5.7.1 Recipient address rejected: not a receiving domain")
+                elif len(recipients) >= MAX_RECIPIENTS:
+                    reply("452 Too many recipients")
+                else:
+                    recipients.append(recipient)
+                    reply("250 Ok")
+            elif command == "DATA":
+                if not recipients:
+                    reply("503 Need RCPT command")
+                    continue
+                reply("354 End data with <CR><LF>.<CR><LF>")
+                await writer.drain()
+                data = await read_data(reader)
+                if data is None:
+                    reply("552 Message size exceeds fixed maximum message size")
+                else:
+                    reply(f"250 Ok {emulator.receive(source, recipients, data)}")
+                source, recipients = None, []
+            elif command == "RSET":
+                source, recipients = None, []
+                reply("250 Ok")
+            elif command == "NOOP":
+                reply("250 Ok")
+            elif command == "QUIT":
+                reply("221 Bye")
+                break
+            else:
+                reply("502 Command not implemented")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class SmtpListener:
+    """Runs the SMTP server on its own event loop thread"""
+
+    def __init__(self, emulator: Emulator, host: str = "127.0.0.1", port: int = 0):
+        self.emulator = emulator
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self) -> int:
+        """Start listening, returns the port"""
+        self.server = self.loop.run_until_complete(asyncio.start_server(
+            lambda reader, writer: handle_session(self.emulator, reader, writer), self.host, self.port
+        ))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        async def close():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def sample_size(rng: random.Random) -> int:
+    """Draw a message size from SIZE_PROFILE, log-uniform within each range"""
+    pick = rng.random()
+    for share, low, high in SIZE_PROFILE:
+        pick -= share
+        if pick < 0:
+            break
+    return int(math.exp(rng.uniform(math.log(low), math.log(high))))
+
+
+def generate_message(rng: random.Random, sender: str, recipient: str, size: int) -> bytes:
+    """Returns a message of about `size` bytes.  Messages over 150 KB carry
+    most of their size as a base64 attachment"""
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = " ".join(rng.choices(WORDS, k=rng.randint(3, 8))).capitalize()
+    message["Date"] = formatdate(localtime=False)
+    message["Message-ID"] = make_msgid(domain=sender.rsplit("@", 1)[-1])
+    text_size = min(size - len(message.as_bytes()), 150_000)
+    words = []
+    length = 0
+    while length < text_size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    message.set_content("\n".join(lines))
+    if size > 150_000:
+        # base64 adds a third
+        attachment = rng.randbytes((size - len(message.as_bytes())) * 3 // 4)
+        message.add_attachment(attachment, maintype="application", subtype="octet-stream", filename="report.bin")
+    return message.as_bytes()
+
+
+def generate_corpus(count: int, domain: str, accounts: int, unknown_rate: float,
+                    seed: int | None = None) -> list[tuple[str, str, bytes]]:
+    """Returns (sender, recipient, message) tuples.  `unknown_rate` of the
+    messages go to aliases that are not in the account table"""
+    rng = random.Random(seed)
+    corpus = []
+    for number in range(count):
+        if rng.random() < unknown_rate:
+            recipient = f"unknown-{rng.randrange(10**6):06d}@{domain}"
+        else:
+            recipient = f"acct-{rng.randrange(accounts):03d}@{domain}"
+        sender = f"notifications-{number % 7}@sender.example.net"
+        corpus.append((sender, recipient, generate_message(rng, sender, recipient, sample_size(rng))))
+    return corpus
+
+
+def read_corpus(path: str, domain: str) -> list[tuple[str, str, bytes]]:
+    """Returns the .eml files of a directory with their first recipient in `domain`"""
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".eml"):
+            continue
+        with open(os.path.join(path, name), "rb") as f:
+            data = f.read()
+        headers = BytesHeaderParser().parsebytes(data)
+        sender = parseaddr(headers.get("From", ""))[1]
+        recipients = [a for _, a in getaddresses(headers.get_all("To", []) + headers.get_all("Cc", []))
+                      if a.lower().endswith("@" + domain.lower())]
+        if recipients:
+            corpus.append((sender, recipients[0], data))
+    return corpus
+
+
+def send_corpus(host: str, port: int, corpus: list, connections: int, rate: float):
+    """Send the corpus over `connections` SMTP connections at most `rate`
+    messages per second"""
+    limiter = RateLimiter(rate)
+    shares = [corpus[i::connections] for i in range(connections)]
+
+    def send_share(share: list):
+        with smtplib.SMTP(host, port) as client:
+            for sender, recipient, data in share:
+                limiter.wait()
+                client.sendmail(sender, [recipient], data)
+
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        list(pool.map(send_share, [s for s in shares if s]))
+
+
+def create_emulator(args):
+    """Load the forwarder with fake services and wrap it in an emulator"""
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("TABLE_NAME", "AWSAccountTable")
+    os.environ["SES_DOMAIN_NAME"] = args.domain
+    os.environ.setdefault("ADDRESS_FROM", f"no-reply@{args.domain}")
+    os.environ.setdefault("ADDRESS_ADMIN", "admin@example.org")
+    app = load_function("fwdEmail", "app")
+    latency = args.latency_ms / 1000
+    owners = {f"acct-{n:03d}@{args.domain}".lower(): f"owner-{n % 10}@example.org" for n in range(args.accounts)}
+    app.ses.s3 = FakeBucket(latency)
+    app.ses.client_ses = FakeSes(latency)
+    app.ddb.account_table = FakeAccountTable(owners, latency)
+    return Emulator(app, args.domain, fail_rates=args.fail_rates, concurrency=args.concurrency, seed=args.seed)
+
+
+def print_report(report: dict):
+    print(f"accepted {report['Accepted']}, forwarded {report['Forwarded']}, "
+          f"not forwarded {report['NotForwarded']}, failed {report['Failed']}")
+    print(f"{report['PerSecond']:.1f} msgs/s, accept to send latency ms: p50 {report['P50Ms']:.1f} "
+          f"p90 {report['P90Ms']:.1f} p99 {report['P99Ms']:.1f} max {report['MaxMs']:.1f}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="send a corpus through the emulator and report")
+    serve = commands.add_parser("serve", help="run the emulator until interrupted")
+    corpus = commands.add_parser("corpus", help="write a generated corpus as .eml files")
+    for command in [load, serve, corpus]:
+        command.add_argument("--domain", required=True, help="cdk.json context.SES_DOMAIN_NAME")
+        command.add_argument("--accounts", type=int, default=100, help="aliases acct-000 and up that have an owner")
+        command.add_argument("--seed", type=int)
+    for command in [load, corpus]:
+        command.add_argument("--messages", type=int, default=200)
+        command.add_argument("--unknown-rate", type=float, default=0.1, help="share of mail to aliases without an owner")
+    for command in [load, serve]:
+        command.add_argument("--concurrency", type=int, default=4, help="concurrent forwarder invocations")
+        command.add_argument("--latency-ms", type=float, default=20, help="latency of each fake S3, DynamoDB and SES call")
+        command.add_argument("--fail-rates", type=parse_rates, default={},
+                             help='share of failed verdicts, such as "spamVerdict=0.05,virusVerdict=0.001"')
+        command.add_argument("--verbose", action="store_true", help="show the forwarder's logs and metrics")
+    load.add_argument("--corpus", help="directory of .eml files to send instead of a generated corpus")
+    load.add_argument("--connections", type=int, default=4, help="concurrent SMTP connections")
+    load.add_argument("--rate", type=float, default=0, help="messages per second, 0 for no limit")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=2525)
+    corpus.add_argument("--output", required=True, help="directory the .eml files are written to")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "corpus":
+        os.makedirs(args.output, exist_ok=True)
+        messages = generate_corpus(args.messages, args.domain, args.accounts, args.unknown_rate, args.seed)
+        for number, (_, _, data) in enumerate(messages):
+            with open(os.path.join(args.output, f"{number:06d}.eml"), "wb") as f:
+                f.write(data)
+        print(f"Wrote {len(messages)} messages, {sum(len(m[2]) for m in messages) / 2**20:.1f} MB, to {args.output}")
+        return 0
+
+    emulator = create_emulator(args)
+    if not args.verbose:
+        # Keep the forwarder's records and metrics out of the report
+        logging.getLogger().setLevel(logging.WARNING)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    if args.command == "serve":
+        listener = SmtpListener(emulator, args.host, args.port)
+        print(f"Accepting mail for {args.domain} on {args.host}:{listener.start()}, stop with Ctrl-C")
+        with output:
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+            emulator.wait()
+    else:
+        if args.corpus:
+            messages = read_corpus(args.corpus, args.domain)
+        else:
+            messages = generate_corpus(args.messages, args.domain, args.accounts, args.unknown_rate, args.seed)
+        print(f"Sending {len(messages)} messages, {sum(len(m[2]) for m in messages) / 2**20:.1f} MB")
+        listener = SmtpListener(emulator)
+        port = listener.start()
+        with output:
+            send_corpus("127.0.0.1", port, messages, args.connections, args.rate)
+            emulator.wait()
+    listener.stop()
+    print_report(emulator.report())
+    return 1 if emulator.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
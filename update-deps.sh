@@ -10,6 +10,18 @@ cd src/vendEmail && uv pip compile requirements.in -o requirements.txt --python-
 echo "Updating fwdEmail requirements.txt..."
 cd src/fwdEmail && uv pip compile requirements.in -o requirements.txt --python-version 3.13 && cd ../..
 
+echo "Updating digestEmail requirements.txt..."
+cd src/digestEmail && uv pip compile requirements.in -o requirements.txt --python-version 3.13 && cd ../..
+
+echo "Updating ownerSnapshot requirements.txt..."
+cd src/ownerSnapshot && uv pip compile requirements.in -o requirements.txt --python-version 3.13 && cd ../..
+
+echo "Updating mappingVersion requirements.txt..."
+cd src/mappingVersion && uv pip compile requirements.in -o requirements.txt --python-version 3.13 && cd ../..
+
+echo "Updating sesFeedback requirements.txt..."
+cd src/sesFeedback && uv pip compile requirements.in -o requirements.txt --python-version 3.13 && cd ../..
+
 echo "Updating tests requirements.txt..."
 cd tests && uv pip compile requirements.in -o requirements.txt --python-version 3.13 && cd ..
 